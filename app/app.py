@@ -1,11 +1,21 @@
 import yaml
 from blueprints.health import health_bp
+from blueprints.metrics import metrics_bp
 from blueprints.version import register_routes
 from config import DEV_ONLY_PATHS, PROD_ONLY_ADDL_DESCRIPTION
+from database.bloom import load_bloom_filters
+from database.slow_query_log import init_slow_query_log
+from database.snapshot import load_scaffold_snapshots
 from dotenv import load_dotenv
 from flasgger import LazyJSONEncoder, Swagger
 from flask import Flask
 from flask_cors import CORS
+from utils.compression import init_compression
+from utils.json_provider import FastJSONProvider
+from utils.metrics import init_metrics
+from utils.profiler import init_profiler
+from utils.result_processing import NEXT_CURSOR_HEADER
+from utils.tracing import init_tracing
 
 
 def _load_api_spec() -> dict:
@@ -30,7 +40,19 @@ def create_app():
     # load config
     load_dotenv(".env")
     app.config.from_pyfile("config.py")
-    CORS(app, resources={r"/*": {"origins": "*"}})
+    if app.config.get("FAST_JSON_ENABLED"):
+        app.json = FastJSONProvider(app)
+    CORS(
+        app,
+        resources={r"/*": {"origins": "*"}},
+        expose_headers=[NEXT_CURSOR_HEADER],  # (so the UI can read it)
+    )
+    if app.config.get("COMPRESSION_ENABLED"):
+        init_compression(app)
+    if app.config.get("SLOW_QUERY_LOG_ENABLED"):
+        init_slow_query_log()
+    if app.config.get("TRACING_ENABLED"):
+        init_tracing(app)
 
     # load swagger template
     swagger_template = _load_api_spec()
@@ -75,7 +97,27 @@ def create_app():
     # setup swagger and register routes
     swagger = Swagger(app, config=swagger_config, template=swagger_template)
     register_routes(app, IN_PROD, VERSION_URL_PREFIX)
+    if not (IN_PROD) and app.config.get("PROFILER_ENABLED"):
+        init_profiler(app)
     app.register_blueprint(health_bp)
+    if app.config.get("METRICS_ENABLED"):
+        init_metrics(app)
+        app.register_blueprint(metrics_bp)
+
+    # load before workers are forked (--preload) so that they share the snapshot's memory
+    if app.config.get("SCAFFOLD_SNAPSHOT_ENABLED"):
+        load_scaffold_snapshots(
+            app.config["ALLOWED_DB_NAMES"],
+            snapshot_dir=app.config.get("SCAFFOLD_SNAPSHOT_DIR"),
+            release=app.config.get("SCAFFOLD_SNAPSHOT_RELEASE"),
+        )
+    elif app.config.get("SCAFFOLD_BLOOM_ENABLED"):
+        # (not needed with snapshots, scaffold lookups don't query the DB then)
+        load_bloom_filters(
+            app.config["ALLOWED_DB_NAMES"],
+            app.config["SCAFFOLD_BLOOM_FP_RATE"],
+            app.config.get("SCAFFOLD_BLOOM_DIR"),
+        )
     return app
 
 
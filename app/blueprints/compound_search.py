@@ -8,16 +8,22 @@ For information on what each of the API calls do see api_spec.yml.
 
 from collections import defaultdict
 
+from config import STREAM_CHUNK_SIZE
 from database.badapple import BadAppleSession
 from flask import Blueprint, abort, jsonify, request
-from utils.process_scaffolds import get_scaffolds_single_mol
+from utils.metrics import MOLECULES_PER_REQUEST, SCAFFOLDS_PER_MOLECULE
+from utils.result_cache import get_db_version, get_result_cache
+from utils.scaffold_engine import get_scaffold_engine
 from utils.request_processing import (
     get_database,
     get_max_rings,
     param_given,
     process_integer_list_input,
     process_list_input,
+    wants_ndjson,
 )
+from utils.streaming import ndjson_response
+from utils.tracing import span
 
 compound_search = Blueprint("compound_search", __name__, url_prefix="/compound_search")
 
@@ -28,40 +34,102 @@ def _get_associated_scaffolds_from_list(
     """
     Helper function, returns a dictionary mapping SMILES to associated scaffolds + info.
     """
-    result = {}
-    with BadAppleSession(db_name) as db_session:
-        for smiles in smiles_list:
-            scaf_res = get_scaffolds_single_mol(smiles, name="", max_rings=max_rings)
-            if scaf_res == {}:
-                # ignore invalid SMILES
-                continue
-
-            scaffolds = scaf_res["scaffolds"]
-            scaffold_info_list = []
-            for scafsmi in scaffolds:
-                scaf_info = db_session.search_scaffold_by_smiles(scafsmi)
-                if len(scaf_info) < 1:
-                    scaf_info = {
-                        "scafsmi": scafsmi,
-                        "in_db": False,
-                    }
-                else:
-                    scaf_info = dict(scaf_info[0])
-                    scaf_info["in_db"] = True
-                scaffold_info_list.append(scaf_info)
+    unique_smiles = list(dict.fromkeys(smiles_list))
+    result_cache = get_result_cache()
+    cached = {}
+    if result_cache is not None:
+        db_version = get_db_version(db_name)
+        cache_keys = [(smiles, max_rings) for smiles in unique_smiles]
+        cached = result_cache.get_many(db_name, db_version, cache_keys)
+        cached = {smiles: value for (smiles, _), value in cached.items()}
+    uncached_smiles = [smiles for smiles in unique_smiles if smiles not in cached]
+
+    smiles2scaffolds = {}
+    scaf_results = get_scaffold_engine().get_scaffolds(uncached_smiles, max_rings)
+    for smiles, scaf_res in zip(uncached_smiles, scaf_results):
+        if scaf_res == {}:
+            # ignore invalid SMILES
+            continue
+        smiles2scaffolds[smiles] = scaf_res["scaffolds"]
+
+    # fetch info on all scaffolds at once rather than one query per scaffold
+    scafsmi2info = {}
+    all_scaffolds = [
+        scafsmi for scaffolds in smiles2scaffolds.values() for scafsmi in scaffolds
+    ]
+    if len(all_scaffolds) > 0:
+        with BadAppleSession(db_name) as db_session:
+            scafsmi2info = db_session.search_scaffolds_by_smiles_batch(all_scaffolds)
+
+    computed = {}
+    for smiles in uncached_smiles:
+        if smiles not in smiles2scaffolds:
+            computed[smiles] = None  # invalid SMILES
+            continue
+        scaffold_info_list = []
+        for scafsmi in smiles2scaffolds[smiles]:
+            if scafsmi in scafsmi2info:
+                scaf_info = dict(scafsmi2info[scafsmi])
+                scaf_info["in_db"] = True
+            else:
+                scaf_info = {
+                    "scafsmi": scafsmi,
+                    "in_db": False,
+                }
+            scaffold_info_list.append(scaf_info)
+        computed[smiles] = scaffold_info_list
+    if result_cache is not None:
+        result_cache.put_many(
+            db_name,
+            db_version,
+            {(smiles, max_rings): value for smiles, value in computed.items()},
+        )
 
+    result = {}
+    for smiles in unique_smiles:
+        scaffold_info_list = cached[smiles] if smiles in cached else computed[smiles]
+        if scaffold_info_list is not None:
             result[smiles] = scaffold_info_list
+            SCAFFOLDS_PER_MOLECULE.observe(len(scaffold_info_list))
     return result
 
 
+def _iter_ordered_results(
+    smiles_list: list[str], name_list: list[str], smiles2scaffolds: dict[str, list]
+):
+    for smiles, name in zip(smiles_list, name_list):
+        d = {"molecule_smiles": smiles, "name": name}
+        if smiles in smiles2scaffolds:
+            d["scaffolds"] = smiles2scaffolds[smiles]
+        else:
+            d["scaffolds"] = None
+            d["error_msg"] = "Invalid SMILES, please check input"
+        yield d
+
+
+def _iter_ordered_results_streaming(
+    smiles_list: list[str], name_list: list[str], max_rings: int, db_name: str
+):
+    # score STREAM_CHUNK_SIZE molecules at a time so results are sent as they become available
+    for i in range(0, len(smiles_list), STREAM_CHUNK_SIZE):
+        smiles_chunk = smiles_list[i : i + STREAM_CHUNK_SIZE]
+        name_chunk = name_list[i : i + STREAM_CHUNK_SIZE]
+        smiles2scaffolds = _get_associated_scaffolds_from_list(
+            smiles_chunk, max_rings, db_name
+        )
+        yield from _iter_ordered_results(smiles_chunk, name_chunk, smiles2scaffolds)
+
+
 # process request params for get_associated_scaffolds and get_associated_scaffolds_ordered
 def _get_request_params(request):
-    smiles_list = process_list_input(request, "SMILES")
-    max_rings = get_max_rings(request)
-    database = get_database(request)
-    name_list = smiles_list
-    if param_given(request, "Names"):
-        name_list = process_list_input(request, "Names")
+    with span("parse"):
+        smiles_list = process_list_input(request, "SMILES")
+        MOLECULES_PER_REQUEST.observe(len(smiles_list))
+        max_rings = get_max_rings(request)
+        database = get_database(request)
+        name_list = smiles_list
+        if param_given(request, "Names"):
+            name_list = process_list_input(request, "Names")
     return smiles_list, max_rings, database, name_list
 
 
@@ -74,7 +142,8 @@ def _get_request_params(request):
 def get_associated_scaffolds():
     smiles_list, max_rings, database, _ = _get_request_params(request)
     result = _get_associated_scaffolds_from_list(smiles_list, max_rings, database)
-    return jsonify(result)
+    with span("serialize"):
+        return jsonify(result)
 
 
 @compound_search.route("/get_associated_scaffolds_ordered", methods=["GET", "POST"])
@@ -87,23 +156,19 @@ def get_associated_scaffolds_ordered():
             f"Length of 'SMILES' and 'Names' list expected to match, but got lengths: {len(smiles_list)} and {len(name_list)}",
         )
 
+    if wants_ndjson(request):
+        return ndjson_response(
+            _iter_ordered_results_streaming(smiles_list, name_list, max_rings, database)
+        )
+
     smiles2scaffolds = _get_associated_scaffolds_from_list(
         smiles_list, max_rings, database
     )
-
     # order output
     # one could optimize/re-write _get_associated_scaffolds_from_list for this API call, but not expecting to deal with large inputs
-    result = []
-    for smiles, name in zip(smiles_list, name_list):
-        d = {"molecule_smiles": smiles, "name": name}
-        if smiles in smiles2scaffolds:
-            d["scaffolds"] = smiles2scaffolds[smiles]
-        else:
-            d["scaffolds"] = None
-            d["error_msg"] = "Invalid SMILES, please check input"
-        result.append(d)
-
-    return jsonify(result)
+    result = list(_iter_ordered_results(smiles_list, name_list, smiles2scaffolds))
+    with span("serialize"):
+        return jsonify(result)
 
 
 @compound_search.route("/get_associated_substance_ids", methods=["GET"])
@@ -1,43 +1,179 @@
 """
-Blueprint for the /health endpoint.
-Returns the status of the API and its database connections.
+Blueprint for the /health endpoints.
+/health/live reports whether the worker process is up (no database access).
+/health/ready (and /health) report the status of the database connections, checked with
+"SELECT 1" on a pooled connection and reused for HEALTH_CHECK_CACHE_TTL seconds, so frequent
+probes are cheap. If no pooled connection becomes available in time, a new connection is used
+instead: a saturated pool does not make the database unhealthy. Databases served from snapshot
+files built for a release (SCAFFOLD_SNAPSHOT_DIR and SCAFFOLD_SNAPSHOT_RELEASE, e.g. on
+scoring-only replicas without a database) are not pinged, they are reported as "snapshot".
+Only /health/ready reports the load of the worker (connection pool usage and scaffold engine
+queue depth) and returns 503 while it is saturated.
+Also includes the /stats endpoint, which reports internal counters (e.g., cache hits)
+of the worker process handling the request.
 """
 
+import threading
+import time
+
 import psycopg2
 from config import (
     ALLOWED_DB_NAMES,
-    DB_NAME2HOST,
-    DB_NAME2PASSWORD,
-    DB_NAME2PORT,
-    DB_NAME2USER,
+    DB_POOL_ENABLED,
+    HEALTH_CHECK_CACHE_TTL,
+    HEALTH_CHECK_TIMEOUT,
+    HEALTH_READY_MAX_LOAD,
+    SCAFFOLD_SNAPSHOT_DIR,
+    SCAFFOLD_SNAPSHOT_RELEASE,
 )
+from database.bloom import get_bloom_filter_stats
+from database.pool import PoolTimeoutError, connect, get_pool, get_pool_stats
+from database.rollup import get_rollup_stats
+from database.snapshot import get_scaffold_snapshot, get_snapshot_stats
+from database.statements import get_statement_stats
 from flask import Blueprint, jsonify
+from utils.result_cache import get_result_cache
+from utils.scaffold_engine import get_scaffold_engine
 
 health_bp = Blueprint("health", __name__)
 
+# db_name -> (time of check, status)
+_db_checks = {}
+_db_checks_lock = threading.Lock()
+
+
+def _ping(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1;")
+        cursor.fetchone()
+
+
+def _ping_new_connection(db_name: str):
+    connection = connect(db_name, connect_timeout=max(1, int(HEALTH_CHECK_TIMEOUT)))
+    try:
+        _ping(connection)
+    finally:
+        connection.close()
+
+
+def _ping_pooled_connection(db_name: str):
+    pool = get_pool(db_name)
+    try:
+        connection = pool.getconn(timeout=HEALTH_CHECK_TIMEOUT)
+    except PoolTimeoutError:
+        # all connections in use: the pool is saturated (see /health/ready), not the database
+        return _ping_new_connection(db_name)
+    discard = False
+    try:
+        _ping(connection)
+    except psycopg2.Error:
+        discard = True
+        raise
+    finally:
+        pool.putconn(connection, discard=discard)
+
+
+def check_database(db_name: str) -> str:
+    """'ok' if a "SELECT 1" on db_name succeeds, else the error."""
+    try:
+        if DB_POOL_ENABLED:
+            _ping_pooled_connection(db_name)
+        else:
+            _ping_new_connection(db_name)
+        return "ok"
+    except Exception as e:
+        return f"error: {str(e)}"
+
+
+def served_by_snapshot_file(db_name: str) -> bool:
+    """True if db_name is served from a snapshot file which doesn't need the database."""
+    return (
+        SCAFFOLD_SNAPSHOT_DIR is not None
+        and SCAFFOLD_SNAPSHOT_RELEASE is not None
+        and get_scaffold_snapshot(db_name) is not None
+    )
+
+
+def get_database_status(db_name: str) -> str:
+    """Status of check_database, reused for HEALTH_CHECK_CACHE_TTL seconds."""
+    if served_by_snapshot_file(db_name):
+        return "snapshot"
+    now = time.monotonic()
+    with _db_checks_lock:
+        checked = _db_checks.get(db_name)
+    if checked is not None and now - checked[0] < HEALTH_CHECK_CACHE_TTL:
+        return checked[1]
+    status = check_database(db_name)
+    with _db_checks_lock:
+        _db_checks[db_name] = (time.monotonic(), status)
+    return status
 
-@health_bp.route("/health", methods=["GET"])
-def health():
-    db_status = {}
-    all_healthy = True
-
-    for db_name in ALLOWED_DB_NAMES:
-        try:
-            conn = psycopg2.connect(
-                host=DB_NAME2HOST[db_name],
-                database=db_name,
-                user=DB_NAME2USER[db_name],
-                password=DB_NAME2PASSWORD[db_name],
-                port=DB_NAME2PORT[db_name],
-                connect_timeout=3,
-            )
-            conn.close()
-            db_status[db_name] = "ok"
-        except Exception as e:
-            db_status[db_name] = f"error: {str(e)}"
-            all_healthy = False
 
+def reset_database_status():
+    with _db_checks_lock:
+        _db_checks.clear()
+
+
+def get_load() -> dict:
+    """Connection pool usage and scaffold engine queue depth of this worker (0-1)."""
+    pools = {
+        db_name: stats["in_use"] / stats["max_size"]
+        for db_name, stats in get_pool_stats().items()
+    }
+    engine_stats = get_scaffold_engine().stats()
+    return {
+        "db_pools": pools,
+        "scaffold_engine": engine_stats["pending_chunks"]
+        / engine_stats["max_pending_chunks"],
+    }
+
+
+def _database_response(db_status: dict, **addl):
+    all_healthy = all(status in ("ok", "snapshot") for status in db_status.values())
     status = "healthy" if all_healthy else "unhealthy"
-    response = jsonify({"status": status, "databases": db_status})
+    response = jsonify({"status": status, "databases": db_status, **addl})
     response.status_code = 200 if all_healthy else 503
     return response
+
+
+@health_bp.route("/health", methods=["GET"])
+def health():
+    db_status = {db_name: get_database_status(db_name) for db_name in ALLOWED_DB_NAMES}
+    return _database_response(db_status)
+
+
+@health_bp.route("/health/live", methods=["GET"])
+def live():
+    return jsonify({"status": "alive"})
+
+
+@health_bp.route("/health/ready", methods=["GET"])
+def ready():
+    # (load before the database checks, which may use a pooled connection themselves)
+    load = get_load()
+    db_status = {db_name: get_database_status(db_name) for db_name in ALLOWED_DB_NAMES}
+    if (
+        max([load["scaffold_engine"], *load["db_pools"].values()])
+        >= HEALTH_READY_MAX_LOAD
+    ):
+        response = jsonify(
+            {"status": "saturated", "databases": db_status, "load": load}
+        )
+        response.status_code = 503
+        return response
+    return _database_response(db_status, load=load)
+
+
+@health_bp.route("/stats", methods=["GET"])
+def stats():
+    result_cache = get_result_cache()
+    return jsonify(
+        {
+            "scaffold_hierarchy_cache": get_scaffold_engine().hierarchy_cache_stats(),
+            "result_cache": result_cache.stats() if result_cache is not None else None,
+            "scaffold_snapshots": get_snapshot_stats(),
+            "scaffold_bloom_filters": get_bloom_filter_stats(),
+            "rollups": get_rollup_stats(),
+            "db_statements": get_statement_stats(),
+        }
+    )
@@ -0,0 +1,149 @@
+"""
+Description:
+Blueprint for background scoring jobs: upload a (large) file of compounds, poll the job's
+progress, and download the result TSV once it is done (same columns as the output of
+example_scripts/get_compound_scores.py). Jobs are processed by utils/jobs.py.
+Only available on the locally hosted version (see version.py).
+For information on what each of the API calls do see api_spec.yml.
+"""
+
+import os
+import re
+
+from blueprints.compound_search import (
+    _get_associated_scaffolds_from_list,
+    _iter_ordered_results,
+)
+from config import (
+    ALLOWED_DB_NAMES,
+    DEFAULT_DB,
+    JOB_MAX_UPLOAD_SIZE,
+    MAX_RING_DEFAULT,
+    MAX_RING_LOWER_BOUND,
+    MAX_RING_UPPER_BOUND,
+)
+from flask import Blueprint, abort, current_app, jsonify, request, send_file
+from utils.jobs import JOB_DONE, get_job_runner, get_job_store, read_input
+
+jobs = Blueprint("jobs", __name__, url_prefix="/jobs")
+
+_JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _score_batch(smiles_list: list[str], name_list: list[str], max_rings, database):
+    smiles2scaffolds = _get_associated_scaffolds_from_list(
+        smiles_list, max_rings, database
+    )
+    return list(_iter_ordered_results(smiles_list, name_list, smiles2scaffolds))
+
+
+@jobs.before_app_request
+def _start_job_runner():
+    # every worker runs its own job runner, started on its first request
+    # (so that queued/interrupted jobs are picked up again after a restart)
+    if not current_app.testing:
+        get_job_runner(_score_batch)
+
+
+def _get_form_int(param_name: str, default_val: int, lower_limit: int, upper_limit):
+    val = request.form.get(param_name, default_val)
+    try:
+        val = int(val)
+    except ValueError:
+        return abort(400, f"Invalid {param_name} provided. Expected int but got: {val}")
+    if val < lower_limit or (upper_limit is not None and val > upper_limit):
+        return abort(
+            400, f"Error: {param_name} must be within [{lower_limit}, {upper_limit}]"
+        )
+    return val
+
+
+def _get_job(job_id: str) -> dict:
+    if job_id is None or not _JOB_ID_PATTERN.match(job_id):
+        return abort(400, "Invalid job_id provided")
+    job = get_job_store().get_job(job_id)
+    if job is None:
+        return abort(404, f"No job found with job_id: {job_id}")
+    return job
+
+
+def _get_status(job: dict) -> dict:
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "n_total": job["n_total"],
+        "n_done": job["n_done"],
+        "error_msg": job["error_msg"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+@jobs.route("/submit", methods=["POST"])
+def submit():
+    # uploads can be much larger than regular requests (MAX_CONTENT_LENGTH)
+    request.max_content_length = JOB_MAX_UPLOAD_SIZE
+    input_file = request.files.get("file")
+    if input_file is None or input_file.filename == "":
+        return abort(400, "No file provided")
+    idelim = request.form.get("idelim")
+    if idelim is None:
+        idelim = "," if input_file.filename.lower().endswith(".csv") else "\t"
+    iheader = request.form.get("iheader", "false").lower() in ("true", "1")
+    smiles_column = _get_form_int("smiles_column", 0, 0, None)
+    name_column = _get_form_int("name_column", 1, 0, None)
+    max_rings = _get_form_int(
+        "max_rings", MAX_RING_DEFAULT, MAX_RING_LOWER_BOUND, MAX_RING_UPPER_BOUND
+    )
+    database = request.form.get("database", DEFAULT_DB)
+    if database not in ALLOWED_DB_NAMES:
+        db_names = ",".join(ALLOWED_DB_NAMES)
+        return abort(400, f"Invalid database provided, select from: {db_names}")
+
+    def validate_input(job: dict):
+        # sanity check the first lines before queueing (rest of the file is only read by the job)
+        try:
+            n_columns = len(read_input(job, nrows=5).columns)
+        except Exception as e:
+            return abort(400, f"Could not parse input file: {e}")
+        if max(smiles_column, name_column) >= n_columns:
+            return abort(
+                400,
+                f"Input file has {n_columns} column(s), smiles_column and name_column must be < {n_columns}",
+            )
+
+    job = get_job_store().create_job(
+        input_file.save,
+        validate_input,
+        filename=os.path.basename(input_file.filename),
+        idelim=idelim,
+        iheader=iheader,
+        smiles_column=smiles_column,
+        name_column=name_column,
+        max_rings=max_rings,
+        database=database,
+    )
+    response = jsonify(_get_status(job))
+    response.status_code = 202
+    return response
+
+
+@jobs.route("/get_status", methods=["GET"])
+def get_status():
+    job = _get_job(request.args.get("job_id"))
+    return jsonify(_get_status(job))
+
+
+@jobs.route("/get_result", methods=["GET"])
+def get_result():
+    job = _get_job(request.args.get("job_id"))
+    if job["status"] != JOB_DONE:
+        return abort(409, f"Job {job['job_id']} is not done (status: {job['status']})")
+    download_name = os.path.splitext(job["filename"] or "output")[0] + "_badapple.tsv"
+    return send_file(
+        job["output_path"],
+        mimetype="text/tab-separated-values",
+        as_attachment=True,
+        download_name=download_name,
+    )
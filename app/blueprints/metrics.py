@@ -0,0 +1,16 @@
+"""
+Blueprint for the /metrics endpoint.
+Returns Prometheus metrics of the API (see utils/metrics.py), aggregated across all gunicorn
+workers when PROMETHEUS_MULTIPROC_DIR is set.
+"""
+
+from flask import Blueprint, Response
+from utils.metrics import generate_metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    data, content_type = generate_metrics()
+    return Response(data, content_type=content_type)
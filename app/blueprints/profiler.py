@@ -0,0 +1,53 @@
+"""
+Description:
+Blueprint for the profiles of the last requests (see utils/profiler.py).
+Only available on the locally hosted version with PROFILER_ENABLED (see version.py).
+"""
+
+from config import PROFILER_HISTORY
+from flask import Blueprint, Response, jsonify, request
+from utils.profiler import get_profiler, merge_stacks, top_functions
+from utils.request_processing import int_check
+
+profiler = Blueprint("profiler", __name__, url_prefix="/profiler")
+
+
+def _get_profiles():
+    n_requests = int_check(
+        request, "requests", 1, PROFILER_HISTORY, default_val=PROFILER_HISTORY
+    )
+    return get_profiler().get_profiles(n_requests)
+
+
+@profiler.route("/top", methods=["GET"])
+def top():
+    """Top functions by cumulative time over the last requests (default: all kept)."""
+    n = int_check(request, "n", 1, default_val=20)
+    profiles = _get_profiles()
+    interval = get_profiler().interval
+    return jsonify(
+        {
+            "n_requests": len(profiles),
+            "n_samples": sum(profile.n_samples for profile in profiles),
+            "interval_ms": interval * 1000,
+            "requests": [
+                {
+                    "request": profile.name,
+                    "duration_ms": round(profile.duration * 1000, 1),
+                    "n_samples": profile.n_samples,
+                }
+                for profile in profiles
+            ],
+            "functions": top_functions(profiles, n, interval),
+        }
+    )
+
+
+@profiler.route("/collapsed", methods=["GET"])
+def collapsed():
+    """Collapsed stacks of the last requests (merged), e.g. for flamegraph.pl."""
+    stacks = merge_stacks(_get_profiles())
+    return Response(
+        "".join(f"{stack} {count}\n" for stack, count in stacks.items()),
+        mimetype="text/plain",
+    )
@@ -9,8 +9,16 @@ For information on what each of the API calls do see api_spec.yml.
 from config import ALLOWED_DB_NAMES
 from database.badapple import BadAppleSession
 from flask import Blueprint, jsonify, request
-from utils.request_processing import get_database, get_required_param, int_check
-from utils.result_processing import process_singleton_list
+from utils.request_processing import (
+    get_database,
+    get_page_params,
+    get_required_param,
+    int_check,
+    process_integer_list_input,
+    wants_ndjson,
+)
+from utils.result_processing import paginated_response, process_singleton_list
+from utils.streaming import iter_session_rows, ndjson_response
 
 scaffold_search = Blueprint("scaffold_search", __name__, url_prefix="/scaffold_search")
 TAGS = ["Scaffold Search"]
@@ -40,20 +48,79 @@ def get_scaffold_info():
 def get_associated_compounds():
     scafid = int_check(request, "scafid")
     db_name = get_database(request)
+    page = get_page_params(request, "after_cid")
+    if page is not None:
+        after_cid, limit = page
+        with BadAppleSession(db_name) as db_session:
+            result = db_session.get_associated_compounds_page(scafid, after_cid, limit)
+        return paginated_response(result, limit, "cid")
+    if wants_ndjson(request):
+        # hub scaffolds can have a lot of compounds, stream them from a server-side cursor
+        return ndjson_response(
+            iter_session_rows(
+                db_name, lambda db_session: db_session.iter_associated_compounds(scafid)
+            )
+        )
     with BadAppleSession(db_name) as db_session:
         result = db_session.get_associated_compounds(scafid)
     return jsonify(result)
 
 
+def _get_scafid_list(request) -> list[int]:
+    # (deduped, results are grouped by scafid)
+    return list(dict.fromkeys(process_integer_list_input(request, "scafids")))
+
+
+def _group_by_scafid(scafids: list[int], scafid2result: dict, key: str, default):
+    """Results of batch endpoints: one {"scafid": ..., key: ...} dict per scafid."""
+    return [
+        {"scafid": scafid, key: scafid2result.get(scafid, default)}
+        for scafid in scafids
+    ]
+
+
+@scaffold_search.route("/get_scaffold_info_batch", methods=["GET", "POST"])
+def get_scaffold_info_batch():
+    scafids = _get_scafid_list(request)
+    db_name = get_database(request)
+    with BadAppleSession(db_name) as db_session:
+        scafid2info = db_session.search_scaffolds_by_ids(scafids)
+    return jsonify(_group_by_scafid(scafids, scafid2info, "scaffold", None))
+
+
 # these routes are conditional on IN_PROD flag
 # (see version.py)
 def include_dev_only_routes():
+    include_associated_assay_ids_route()
+
+
+def include_associated_assay_ids_route(require_rollup: bool = False):
+    # in prod this is only served from the scaf2aid rollup (see database/rollup.py),
+    # the live query is too expensive (and needs the activity table)
+    use_rollup = True if require_rollup else None
+
     @scaffold_search.route("/get_associated_assay_ids", methods=["GET"])
     def get_associated_assay_ids():
         scafid = int_check(request, "scafid")
         db_name = get_database(request)
+        page = get_page_params(request, "after_aid")
+        if page is not None:
+            after_aid, limit = page
+            with BadAppleSession(db_name) as db_session:
+                result = db_session.get_associated_assay_ids_page(
+                    scafid, after_aid, limit, use_rollup=use_rollup
+                )
+            return paginated_response([d["aid"] for d in result], limit)
+        if wants_ndjson(request):
+            rows = iter_session_rows(
+                db_name,
+                lambda db_session: db_session.iter_associated_assay_ids(
+                    scafid, use_rollup=use_rollup
+                ),
+            )
+            return ndjson_response(d["aid"] for d in rows)
         with BadAppleSession(db_name) as db_session:
-            result = db_session.get_associated_assay_ids(scafid)
+            result = db_session.get_associated_assay_ids(scafid, use_rollup=use_rollup)
         result = [d["aid"] for d in result]
         return jsonify(result)
 
@@ -106,3 +173,39 @@ def get_associated_drugs():
     with BadAppleSession(db_name) as db_session:
         result = db_session.get_associated_drugs(scafid)
     return jsonify(result)
+
+
+# (same database restriction as the single scaffold endpoints above)
+def _get_batch_database(request) -> str:
+    return get_database(
+        request, default_val=ALLOWED_DB_NAMES[1], allowed_db_names=[ALLOWED_DB_NAMES[1]]
+    )
+
+
+@scaffold_search.route("/get_active_targets_batch", methods=["GET", "POST"])
+def get_active_targets_batch():
+    scafids = _get_scafid_list(request)
+    db_name = _get_batch_database(request)
+    with BadAppleSession(db_name) as db_session:
+        scafid2result = db_session.get_active_targets_batch(scafids)
+    scafid2result = {k: _get_processed_result(v) for k, v in scafid2result.items()}
+    return jsonify(_group_by_scafid(scafids, scafid2result, "targets", []))
+
+
+@scaffold_search.route("/get_active_assay_details_batch", methods=["GET", "POST"])
+def get_active_assay_details_batch():
+    scafids = _get_scafid_list(request)
+    db_name = _get_batch_database(request)
+    with BadAppleSession(db_name) as db_session:
+        scafid2result = db_session.get_active_assay_details_batch(scafids)
+    scafid2result = {k: _get_processed_result(v) for k, v in scafid2result.items()}
+    return jsonify(_group_by_scafid(scafids, scafid2result, "assay_details", []))
+
+
+@scaffold_search.route("/get_associated_drugs_batch", methods=["GET", "POST"])
+def get_associated_drugs_batch():
+    scafids = _get_scafid_list(request)
+    db_name = _get_batch_database(request)
+    with BadAppleSession(db_name) as db_session:
+        scafid2result = db_session.get_associated_drugs_batch(scafids)
+    return jsonify(_group_by_scafid(scafids, scafid2result, "drugs", []))
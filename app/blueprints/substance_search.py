@@ -7,17 +7,56 @@ API calls with substance (SID) inputs.
 
 from database.badapple import BadAppleSession
 from flask import Blueprint, jsonify, request
-from utils.request_processing import get_database, int_check
+from utils.request_processing import (
+    get_choice_param,
+    get_database,
+    int_check,
+    wants_ndjson,
+)
+from utils.result_processing import run_length_encode
+from utils.streaming import iter_session_rows, ndjson_response
 
 substance_search = Blueprint(
     "substance_search", __name__, url_prefix="/substance_search"
 )
 
+# rows: [{aid, outcome}, ...], columns: {aids: [...], outcomes: [...]},
+# rle: {aids: [...], outcome_runs: [[outcome, run length], ...]} (both ordered by AID)
+OUTCOME_FORMATS = ["rows", "columns", "rle"]
+
+
+# this route is conditional on IN_PROD flag
+# (see version.py)
+def include_assay_outcomes_route(require_rollup: bool = False):
+    # in prod this is only served from the sid2outcomes rollup (see database/rollup.py),
+    # the activity table is not included in the prod DBs
+    use_rollup = True if require_rollup else None
 
-@substance_search.route("/get_assay_outcomes", methods=["GET"])
-def get_assay_outcomes():
-    sid = int_check(request, "SID")
-    db_name = get_database(request)
-    with BadAppleSession(db_name) as db_session:
-        result = db_session.get_assay_outcomes(sid)
-    return jsonify(result)
+    @substance_search.route("/get_assay_outcomes", methods=["GET"])
+    def get_assay_outcomes():
+        sid = int_check(request, "SID")
+        db_name = get_database(request)
+        output_format = get_choice_param(request, "format", OUTCOME_FORMATS, "rows")
+        if output_format != "rows":
+            with BadAppleSession(db_name) as db_session:
+                result = db_session.get_assay_outcome_columns(
+                    sid, use_rollup=use_rollup
+                )
+            if output_format == "rle":
+                result = {
+                    "aids": result["aids"],
+                    "outcome_runs": run_length_encode(result["outcomes"]),
+                }
+            return jsonify(result)
+        if wants_ndjson(request):
+            return ndjson_response(
+                iter_session_rows(
+                    db_name,
+                    lambda db_session: db_session.iter_assay_outcomes(
+                        sid, use_rollup=use_rollup
+                    ),
+                )
+            )
+        with BadAppleSession(db_name) as db_session:
+            result = db_session.get_assay_outcomes(sid, use_rollup=use_rollup)
+        return jsonify(result)
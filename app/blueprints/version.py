@@ -1,10 +1,16 @@
 # blueprints/version.py
 # This is the master blueprint directory,
 # All new blueprints should be assigned here
-from blueprints import scaffold_search
+from blueprints import scaffold_search, substance_search
 from blueprints.assay_search import assay_search
 from blueprints.compound_search import compound_search
-from blueprints.substance_search import substance_search
+from blueprints.jobs import jobs
+from blueprints.profiler import profiler
+from config import (
+    PROFILER_ENABLED,
+    SCAF2AID_ROLLUP_IN_PROD,
+    SID2OUTCOMES_ROLLUP_IN_PROD,
+)
 from flask import Blueprint
 
 
@@ -14,8 +20,21 @@ def register_routes(app, in_production: bool, version_url_prefix: str):
         # do not register these blueprints/routes in prod bc
         # 1) we don't include the activity table in the DBs
         # 2) even if we did include the activity table, these API calls are quite computationally expensive
-        version.register_blueprint(substance_search)
+        substance_search.include_assay_outcomes_route()
+        version.register_blueprint(substance_search.substance_search)
+        # 3) bulk scoring jobs are meant for large (local) workloads
+        version.register_blueprint(jobs)
         scaffold_search.include_dev_only_routes()
+        # 4) profiles show the internals of the server (and sampling slows down requests)
+        if PROFILER_ENABLED:
+            version.register_blueprint(profiler)
+    else:
+        # cheap enough to serve when read from precomputed rollups (see database/rollup.py)
+        if SCAF2AID_ROLLUP_IN_PROD:
+            scaffold_search.include_associated_assay_ids_route(require_rollup=True)
+        if SID2OUTCOMES_ROLLUP_IN_PROD:
+            substance_search.include_assay_outcomes_route(require_rollup=True)
+            version.register_blueprint(substance_search.substance_search)
 
     version.register_blueprint(compound_search)
     version.register_blueprint(scaffold_search.scaffold_search)
@@ -42,6 +42,40 @@ for db in databases:
 
 DEFAULT_DB = environ.get("DB2_NAME")
 
+# Connection pooling (one pool per database per gunicorn worker)
+# if disabled, every BadAppleSession opens (and closes) its own connection
+DB_POOL_ENABLED = (environ.get("DB_POOL_ENABLED") or "false").lower() == "true"
+DB_POOL_MIN_SIZE = int(environ.get("DB_POOL_MIN_SIZE") or 0)
+DB_POOL_MAX_SIZE = int(environ.get("DB_POOL_MAX_SIZE") or 4)
+# seconds; idle connections/connections older than this are closed (<= 0 to disable)
+DB_POOL_IDLE_TIMEOUT = float(environ.get("DB_POOL_IDLE_TIMEOUT") or 300)
+DB_POOL_MAX_LIFETIME = float(environ.get("DB_POOL_MAX_LIFETIME") or 3600)
+# seconds to wait for a free connection before giving up (503)
+DB_POOL_CHECKOUT_TIMEOUT = float(environ.get("DB_POOL_CHECKOUT_TIMEOUT") or 10)
+# connections idle for longer than this are pinged ("SELECT 1") before reuse
+DB_POOL_PING_INTERVAL = float(environ.get("DB_POOL_PING_INTERVAL") or 30)
+# PREPARE each query once per pooled connection and EXECUTE it with bound parameters
+# (instead of parsing/planning every query), see database/statements.py
+DB_PREPARED_STATEMENTS_ENABLED = (
+    environ.get("DB_PREPARED_STATEMENTS_ENABLED") or "true"
+).lower() == "true"
+# log queries slower than SLOW_QUERY_THRESHOLD ms (with their parameters and row count) to a
+# rotating file, optionally with their EXPLAIN (ANALYZE, BUFFERS) plan, see database/slow_query_log.py
+SLOW_QUERY_LOG_ENABLED = (
+    environ.get("SLOW_QUERY_LOG_ENABLED") or "false"
+).lower() == "true"
+SLOW_QUERY_THRESHOLD = float(environ.get("SLOW_QUERY_THRESHOLD") or 500)
+SLOW_QUERY_LOG_PATH = (
+    environ.get("SLOW_QUERY_LOG_PATH") or "/tmp/badapple_slow_queries.log"
+)
+SLOW_QUERY_LOG_MAX_BYTES = int(environ.get("SLOW_QUERY_LOG_MAX_BYTES") or 10_000_000)
+SLOW_QUERY_LOG_BACKUP_COUNT = int(environ.get("SLOW_QUERY_LOG_BACKUP_COUNT") or 5)
+# note: EXPLAIN ANALYZE runs the query again before its rows are returned (roughly doubling
+# the latency of that request), so plans are captured at most once per statement
+# per SLOW_QUERY_EXPLAIN_INTERVAL seconds (per worker)
+SLOW_QUERY_EXPLAIN = (environ.get("SLOW_QUERY_EXPLAIN") or "false").lower() == "true"
+SLOW_QUERY_EXPLAIN_INTERVAL = float(environ.get("SLOW_QUERY_EXPLAIN_INTERVAL") or 60)
+
 
 # API limits
 # limits on max rings
@@ -53,6 +87,156 @@ MAX_RING_DEFAULT = 5
 # limits on length of input lists (e.g., SMILES)
 MAX_LIST_LENGTH = 1000
 
+# page size of paginated endpoints (limit + after_cid/after_aid params)
+PAGE_LIMIT_DEFAULT = 1000
+PAGE_LIMIT_MAX = 10_000
+
+# number of molecules scored at a time when streaming results (NDJSON),
+# each molecule's line is written as soon as its chunk is done
+STREAM_CHUNK_SIZE = int(environ.get("STREAM_CHUNK_SIZE") or 10)
+
+# number of rows fetched per round-trip by server-side cursors of streamed (NDJSON) responses
+DB_STREAM_ITERSIZE = int(environ.get("DB_STREAM_ITERSIZE") or 2000)
+
+# max number of scafsmi looked up per "scafsmi = ANY(...)" query
+SCAFFOLD_BATCH_CHUNK_SIZE = 5000
+
+# max number of top-level scaffolds whose hierarchy (parent scaffolds) is cached per process
+# (0 = disable the cache)
+SCAFFOLD_HIERARCHY_CACHE_SIZE = int(
+    environ.get("SCAFFOLD_HIERARCHY_CACHE_SIZE") or 20_000
+)
+# max number of memoized (first-pass SMILES -> canonical SMILES) conversions per process
+# (0 = disable memoization)
+CANON_SMILES_CACHE_SIZE = int(environ.get("CANON_SMILES_CACHE_SIZE") or 100_000)
+
+# load the scaffold table of each database into memory at startup and answer scaffold lookups
+# (by SMILES/ID) from it without querying the DB (see database/snapshot.py)
+# use with gunicorn's --preload so all workers share the same copy
+SCAFFOLD_SNAPSHOT_ENABLED = (
+    environ.get("SCAFFOLD_SNAPSHOT_ENABLED") or "false"
+).lower() == "true"
+# directory of snapshot files (<db_name>.snapshot, see database/build_snapshot.py), if set (and
+# SCAFFOLD_SNAPSHOT_ENABLED) the snapshots are memory-mapped from these files instead of the DBs
+SCAFFOLD_SNAPSHOT_DIR = environ.get("SCAFFOLD_SNAPSHOT_DIR") or None
+# release label the snapshot files must have been built with; if not set, the files are
+# checked against the version of the live databases instead (so a database is required)
+SCAFFOLD_SNAPSHOT_RELEASE = environ.get("SCAFFOLD_SNAPSHOT_RELEASE") or None
+
+# build a Bloom filter over all scafsmi of each database at startup, so lookups of scaffolds
+# which are definitely not in the DB skip the query (see database/bloom.py)
+SCAFFOLD_BLOOM_ENABLED = (
+    environ.get("SCAFFOLD_BLOOM_ENABLED") or "false"
+).lower() == "true"
+# false positive rate (fraction of misses which are still looked up in the DB)
+SCAFFOLD_BLOOM_FP_RATE = float(environ.get("SCAFFOLD_BLOOM_FP_RATE") or 0.01)
+# if set, filters are saved to/loaded from this directory (rebuilt when the DB changes)
+SCAFFOLD_BLOOM_DIR = environ.get("SCAFFOLD_BLOOM_DIR") or None
+
+# read associated assay IDs (scaf2aid) and assay outcomes (sid2outcomes) from precomputed
+# rollup tables when the database has current ones (see database/rollup.py and
+# database/build_rollup.py), instead of the live queries over the activity table
+# (SCAF2AID_ROLLUP_ENABLED is the former name, from when scaf2aid was the only rollup)
+DB_ROLLUPS_ENABLED = (
+    environ.get("DB_ROLLUPS_ENABLED")
+    or environ.get("SCAF2AID_ROLLUP_ENABLED")
+    or "true"
+).lower() == "true"
+# seconds between checks that a rollup is current (each check counts the rows of its source
+# tables, e.g. activity, so it is done less often than DB_VERSION_CHECK_INTERVAL)
+ROLLUP_CHECK_INTERVAL = float(environ.get("ROLLUP_CHECK_INTERVAL") or 600)
+# also serve scaffold_search/get_associated_assay_ids and substance_search/get_assay_outcomes
+# in production (only from their rollup, databases without a current rollup answer 503)
+SCAF2AID_ROLLUP_IN_PROD = (
+    environ.get("SCAF2AID_ROLLUP_IN_PROD") or "false"
+).lower() == "true"
+SID2OUTCOMES_ROLLUP_IN_PROD = (
+    environ.get("SID2OUTCOMES_ROLLUP_IN_PROD") or "false"
+).lower() == "true"
+
+# serialize JSON responses with orjson if it is installed (see utils/json_provider.py)
+FAST_JSON_ENABLED = (environ.get("FAST_JSON_ENABLED") or "true").lower() == "true"
+
+# request latency etc. in Prometheus format at /metrics (see utils/metrics.py), with gunicorn
+# also set PROMETHEUS_MULTIPROC_DIR so the metrics of all workers are aggregated
+METRICS_ENABLED = (environ.get("METRICS_ENABLED") or "true").lower() == "true"
+
+# trace requests: time spent per stage in the Server-Timing response header, and export the spans
+# (OpenTelemetry JSON) to stdout, a file (TRACING_EXPORT_PATH) or none, see utils/tracing.py
+TRACING_ENABLED = (environ.get("TRACING_ENABLED") or "false").lower() == "true"
+TRACING_EXPORTER = (environ.get("TRACING_EXPORTER") or "none").lower()
+TRACING_EXPORT_PATH = environ.get("TRACING_EXPORT_PATH") or "/tmp/badapple_traces.jsonl"
+
+# /health and /health/ready: seconds a database check is reused (per worker), and seconds to
+# wait for a connection
+HEALTH_CHECK_CACHE_TTL = float(environ.get("HEALTH_CHECK_CACHE_TTL") or 5)
+HEALTH_CHECK_TIMEOUT = float(environ.get("HEALTH_CHECK_TIMEOUT") or 3)
+# /health/ready returns 503 once this fraction of a connection pool or of the scaffold engine's
+# queue is in use (so load balancers send requests to other instances)
+HEALTH_READY_MAX_LOAD = float(environ.get("HEALTH_READY_MAX_LOAD") or 1.0)
+
+# compress responses for clients which accept it (see utils/compression.py)
+COMPRESSION_ENABLED = (environ.get("COMPRESSION_ENABLED") or "true").lower() == "true"
+# encodings in order of preference (zstd and br need the zstandard/brotli packages)
+COMPRESSION_ENCODINGS = [
+    encoding.strip()
+    for encoding in (environ.get("COMPRESSION_ENCODINGS") or "zstd,br,gzip").split(",")
+]
+# buffered responses smaller than this (bytes) are sent uncompressed
+COMPRESSION_MIN_SIZE = int(environ.get("COMPRESSION_MIN_SIZE") or 1024)
+COMPRESSION_GZIP_LEVEL = int(environ.get("COMPRESSION_GZIP_LEVEL") or 6)  # 1-9
+COMPRESSION_ZSTD_LEVEL = int(environ.get("COMPRESSION_ZSTD_LEVEL") or 3)  # 1-22
+COMPRESSION_BROTLI_LEVEL = int(environ.get("COMPRESSION_BROTLI_LEVEL") or 4)  # 0-11
+
+# Cache for per-molecule results of compound_search endpoints
+# backend: "memory" (per gunicorn worker), "sqlite" (file shared by all workers), or "none"
+RESULT_CACHE_BACKEND = (environ.get("RESULT_CACHE_BACKEND") or "memory").lower()
+# max number of cached molecules and seconds until an entry expires (<= 0: never)
+RESULT_CACHE_SIZE = int(environ.get("RESULT_CACHE_SIZE") or 10_000)
+RESULT_CACHE_TTL = float(environ.get("RESULT_CACHE_TTL") or 86_400)
+# used by "sqlite" backend (e.g., a path under /dev/shm to keep the cache in shared memory)
+RESULT_CACHE_PATH = environ.get("RESULT_CACHE_PATH") or "/tmp/badapple_result_cache.db"
+# seconds between checks of the DB version (cached results of older versions are dropped)
+DB_VERSION_CHECK_INTERVAL = float(environ.get("DB_VERSION_CHECK_INTERVAL") or 60)
+
+# Scaffold generation (HierS) process pool, one per gunicorn worker
+# 0 = generate scaffolds in the request thread
+# note: total processes used ~= N_WORKERS * SCAFFOLD_ENGINE_WORKERS, keep this <= number of cores
+SCAFFOLD_ENGINE_WORKERS = int(environ.get("SCAFFOLD_ENGINE_WORKERS") or 0)
+# number of molecules sent to a worker at a time
+SCAFFOLD_ENGINE_CHUNK_SIZE = int(environ.get("SCAFFOLD_ENGINE_CHUNK_SIZE") or 50)
+# max number of chunks queued/running at once (across all requests of a gunicorn worker)
+SCAFFOLD_ENGINE_MAX_PENDING = int(environ.get("SCAFFOLD_ENGINE_MAX_PENDING") or 64)
+# seconds a request will wait to enqueue a chunk before being rejected (503)
+SCAFFOLD_ENGINE_QUEUE_TIMEOUT = float(
+    environ.get("SCAFFOLD_ENGINE_QUEUE_TIMEOUT") or 30
+)
+
+# Background scoring jobs for large compound files (local installation only, see blueprints/jobs.py)
+# directory holding the job queue (SQLite) + input/output files, mount a volume here so that
+# jobs survive container restarts
+JOB_DIR = environ.get("JOB_DIR") or "/tmp/badapple_jobs"
+# max size of uploaded input files (bytes)
+JOB_MAX_UPLOAD_SIZE = int(environ.get("JOB_MAX_UPLOAD_SIZE") or 512 * 1024 * 1024)
+# max number of jobs running at once (across all gunicorn workers)
+JOB_MAX_CONCURRENT = int(environ.get("JOB_MAX_CONCURRENT") or 2)
+# number of molecules scored (and written to the output) at a time
+JOB_BATCH_SIZE = int(environ.get("JOB_BATCH_SIZE") or 100)
+# seconds between checks for new jobs
+JOB_POLL_INTERVAL = float(environ.get("JOB_POLL_INTERVAL") or 2)
+# seconds without progress after which a running job is considered abandoned
+# (e.g., its worker was restarted) and is resumed by another worker
+JOB_STALE_TIMEOUT = float(environ.get("JOB_STALE_TIMEOUT") or 300)
+# seconds finished/failed jobs (and their files) are kept (<= 0: forever)
+JOB_RETENTION = float(environ.get("JOB_RETENTION") or 7 * 24 * 3600)
+
+# sampling profiler of requests (dev only, never enabled in production), see utils/profiler.py
+PROFILER_ENABLED = (environ.get("PROFILER_ENABLED") or "false").lower() == "true"
+PROFILER_INTERVAL = float(environ.get("PROFILER_INTERVAL") or 5)  # ms between samples
+PROFILER_HISTORY = int(
+    environ.get("PROFILER_HISTORY") or 100
+)  # profiles of last requests kept
+
 # Only include this page description if in prod
 PROD_ONLY_ADDL_DESCRIPTION = """
 \n\n
@@ -65,4 +249,11 @@ Note: This API is intended for moderate use cases and does not include all the f
 DEV_ONLY_PATHS = [
     "/scaffold_search/get_associated_assay_ids",
     "/substance_search/get_assay_outcomes",
+    "/jobs/submit",
+    "/jobs/get_status",
+    "/jobs/get_result",
 ]
+if SCAF2AID_ROLLUP_IN_PROD:
+    DEV_ONLY_PATHS.remove("/scaffold_search/get_associated_assay_ids")
+if SID2OUTCOMES_ROLLUP_IN_PROD:
+    DEV_ONLY_PATHS.remove("/substance_search/get_assay_outcomes")
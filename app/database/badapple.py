@@ -5,54 +5,67 @@ Description:
 Class for operations with badapple DBs (badapple_classic and badapple2).
 """
 
-from typing import Dict, List
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
 
 import psycopg2
 import psycopg2.extras
-from config import DB_NAME2HOST, DB_NAME2PASSWORD, DB_NAME2PORT, DB_NAME2USER
+from config import DB_POOL_ENABLED, DB_STREAM_ITERSIZE, SCAFFOLD_BATCH_CHUNK_SIZE
+from database.bloom import get_bloom_filter
+from database.pool import PoolTimeoutError, connect, get_pool
+from database.rollup import SCAF2AID, SID2OUTCOMES, Rollup, is_rollup_current
+from database.snapshot import get_scaffold_snapshot
+from database.statements import (
+    BoundStatement,
+    Statement,
+    execute_statement,
+    iter_statement,
+)
 from flask import abort
-from psycopg2 import sql
+from loguru import logger
+from utils.metrics import instrument_session_methods
 
 
 # queries used to read from Badapple databases
-def _build_scaffold_by_smiles_query(scafsmi: str):
-    # here we assume the given scafsmi is None if it was not a valid SMILES
-    # and that the scafsmi was canonicalized (much faster to search scafsmi than use structural search!)
-    if scafsmi is None:
-        return abort(400, "Invalid SMILES provided")
-    return sql.SQL("SELECT * from scaffold where scafsmi={scafsmi} LIMIT 1;").format(
-        scafsmi=sql.Literal(scafsmi)
-    )
-
-
-def _build_scaffold_by_id_query(scafid: str):
-    return sql.SQL("SELECT * from scaffold where id={scafid} LIMIT 1;").format(
-        scafid=sql.Literal(scafid)
-    )
-
-
-def _build_scaffold_id_query(scafsmi: str):
-    return sql.SQL("SELECT id FROM mols_scaf WHERE scafmol @= {scafsmi};").format(
-        scafsmi=sql.Literal(scafsmi)
-    )
-
-
-def _build_associated_compounds_query(scafid: int):
-    return sql.SQL(
-        "SELECT * FROM compound WHERE cid IN (SELECT cid FROM scaf2cpd WHERE scafid={scafid});"
-    ).format(scafid=sql.Literal(scafid))
-
-
-def _build_associated_sids_query(cid_list: list[int]):
-    formatted_cid_list = sql.SQL(", ").join(map(sql.Literal, cid_list))
-    return sql.SQL("SELECT * FROM sub2cpd WHERE cid IN ({cid_list})").format(
-        cid_list=formatted_cid_list
-    )
-
-
-def _build_associated_assay_ids_query(scafid: int):
-    return sql.SQL(
-        """SELECT DISTINCT aid 
+# (executed as prepared statements on pooled connections, see statements.py)
+_SCAFFOLD_BY_SMILES = Statement(
+    "scaffold_by_smiles",
+    "SELECT * from scaffold where scafsmi=%(scafsmi)s LIMIT 1;",
+)
+_SCAFFOLDS_BY_SMILES = Statement(
+    "scaffolds_by_smiles",
+    "SELECT * from scaffold where scafsmi = ANY(%(scafsmi_list)s::text[]);",
+)
+_SCAFFOLD_BY_ID = Statement(
+    "scaffold_by_id", "SELECT * from scaffold where id=%(scafid)s LIMIT 1;"
+)
+_SCAFFOLDS_BY_ID = Statement(
+    "scaffolds_by_id",
+    "SELECT * from scaffold where id = ANY(%(scafids)s::bigint[]);",
+)
+_SCAFFOLD_ID = Statement(
+    "scaffold_id", "SELECT id FROM mols_scaf WHERE scafmol @= %(scafsmi)s;"
+)
+_ASSOCIATED_COMPOUNDS = Statement(
+    "associated_compounds",
+    "SELECT * FROM compound WHERE cid IN (SELECT cid FROM scaf2cpd WHERE scafid=%(scafid)s);",
+)
+# keyset pagination: (after_cid, limit] page of the compounds/assays, ordered by their ID
+_ASSOCIATED_COMPOUNDS_PAGE = Statement(
+    "associated_compounds_page",
+    """SELECT * FROM compound
+WHERE cid > %(after_cid)s
+AND cid IN (SELECT cid FROM scaf2cpd WHERE scafid=%(scafid)s)
+ORDER BY cid
+LIMIT %(limit)s;""",
+)
+_ASSOCIATED_SIDS = Statement(
+    "associated_sids",
+    "SELECT * FROM sub2cpd WHERE cid = ANY(%(cid_list)s::bigint[])",
+)
+_ASSOCIATED_ASSAY_IDS = Statement(
+    "associated_assay_ids",
+    """SELECT DISTINCT aid 
 FROM activity 
 WHERE sid IN (
 SELECT sid 
@@ -60,22 +73,65 @@ FROM sub2cpd
 WHERE cid IN (
     SELECT cid 
     FROM scaf2cpd 
-    WHERE scafid = {scafid}
+    WHERE scafid = %(scafid)s
+)
+) ORDER BY aid;""",
+)
+_ASSOCIATED_ASSAY_IDS_PAGE = Statement(
+    "associated_assay_ids_page",
+    """SELECT DISTINCT aid 
+FROM activity 
+WHERE aid > %(after_aid)s
+AND sid IN (
+SELECT sid 
+FROM sub2cpd 
+WHERE cid IN (
+    SELECT cid 
+    FROM scaf2cpd 
+    WHERE scafid = %(scafid)s
+)
+) ORDER BY aid
+LIMIT %(limit)s;""",
+)
+# same results as the two queries above, from the precomputed scaf2aid rollup (see rollup.py)
+_SCAF2AID_ASSAY_IDS = Statement(
+    "scaf2aid_assay_ids",
+    "SELECT aid FROM scaf2aid WHERE scafid=%(scafid)s ORDER BY aid;",
+)
+_SCAF2AID_ASSAY_IDS_PAGE = Statement(
+    "scaf2aid_assay_ids_page",
+    """SELECT aid FROM scaf2aid
+WHERE scafid=%(scafid)s
+AND aid > %(after_aid)s
+ORDER BY aid
+LIMIT %(limit)s;""",
+)
+_TABLE_EXISTS = Statement(
+    "table_exists",
+    "SELECT to_regclass(%(table_name)s) IS NOT NULL AS table_exists;",
+)
+_ROLLUP_VERSION = Statement(
+    "rollup_version",
+    "SELECT content_version FROM rollup_meta WHERE rollup=%(rollup)s;",
+)
+_ASSAY_OUTCOMES = Statement(
+    "assay_outcomes", "SELECT aid,outcome FROM activity WHERE sid=%(sid)s"
+)
+# from the precomputed sid2outcomes rollup (see rollup.py), ordered by aid
+_SID2OUTCOMES = Statement(
+    "sid2outcomes",
+    """SELECT u.aid, u.outcome
+FROM sid2outcomes, unnest(aids, outcomes) AS u(aid, outcome)
+WHERE sid=%(sid)s;""",
+)
+_SID2OUTCOMES_COLUMNS = Statement(
+    "sid2outcomes_columns",
+    "SELECT aids, outcomes FROM sid2outcomes WHERE sid=%(sid)s;",
 )
-) ORDER BY aid;"""
-    ).format(scafid=sql.Literal(scafid))
-
-
-def _build_assay_outcomes_query(sid: int):
-    return sql.SQL("SELECT aid,outcome FROM activity WHERE sid={sid}").format(
-        sid=sql.Literal(sid)
-    )
-
-
 # badapple2+ only
-def _build_active_targets_query(scafid: int) -> sql.SQL:
-    return sql.SQL(
-        """
+_ACTIVE_TARGETS = Statement(
+    "active_targets",
+    """
 SELECT 
 target.*, 
 scaf2activeaid.aid 
@@ -88,15 +144,13 @@ RIGHT JOIN
 scaf2activeaid 
 ON aid2target.aid = scaf2activeaid.aid
 WHERE 
-scaf2activeaid.scafid = {scafid}
+scaf2activeaid.scafid = %(scafid)s
 ORDER BY aid;
-"""
-    ).format(scafid=sql.Literal(scafid))
-
-
-def _build_active_assay_details_query(scafid: int) -> sql.SQL:
-    return sql.SQL(
-        """
+""",
+)
+_ACTIVE_ASSAY_DETAILS = Statement(
+    "active_assay_details",
+    """
 SELECT 
 scaf2activeaid.aid,
 target.*,
@@ -113,32 +167,215 @@ RIGHT JOIN
 aid2descriptors a2d
 ON a2d.aid = scaf2activeaid.aid
 WHERE 
-scaf2activeaid.scafid = {scafid}
+scaf2activeaid.scafid = %(scafid)s
 ORDER BY aid;
-"""
-    ).format(scafid=sql.Literal(scafid))
+""",
+)
+# batch versions of the queries above: results for many scaffolds at once, each row is
+# prefixed with the scaffold it belongs to (batch_scafid, see BadAppleSession._get_batch)
+_ACTIVE_TARGETS_BATCH = Statement(
+    "active_targets_batch",
+    """
+SELECT 
+scaf2activeaid.scafid AS batch_scafid,
+target.*, 
+scaf2activeaid.aid 
+FROM 
+target
+RIGHT JOIN  
+aid2target 
+ON target.target_id = aid2target.target_id
+RIGHT JOIN  
+scaf2activeaid 
+ON aid2target.aid = scaf2activeaid.aid
+WHERE 
+scaf2activeaid.scafid = ANY(%(scafids)s::bigint[])
+ORDER BY batch_scafid, aid;
+""",
+)
+_ACTIVE_ASSAY_DETAILS_BATCH = Statement(
+    "active_assay_details_batch",
+    """
+SELECT 
+scaf2activeaid.scafid AS batch_scafid,
+scaf2activeaid.aid,
+target.*,
+a2d.assay_format, a2d.assay_type, a2d.detection_method
+FROM 
+target
+RIGHT JOIN  
+aid2target 
+ON target.target_id = aid2target.target_id
+RIGHT JOIN  
+scaf2activeaid 
+ON aid2target.aid = scaf2activeaid.aid
+RIGHT JOIN
+aid2descriptors a2d
+ON a2d.aid = scaf2activeaid.aid
+WHERE 
+scaf2activeaid.scafid = ANY(%(scafids)s::bigint[])
+ORDER BY batch_scafid, aid;
+""",
+)
+_ASSOCIATED_DRUGS = Statement(
+    "associated_drugs",
+    "SELECT * FROM drug WHERE drug_id IN (SELECT drug_id FROM scaf2drug WHERE scafid=%(scafid)s);",
+)
+_ASSOCIATED_DRUGS_BATCH = Statement(
+    "associated_drugs_batch",
+    """SELECT scaf2drug.scafid AS batch_scafid, drug.*
+FROM drug JOIN scaf2drug ON drug.drug_id = scaf2drug.drug_id
+WHERE scaf2drug.scafid = ANY(%(scafids)s::bigint[])
+ORDER BY batch_scafid;""",
+)
+_BARD_ANNOTATIONS = Statement(
+    "bard_annotations",
+    "SELECT assay_format, assay_type, detection_method FROM aid2descriptors WHERE aid=%(aid)s;",
+)
+# the scaffold table only changes when a new version of the DB is released (restored),
+# which also gives the database a new OID
+_DB_VERSION = Statement(
+    "db_version",
+    """
+SELECT
+(SELECT oid FROM pg_database WHERE datname = current_database()) AS db_oid,
+(SELECT COUNT(*) FROM scaffold) AS n_scaffolds,
+(SELECT MAX(id) FROM scaffold) AS max_scafid;
+""",
+)
+
+
+def _build_scaffold_by_smiles_query(scafsmi: str) -> BoundStatement:
+    # here we assume the given scafsmi is None if it was not a valid SMILES
+    # and that the scafsmi was canonicalized (much faster to search scafsmi than use structural search!)
+    if scafsmi is None:
+        return abort(400, "Invalid SMILES provided")
+    return _SCAFFOLD_BY_SMILES.bind(scafsmi=scafsmi)
+
+
+def _build_scaffolds_by_smiles_query(scafsmi_list: list[str]) -> BoundStatement:
+    return _SCAFFOLDS_BY_SMILES.bind(scafsmi_list=list(scafsmi_list))
+
+
+def _build_scaffold_by_id_query(scafid: str) -> BoundStatement:
+    return _SCAFFOLD_BY_ID.bind(scafid=scafid)
+
+
+def _build_scaffolds_by_id_query(scafids: list[int]) -> BoundStatement:
+    return _SCAFFOLDS_BY_ID.bind(scafids=list(scafids))
+
+
+def _build_scaffold_id_query(scafsmi: str) -> BoundStatement:
+    return _SCAFFOLD_ID.bind(scafsmi=scafsmi)
+
+
+def _build_associated_compounds_query(scafid: int) -> BoundStatement:
+    return _ASSOCIATED_COMPOUNDS.bind(scafid=scafid)
+
+
+def _build_associated_compounds_page_query(
+    scafid: int, after_cid: int, limit: int
+) -> BoundStatement:
+    return _ASSOCIATED_COMPOUNDS_PAGE.bind(
+        scafid=scafid, after_cid=after_cid, limit=limit
+    )
+
+
+def _build_associated_sids_query(cid_list: list[int]) -> BoundStatement:
+    return _ASSOCIATED_SIDS.bind(cid_list=list(cid_list))
+
 
+def _build_associated_assay_ids_query(scafid: int) -> BoundStatement:
+    return _ASSOCIATED_ASSAY_IDS.bind(scafid=scafid)
+
+
+def _build_associated_assay_ids_page_query(
+    scafid: int, after_aid: int, limit: int
+) -> BoundStatement:
+    return _ASSOCIATED_ASSAY_IDS_PAGE.bind(
+        scafid=scafid, after_aid=after_aid, limit=limit
+    )
+
+
+def _build_scaf2aid_assay_ids_query(scafid: int) -> BoundStatement:
+    return _SCAF2AID_ASSAY_IDS.bind(scafid=scafid)
+
+
+def _build_scaf2aid_assay_ids_page_query(
+    scafid: int, after_aid: int, limit: int
+) -> BoundStatement:
+    return _SCAF2AID_ASSAY_IDS_PAGE.bind(
+        scafid=scafid, after_aid=after_aid, limit=limit
+    )
+
+
+def _build_table_exists_query(table_name: str) -> BoundStatement:
+    return _TABLE_EXISTS.bind(table_name=table_name)
+
+
+def _build_rollup_version_query(rollup: str) -> BoundStatement:
+    return _ROLLUP_VERSION.bind(rollup=rollup)
+
+
+def _build_rollup_source_version_query(rollup: Rollup) -> BoundStatement:
+    return rollup.source_version_statement.bind()
+
+
+def _build_assay_outcomes_query(sid: int) -> BoundStatement:
+    return _ASSAY_OUTCOMES.bind(sid=sid)
+
+
+def _build_sid2outcomes_query(sid: int) -> BoundStatement:
+    return _SID2OUTCOMES.bind(sid=sid)
+
+
+def _build_sid2outcomes_columns_query(sid: int) -> BoundStatement:
+    return _SID2OUTCOMES_COLUMNS.bind(sid=sid)
+
+
+# badapple2+ only
+def _build_active_targets_query(scafid: int) -> BoundStatement:
+    return _ACTIVE_TARGETS.bind(scafid=scafid)
 
-def _build_associated_drugs_query(scafid: int) -> sql.SQL:
-    return sql.SQL(
-        "SELECT * FROM drug WHERE drug_id IN (SELECT drug_id FROM scaf2drug WHERE scafid={scafid});"
-    ).format(scafid=sql.Literal(scafid))
 
+def _build_active_assay_details_query(scafid: int) -> BoundStatement:
+    return _ACTIVE_ASSAY_DETAILS.bind(scafid=scafid)
 
-def _build_BARD_annotations_query(aid: int) -> sql.SQL:
-    return sql.SQL(
-        "SELECT assay_format, assay_type, detection_method FROM aid2descriptors WHERE aid={aid};"
-    ).format(aid=sql.Literal(aid))
+
+def _build_active_targets_batch_query(scafids: list[int]) -> BoundStatement:
+    return _ACTIVE_TARGETS_BATCH.bind(scafids=list(scafids))
+
+
+def _build_active_assay_details_batch_query(scafids: list[int]) -> BoundStatement:
+    return _ACTIVE_ASSAY_DETAILS_BATCH.bind(scafids=list(scafids))
+
+
+def _build_associated_drugs_batch_query(scafids: list[int]) -> BoundStatement:
+    return _ASSOCIATED_DRUGS_BATCH.bind(scafids=list(scafids))
+
+
+def _build_associated_drugs_query(scafid: int) -> BoundStatement:
+    return _ASSOCIATED_DRUGS.bind(scafid=scafid)
+
+
+def _build_BARD_annotations_query(aid: int) -> BoundStatement:
+    return _BARD_ANNOTATIONS.bind(aid=aid)
+
+
+def _build_db_version_query() -> BoundStatement:
+    return _DB_VERSION.bind()
 
 
 # function to execute query using db cursor
-def execute_query(query: sql.SQL, cursor) -> List[Dict]:
-    """Execute a query and return results."""
+def execute_query(query, cursor, prepare: bool = False) -> List[Dict]:
+    """Execute a query (BoundStatement or SQL) and return results."""
     try:
+        if isinstance(query, BoundStatement):
+            return execute_statement(cursor, query, prepare)
         cursor.execute(query)
         return cursor.fetchall()
     except (Exception, psycopg2.DatabaseError) as error:
-        print(error)
+        logger.error(f"Query failed ({query!r}): {error}")
         raise error
 
 
@@ -149,6 +386,7 @@ def _handle_data_exception(e):
     raise e
 
 
+@instrument_session_methods
 class BadAppleSession:
     """
     Use this when you need to run multiple queries and want to reuse
@@ -159,52 +397,177 @@ class BadAppleSession:
             results1 = session.search_scaffold_by_smiles(smiles1)
             results2 = session.get_associated_compounds(scafid)
             results3 = session.get_active_targets(scafid)
+
+    The iter_* methods stream large results from a server-side cursor instead, the rows must be
+    consumed before the session is closed.
+
+    If pooled=True (default: DB_POOL_ENABLED in config.py) the connection is checked out from
+    the per-worker pool for db_name and returned to it on exit, instead of being opened and closed.
+
+    The connection is only opened once it is first needed, so sessions which are answered
+    entirely from a scaffold snapshot (see snapshot.py) never touch the database.
     """
 
-    def __init__(self, db_name: str):
+    def __init__(self, db_name: str, pooled: bool = DB_POOL_ENABLED):
         self.db_name = db_name
-        self.connection = None
-        self.cursor = None
+        self.pooled = pooled
+        self.snapshot = get_scaffold_snapshot(db_name)
+        self.bloom_filter = get_bloom_filter(db_name)
+        self._connection = None
+        self._cursor = None
+        self._pool = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            if self.pooled:
+                self._pool = get_pool(self.db_name)
+                try:
+                    self._connection = self._pool.getconn()
+                except PoolTimeoutError:
+                    return abort(503, "Server busy, please try again later")
+            else:
+                self._connection = connect(self.db_name)
+        return self._connection
+
+    @connection.setter
+    def connection(self, connection):
+        self._connection = connection
+
+    @property
+    def cursor(self):
+        if self._cursor is None:
+            self._cursor = self.connection.cursor(
+                cursor_factory=psycopg2.extras.RealDictCursor
+            )
+        return self._cursor
+
+    @cursor.setter
+    def cursor(self, cursor):
+        self._cursor = cursor
 
     def __enter__(self):
-        self.connection = psycopg2.connect(
-            host=DB_NAME2HOST[self.db_name],
-            database=self.db_name,
-            user=DB_NAME2USER[self.db_name],
-            password=DB_NAME2PASSWORD[self.db_name],
-            port=DB_NAME2PORT[self.db_name],
-        )
-        self.connection.set_session(
-            readonly=True
-        )  # user in prod will also be read-only, but this is an additional safety measure
-        self.cursor = self.connection.cursor(
-            cursor_factory=psycopg2.extras.RealDictCursor
-        )
+        if self.snapshot is None:
+            # fail early (e.g., unknown database) as before
+            self.connection
         return self
 
     def __exit__(self, exception_type, exception_value, exception_traceback):
         # NOTE: this API is read-only,
         # but if we added write methods we'd want to handle exceptions more robustly and rollback any changes
-        if self.cursor:
-            self.cursor.close()
-        if self.connection:
-            self.connection.close()
+        if self._cursor:
+            self._cursor.close()
+        if self._connection is None:
+            return
+        if self._pool is not None:
+            # connection-level errors mean the connection may be broken, so don't reuse it
+            discard = exception_type is not None and issubclass(
+                exception_type, (psycopg2.OperationalError, psycopg2.InterfaceError)
+            )
+            self._pool.putconn(self._connection, discard=discard)
+        else:
+            self._connection.close()
 
     def _execute_query_builder(self, query_builder, *args, error_handler=None):
         try:
             query = query_builder(*args)
-            return execute_query(query, self.cursor)
+            if isinstance(query, BoundStatement):
+                query.builder = query_builder.__name__
+            # (statements are only prepared on pooled connections, which outlive the session)
+            return execute_query(query, self.cursor, prepare=self.pooled)
         except Exception as e:
             if error_handler:
                 return error_handler(e)
             raise
 
+    def _get_bloom_filter(self):
+        """Bloom filter of scafsmi in the DB (see bloom.py), if there is an up to date one."""
+        if self.bloom_filter is None or not self.bloom_filter.is_current(
+            self.get_db_version
+        ):
+            return None
+        return self.bloom_filter
+
+    def _iter_query_builder(self, query_builder, *args) -> Iterator[Dict]:
+        """Like _execute_query_builder, but yields rows from a server-side cursor."""
+        query = query_builder(*args)
+        query.builder = query_builder.__name__
+        yield from iter_statement(self.connection, query, DB_STREAM_ITERSIZE)
+
     def search_scaffold_by_smiles(self, scafsmi: str) -> List[Dict]:
+        if self.snapshot is not None:
+            if scafsmi is None:
+                return abort(400, "Invalid SMILES provided")
+            row = self.snapshot.get_by_smiles(scafsmi)
+            return [row] if row is not None else []
+        bloom_filter = self._get_bloom_filter()
+        if bloom_filter is not None and scafsmi is not None:
+            if len(bloom_filter.filter_candidates([scafsmi])) == 0:
+                return []
+            rows = self._execute_query_builder(_build_scaffold_by_smiles_query, scafsmi)
+            bloom_filter.record_false_positives(int(len(rows) == 0))
+            return rows
         return self._execute_query_builder(_build_scaffold_by_smiles_query, scafsmi)
 
+    def search_scaffolds_by_smiles_batch(
+        self, scafsmi_list: List[str], chunk_size: int = SCAFFOLD_BATCH_CHUNK_SIZE
+    ) -> Dict[str, Dict]:
+        """
+        Look up many scaffolds at once (one "scafsmi = ANY(...)" query per chunk).
+        Returns a dict mapping scafsmi to its scaffold row; scafsmi not in the DB are omitted.
+        """
+        if self.snapshot is not None:
+            return self.snapshot.get_many_by_smiles(scafsmi_list)
+        # dedupe while preserving order, None = invalid SMILES so can't be in DB
+        unique_scafsmi = list(dict.fromkeys(s for s in scafsmi_list if s is not None))
+        bloom_filter = self._get_bloom_filter()
+        if bloom_filter is not None:
+            unique_scafsmi = bloom_filter.filter_candidates(unique_scafsmi)
+        scafsmi2info = {}
+        for i in range(0, len(unique_scafsmi), chunk_size):
+            rows = self._execute_query_builder(
+                _build_scaffolds_by_smiles_query, unique_scafsmi[i : i + chunk_size]
+            )
+            for row in rows:
+                # mimic "LIMIT 1" of search_scaffold_by_smiles
+                scafsmi2info.setdefault(row["scafsmi"], row)
+        if bloom_filter is not None:
+            bloom_filter.record_false_positives(len(unique_scafsmi) - len(scafsmi2info))
+        return scafsmi2info
+
     def search_scaffold_by_id(self, scafid: str) -> List[Dict]:
+        if self.snapshot is not None:
+            row = self.snapshot.get_by_id(int(scafid))
+            return [row] if row is not None else []
         return self._execute_query_builder(_build_scaffold_by_id_query, scafid)
 
+    def search_scaffolds_by_ids(self, scafids: List[int]) -> Dict[int, Dict]:
+        """
+        Look up many scaffolds at once (one "id = ANY(...)" query).
+        Returns a dict mapping scafid to its scaffold row; scafids not in the DB are omitted.
+        """
+        if self.snapshot is not None:
+            rows = (self.snapshot.get_by_id(int(scafid)) for scafid in scafids)
+            return {row["id"]: row for row in rows if row is not None}
+        if len(scafids) == 0:
+            return {}
+        rows = self._execute_query_builder(_build_scaffolds_by_id_query, scafids)
+        return {row["id"]: row for row in rows}
+
+    def _get_batch(self, query_builder, scafids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Run a batch query and group its rows by scaffold (rows without their batch_scafid,
+        so they match those of the corresponding single scaffold query).
+        Scaffolds without any rows are omitted.
+        """
+        if len(scafids) == 0:
+            return {}
+        scafid2rows = defaultdict(list)
+        for row in self._execute_query_builder(query_builder, scafids):
+            row = dict(row)
+            scafid2rows[row.pop("batch_scafid")].append(row)
+        return dict(scafid2rows)
+
     def get_scaffold_id(self, scafsmi: str) -> List[Dict]:
         return self._execute_query_builder(
             _build_scaffold_id_query, scafsmi, error_handler=_handle_data_exception
@@ -213,15 +576,93 @@ class BadAppleSession:
     def get_associated_compounds(self, scafid: int) -> List[Dict]:
         return self._execute_query_builder(_build_associated_compounds_query, scafid)
 
+    def iter_associated_compounds(self, scafid: int) -> Iterator[Dict]:
+        return self._iter_query_builder(_build_associated_compounds_query, scafid)
+
+    def get_associated_compounds_page(
+        self, scafid: int, after_cid: int, limit: int
+    ) -> List[Dict]:
+        """Up to limit compounds with CID > after_cid, ordered by CID."""
+        return self._execute_query_builder(
+            _build_associated_compounds_page_query, scafid, after_cid, limit
+        )
+
     def get_associated_sids(self, cid_list: List[int]) -> List[Dict]:
         return self._execute_query_builder(_build_associated_sids_query, cid_list)
 
-    def get_associated_assay_ids(self, scafid: int) -> List[Dict]:
+    def _use_rollup(self, rollup: Rollup, use_rollup: Optional[bool]) -> bool:
+        """
+        Whether to read from the given precomputed rollup (see rollup.py).
+        use_rollup: None = if the DB has a current rollup, True = require it, False = never.
+        """
+        if use_rollup is False:
+            return False
+        current = is_rollup_current(rollup, self.db_name, self)
+        if use_rollup and not current:
+            return abort(503, f"{rollup.table} is not available for this database")
+        return current
+
+    def get_associated_assay_ids(
+        self, scafid: int, use_rollup: Optional[bool] = None
+    ) -> List[Dict]:
+        if self._use_rollup(SCAF2AID, use_rollup):
+            return self._execute_query_builder(_build_scaf2aid_assay_ids_query, scafid)
         return self._execute_query_builder(_build_associated_assay_ids_query, scafid)
 
-    def get_assay_outcomes(self, sid: int) -> List[Dict]:
+    def iter_associated_assay_ids(
+        self, scafid: int, use_rollup: Optional[bool] = None
+    ) -> Iterator[Dict]:
+        if self._use_rollup(SCAF2AID, use_rollup):
+            return self._iter_query_builder(_build_scaf2aid_assay_ids_query, scafid)
+        return self._iter_query_builder(_build_associated_assay_ids_query, scafid)
+
+    def get_associated_assay_ids_page(
+        self,
+        scafid: int,
+        after_aid: int,
+        limit: int,
+        use_rollup: Optional[bool] = None,
+    ) -> List[Dict]:
+        """Up to limit AIDs > after_aid, ordered by AID."""
+        if self._use_rollup(SCAF2AID, use_rollup):
+            query_builder = _build_scaf2aid_assay_ids_page_query
+        else:
+            query_builder = _build_associated_assay_ids_page_query
+        return self._execute_query_builder(query_builder, scafid, after_aid, limit)
+
+    def get_assay_outcomes(
+        self, sid: int, use_rollup: Optional[bool] = None
+    ) -> List[Dict]:
+        if self._use_rollup(SID2OUTCOMES, use_rollup):
+            return self._execute_query_builder(_build_sid2outcomes_query, sid)
         return self._execute_query_builder(_build_assay_outcomes_query, sid)
 
+    def iter_assay_outcomes(
+        self, sid: int, use_rollup: Optional[bool] = None
+    ) -> Iterator[Dict]:
+        if self._use_rollup(SID2OUTCOMES, use_rollup):
+            return self._iter_query_builder(_build_sid2outcomes_query, sid)
+        return self._iter_query_builder(_build_assay_outcomes_query, sid)
+
+    def get_assay_outcome_columns(
+        self, sid: int, use_rollup: Optional[bool] = None
+    ) -> Dict[str, List[int]]:
+        """
+        Assay outcomes of a substance as columns, ordered by AID:
+        {"aids": [...], "outcomes": [...]} (outcomes[i] is the outcome of aids[i]).
+        """
+        if self._use_rollup(SID2OUTCOMES, use_rollup):
+            result = self._execute_query_builder(_build_sid2outcomes_columns_query, sid)
+            if len(result) == 0:
+                return {"aids": [], "outcomes": []}
+            return {"aids": result[0]["aids"], "outcomes": result[0]["outcomes"]}
+        rows = self._execute_query_builder(_build_assay_outcomes_query, sid)
+        rows = sorted(rows, key=lambda row: (row["aid"], row["outcome"]))
+        return {
+            "aids": [row["aid"] for row in rows],
+            "outcomes": [row["outcome"] for row in rows],
+        }
+
     def get_active_targets(self, scafid: int) -> List[Dict]:
         return self._execute_query_builder(_build_active_targets_query, scafid)
 
@@ -231,5 +672,44 @@ class BadAppleSession:
     def get_associated_drugs(self, scafid: int) -> List[Dict]:
         return self._execute_query_builder(_build_associated_drugs_query, scafid)
 
+    def get_active_targets_batch(self, scafids: List[int]) -> Dict[int, List[Dict]]:
+        return self._get_batch(_build_active_targets_batch_query, scafids)
+
+    def get_active_assay_details_batch(
+        self, scafids: List[int]
+    ) -> Dict[int, List[Dict]]:
+        return self._get_batch(_build_active_assay_details_batch_query, scafids)
+
+    def get_associated_drugs_batch(self, scafids: List[int]) -> Dict[int, List[Dict]]:
+        return self._get_batch(_build_associated_drugs_batch_query, scafids)
+
+    def get_db_version(self) -> str:
+        """Identifier which changes whenever a new version of the database is installed."""
+        result = self._execute_query_builder(_build_db_version_query)[0]
+        return f"{result['db_oid']}-{result['n_scaffolds']}-{result['max_scafid']}"
+
+    def get_rollup_version(self, rollup: str) -> Optional[str]:
+        """
+        Version of the source tables the given rollup was built from
+        (None if the DB doesn't have it).
+        """
+        result = self._execute_query_builder(_build_table_exists_query, "rollup_meta")
+        if not result[0]["table_exists"]:
+            return None
+        result = self._execute_query_builder(_build_rollup_version_query, rollup)
+        return result[0]["content_version"] if len(result) > 0 else None
+
+    def get_rollup_source_version(self, rollup: Rollup) -> Optional[str]:
+        """
+        Current version of the source tables of rollup (see Rollup.source_version_sql),
+        None if the DB doesn't have all of them.
+        """
+        for table in rollup.source_tables:
+            result = self._execute_query_builder(_build_table_exists_query, table)
+            if not result[0]["table_exists"]:
+                return None
+        result = self._execute_query_builder(_build_rollup_source_version_query, rollup)
+        return result[0]["source_version"]
+
     def get_BARD_annotations(self, aid: int) -> List[Dict]:
         return self._execute_query_builder(_build_BARD_annotations_query, aid)
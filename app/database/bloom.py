@@ -0,0 +1,283 @@
+"""
+Description:
+Bloom filter over all scafsmi values of the scaffold table, used by BadAppleSession to skip
+database lookups of scaffolds which are definitely not in the table (common for novel
+compounds). A "maybe present" answer is still checked against the database, so results
+are unchanged; only the false positive rate (configurable) of lookups reach the DB for misses.
+
+Filters are built from the database at startup or loaded from a file written by a previous
+build (if its DB version matches). While in use, the DB version is re-checked every
+DB_VERSION_CHECK_INTERVAL seconds and the filter is no longer used once it is stale (it
+could otherwise hide newly added scaffolds).
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from config import DB_VERSION_CHECK_INTERVAL
+from database.pool import connect
+from loguru import logger
+
+FILE_EXTENSION = ".bloom.npz"
+
+
+def _hash_pairs(scafsmi_list: Iterable[str]) -> np.ndarray:
+    """(n, 2) uint64 array of the hash pairs of the given SMILES."""
+    digests = b"".join(
+        hashlib.blake2b(s.encode("utf-8"), digest_size=16).digest()
+        for s in scafsmi_list
+    )
+    pairs = np.frombuffer(digests, dtype="<u8").reshape(-1, 2).copy()
+    pairs[:, 1] |= np.uint64(1)
+    return pairs
+
+
+class ScaffoldBloomFilter:
+    """
+    Bloom filter with n_bits bits and n_hashes probes per item (double hashing:
+    probe i of an item with hashes (h1, h2) is bit (h1 + i * h2) mod 2^64 mod n_bits).
+    """
+
+    def __init__(
+        self,
+        bits: np.ndarray,
+        n_bits: int,
+        n_hashes: int,
+        n_items: int,
+        fp_rate: float,
+        db_version: Optional[str] = None,
+    ):
+        self.bits = bits  # uint8 array of ceil(n_bits / 8) bytes
+        self.n_bits = n_bits
+        self.n_hashes = n_hashes
+        self.n_items = n_items
+        self.fp_rate = fp_rate
+        self.db_version = db_version
+        self.checks = 0  # number of scafsmi checked
+        self.queries_saved = 0  # definite misses (not looked up in the DB)
+        self.false_positives = 0  # "maybe present" but not in the DB
+        self.stale = False
+        self._version_checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_hash_pairs(
+        cls, pairs: np.ndarray, fp_rate: float, db_version: Optional[str] = None
+    ) -> "ScaffoldBloomFilter":
+        n_items = len(pairs)
+        # optimal size/number of probes for n_items at the given false positive rate
+        n_bits = max(
+            64, math.ceil(-max(n_items, 1) * math.log(fp_rate) / math.log(2) ** 2)
+        )
+        n_hashes = max(1, round(n_bits / max(n_items, 1) * math.log(2)))
+        bloom_filter = cls(
+            np.zeros((n_bits + 7) // 8, dtype=np.uint8),
+            n_bits,
+            n_hashes,
+            n_items,
+            fp_rate,
+            db_version,
+        )
+        # (in chunks, to bound the memory used by the (n, n_hashes) arrays of positions)
+        for i in range(0, n_items, 100_000):
+            positions = bloom_filter._positions(pairs[i : i + 100_000]).ravel()
+            np.bitwise_or.at(
+                bloom_filter.bits,
+                positions >> np.uint64(3),
+                np.left_shift(1, positions & np.uint64(7)).astype(np.uint8),
+            )
+        return bloom_filter
+
+    @classmethod
+    def from_scafsmi(
+        cls, scafsmi_list: List[str], fp_rate: float, db_version: Optional[str] = None
+    ) -> "ScaffoldBloomFilter":
+        return cls.from_hash_pairs(_hash_pairs(scafsmi_list), fp_rate, db_version)
+
+    def _positions(self, pairs: np.ndarray) -> np.ndarray:
+        """(n, n_hashes) array of the bits probed for each hash pair."""
+        probes = np.arange(self.n_hashes, dtype=np.uint64)
+        return (pairs[:, :1] + probes * pairs[:, 1:]) % np.uint64(self.n_bits)
+
+    def filter_candidates(self, scafsmi_list: List[str]) -> List[str]:
+        """The scafsmi which may be in the table (all others are definitely not)."""
+        if len(scafsmi_list) == 0:
+            return []
+        positions = self._positions(_hash_pairs(scafsmi_list))
+        bit_set = (
+            self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7))
+        ) & 1
+        maybe_present = bit_set.all(axis=1)
+        candidates = [s for s, m in zip(scafsmi_list, maybe_present) if m]
+        with self._lock:
+            self.checks += len(scafsmi_list)
+            self.queries_saved += len(scafsmi_list) - len(candidates)
+        return candidates
+
+    def record_false_positives(self, n: int):
+        with self._lock:
+            self.false_positives += n
+
+    def is_current(self, get_db_version: Callable[[], str]) -> bool:
+        """
+        False if the filter was built for another version of the database
+        (checked with get_db_version at most every DB_VERSION_CHECK_INTERVAL seconds).
+        """
+        if self.stale:
+            return False
+        if time.monotonic() - self._version_checked_at > DB_VERSION_CHECK_INTERVAL:
+            self._version_checked_at = time.monotonic()
+            db_version = get_db_version()
+            if db_version != self.db_version:
+                logger.warning(
+                    f"Scaffold Bloom filter of DB version {self.db_version} is stale "
+                    f"(DB version is now {db_version}), no longer using it"
+                )
+                self.stale = True
+        return not self.stale
+
+    def stats(self) -> dict:
+        return {
+            "n_items": self.n_items,
+            "n_bits": self.n_bits,
+            "n_hashes": self.n_hashes,
+            "fp_rate": self.fp_rate,
+            "memory_bytes": self.bits.nbytes,
+            "db_version": self.db_version,
+            "stale": self.stale,
+            "checks": self.checks,
+            "queries_saved": self.queries_saved,
+            "false_positives": self.false_positives,
+        }
+
+    def save(self, path: str):
+        meta = {
+            "n_bits": self.n_bits,
+            "n_hashes": self.n_hashes,
+            "n_items": self.n_items,
+            "fp_rate": self.fp_rate,
+            "db_version": self.db_version,
+        }
+        # write to a temporary file first so readers never see a partial file
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, bits=self.bits, meta=np.array(json.dumps(meta)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ScaffoldBloomFilter":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            bits = data["bits"]
+        if len(bits) != (meta["n_bits"] + 7) // 8:
+            raise ValueError(f"{path} is corrupt (unexpected number of bits)")
+        return cls(
+            bits,
+            meta["n_bits"],
+            meta["n_hashes"],
+            meta["n_items"],
+            meta["fp_rate"],
+            meta["db_version"],
+        )
+
+
+def _get_db_version(db_name: str) -> str:
+    # imported here to avoid a circular import (badapple.py uses the filters)
+    from database.badapple import BadAppleSession
+
+    with BadAppleSession(db_name, pooled=False) as db_session:
+        return db_session.get_db_version()
+
+
+def build_bloom_filter(
+    db_name: str, fp_rate: float, fetch_size: int = 50_000
+) -> ScaffoldBloomFilter:
+    """Build a Bloom filter over the scafsmi of all rows of the scaffold table of db_name."""
+    db_version = _get_db_version(db_name)
+    connection = connect(db_name)
+    try:
+        # server-side cursor, only hashes of the SMILES are kept in memory
+        with connection.cursor(name="scaffold_bloom") as cursor:
+            cursor.execute("SELECT scafsmi FROM scaffold;")
+            chunks = []
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if len(rows) == 0:
+                    break
+                chunks.append(_hash_pairs(row[0] for row in rows))
+    finally:
+        connection.close()
+    pairs = np.concatenate(chunks) if chunks else np.zeros((0, 2), dtype=np.uint64)
+    return ScaffoldBloomFilter.from_hash_pairs(pairs, fp_rate, db_version)
+
+
+def load_bloom_filter(
+    db_name: str, fp_rate: float, bloom_dir: Optional[str] = None
+) -> ScaffoldBloomFilter:
+    """
+    Load the filter of db_name from bloom_dir if it exists and matches the current DB version
+    (and fp_rate), else build it (and save it to bloom_dir, if given).
+    """
+    start = time.monotonic()
+    path = os.path.join(bloom_dir, db_name + FILE_EXTENSION) if bloom_dir else None
+    if path is not None and os.path.exists(path):
+        try:
+            bloom_filter = ScaffoldBloomFilter.load(path)
+            db_version = _get_db_version(db_name)
+            if (bloom_filter.db_version, bloom_filter.fp_rate) == (db_version, fp_rate):
+                logger.info(f"Loaded scaffold Bloom filter {path}")
+                return bloom_filter
+            logger.info(f"Scaffold Bloom filter {path} is stale, rebuilding it")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load scaffold Bloom filter {path}: {e}")
+    bloom_filter = build_bloom_filter(db_name, fp_rate)
+    logger.info(
+        f"Built scaffold Bloom filter of {db_name}: {bloom_filter.n_items} scaffolds, "
+        f"{bloom_filter.bits.nbytes / 2**20:.1f} MiB, {time.monotonic() - start:.1f}s"
+    )
+    if path is not None:
+        os.makedirs(bloom_dir, exist_ok=True)
+        bloom_filter.save(path)
+    return bloom_filter
+
+
+_filters: Dict[str, ScaffoldBloomFilter] = {}
+_filters_lock = threading.Lock()
+
+
+def load_bloom_filters(
+    db_names: Iterable[str], fp_rate: float, bloom_dir: Optional[str] = None
+):
+    """
+    Load filters for the given databases. Like snapshots, call this before gunicorn forks
+    its workers (--preload). A database whose filter can't be built is served without one.
+    """
+    for db_name in db_names:
+        try:
+            bloom_filter = load_bloom_filter(db_name, fp_rate, bloom_dir)
+        except Exception as e:
+            logger.error(f"Could not build scaffold Bloom filter of {db_name}: {e}")
+            continue
+        set_bloom_filter(db_name, bloom_filter)
+
+
+def set_bloom_filter(db_name: str, bloom_filter: Optional[ScaffoldBloomFilter]):
+    with _filters_lock:
+        if bloom_filter is None:
+            _filters.pop(db_name, None)
+        else:
+            _filters[db_name] = bloom_filter
+
+
+def get_bloom_filter(db_name: str) -> Optional[ScaffoldBloomFilter]:
+    return _filters.get(db_name)
+
+
+def get_bloom_filter_stats() -> Dict[str, dict]:
+    return {db_name: f.stats() for db_name, f in _filters.items()}
@@ -0,0 +1,159 @@
+"""
+Description:
+Build a rollup table of a database (scaf2aid or sid2outcomes, see database/rollup.py), then check
+that it gives the same results as the live query for a sample of scaffolds/substances before
+committing it.
+Run this against a local Postgres with the full database (including the activity table), as a
+user which can create tables. The rollups can then be shipped with the database (e.g., pg_dump).
+
+Usage (from the app directory, with the DB variables of .env set):
+    python -m database.build_rollup --database badapple2 --rollup scaf2aid --grant_to <API user>
+    python -m database.build_rollup --database badapple2 --rollup sid2outcomes --check_only
+"""
+
+import argparse
+import time
+
+import psycopg2.extras
+from config import ALLOWED_DB_NAMES
+from database.badapple import (
+    _build_assay_outcomes_query,
+    _build_associated_assay_ids_query,
+    _build_scaf2aid_assay_ids_query,
+    _build_sid2outcomes_query,
+    execute_query,
+)
+from database.pool import connect
+from database.rollup import META_TABLE, ROLLUPS, build_rollup
+from psycopg2 import sql
+
+# rollup -> (query of random sample IDs, query of IDs with the largest results,
+# live query builder, rollup query builder)
+_PARITY_QUERIES = {
+    "scaf2aid": (
+        "SELECT id FROM scaffold ORDER BY random() LIMIT %s;",
+        "SELECT scafid FROM scaf2aid GROUP BY scafid ORDER BY COUNT(*) DESC LIMIT %s;",
+        _build_associated_assay_ids_query,
+        _build_scaf2aid_assay_ids_query,
+    ),
+    "sid2outcomes": (
+        "SELECT sid FROM sub2cpd ORDER BY random() LIMIT %s;",
+        "SELECT sid FROM sid2outcomes ORDER BY cardinality(aids) DESC LIMIT %s;",
+        _build_assay_outcomes_query,
+        _build_sid2outcomes_query,
+    ),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--database",
+        type=str,
+        required=True,
+        choices=ALLOWED_DB_NAMES,
+        help="Database the rollup is built in",
+    )
+    parser.add_argument(
+        "--rollup",
+        type=str,
+        required=True,
+        choices=list(ROLLUPS),
+        help="Rollup table to build",
+    )
+    parser.add_argument(
+        "--parity_sample",
+        type=int,
+        default=1000,
+        help="Number of random IDs whose results are compared with the live query",
+    )
+    parser.add_argument(
+        "--grant_to",
+        type=str,
+        default=None,
+        help="Role given SELECT on the new tables (e.g., the read-only user of the API)",
+    )
+    parser.add_argument(
+        "--check_only",
+        action="store_true",
+        help="Only run the parity check against the existing rollup",
+    )
+    return parser.parse_args()
+
+
+def _result_key(rows: list) -> list:
+    # (compared regardless of order, the live queries of outcomes are unordered)
+    return sorted(tuple(row.values()) for row in rows)
+
+
+def find_parity_mismatches(cursor, rollup: str, ids: list[int]) -> list[int]:
+    """IDs whose results from the rollup differ from those of the live query."""
+    _, _, live_query_builder, rollup_query_builder = _PARITY_QUERIES[rollup]
+    mismatches = []
+    for id in ids:
+        live = execute_query(live_query_builder(id), cursor)
+        from_rollup = execute_query(rollup_query_builder(id), cursor)
+        if _result_key(live) != _result_key(from_rollup):
+            mismatches.append(id)
+    return mismatches
+
+
+def _sample_ids(cursor, rollup: str, n: int) -> list[int]:
+    # random IDs, plus some with the largest results
+    random_sql, largest_sql, _, _ = _PARITY_QUERIES[rollup]
+    cursor.execute(random_sql, (n,))
+    ids = [list(row.values())[0] for row in cursor.fetchall()]
+    cursor.execute(largest_sql, (max(n // 100, 1),))
+    ids += [list(row.values())[0] for row in cursor.fetchall()]
+    return list(dict.fromkeys(ids))
+
+
+def _check_parity(cursor, rollup: str, n: int):
+    start = time.monotonic()
+    ids = _sample_ids(cursor, rollup, n)
+    mismatches = find_parity_mismatches(cursor, rollup, ids)
+    if len(mismatches) > 0:
+        raise SystemExit(
+            f"Error: {rollup} differs from the live query for {len(mismatches)} of "
+            f"{len(ids)} IDs (e.g., {mismatches[:10]})"
+        )
+    print(f"Parity check passed for {len(ids)} IDs ({time.monotonic() - start:.1f}s)")
+
+
+def main(args):
+    rollup = ROLLUPS[args.rollup]
+    connection = connect(args.database)
+    try:
+        connection.set_session(readonly=args.check_only)
+        with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            if args.check_only:
+                _check_parity(cursor, rollup.table, args.parity_sample)
+                return
+            start = time.monotonic()
+            with connection.cursor() as build_cursor:
+                n_rows, content_version = build_rollup(build_cursor, rollup)
+            print(
+                f"Built {rollup.table} of {args.database}: {n_rows} rows, "
+                f"content_version={content_version}, {time.monotonic() - start:.1f}s"
+            )
+            # (in the build transaction: a rollup which fails the check is never committed)
+            _check_parity(cursor, rollup.table, args.parity_sample)
+            if args.grant_to:
+                cursor.execute(
+                    sql.SQL("GRANT SELECT ON {}, {} TO {};").format(
+                        sql.Identifier(rollup.table),
+                        sql.Identifier(META_TABLE),
+                        sql.Identifier(args.grant_to),
+                    )
+                )
+        connection.commit()
+        # (ANALYZE so the planner has statistics of the new table)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {rollup.table};")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main(parse_args())
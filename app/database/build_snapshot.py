@@ -0,0 +1,67 @@
+"""
+Description:
+Export the scaffold table of a database to a snapshot file, which the API can memory-map
+instead of querying the database (see SCAFFOLD_SNAPSHOT_DIR in config.py).
+
+Usage (from the app directory, with the DB variables of .env set):
+    python -m database.build_snapshot --database badapple2 --output_dir snapshots --release 2025.1
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from config import ALLOWED_DB_NAMES
+from database.snapshot import (
+    get_snapshot_file_path,
+    load_scaffold_snapshot,
+    open_snapshot_file,
+    save_snapshot_file,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--database",
+        type=str,
+        required=True,
+        choices=ALLOWED_DB_NAMES,
+        help="Database whose scaffold table is exported",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="Directory where <database>.snapshot is written (existing file is replaced)",
+    )
+    parser.add_argument(
+        "--release",
+        type=str,
+        default=None,
+        help="Label of the database release, lets the API use the file without a database "
+        "(must match SCAFFOLD_SNAPSHOT_RELEASE)",
+    )
+    return parser.parse_args()
+
+
+def main(args):
+    start = time.monotonic()
+    snapshot = load_scaffold_snapshot(args.database)
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = get_snapshot_file_path(args.output_dir, args.database)
+    save_snapshot_file(snapshot, path, args.database, args.release)
+    # read the file back to make sure it is valid and identical to the table
+    saved = open_snapshot_file(path, args.database, snapshot.db_version, args.release)
+    for name, array in snapshot.arrays.items():
+        if not np.array_equal(saved.arrays[name], array):
+            raise SystemExit(f"Error: {path} does not match the table (array {name})")
+    print(
+        f"Wrote {path}: {snapshot.n_rows} rows, db_version={snapshot.db_version}, "
+        f"{os.path.getsize(path) / 2**20:.1f} MiB, {time.monotonic() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main(parse_args())
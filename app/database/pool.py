@@ -0,0 +1,265 @@
+"""
+Description:
+Per-worker PostgreSQL connection pools used by BadAppleSession.
+One bounded, thread-safe pool is kept per database name and per process
+(gunicorn worker), so each request can reuse an already read-only connection
+instead of paying for a new TCP/auth handshake.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from config import (
+    DB_NAME2HOST,
+    DB_NAME2PASSWORD,
+    DB_NAME2PORT,
+    DB_NAME2USER,
+    DB_POOL_CHECKOUT_TIMEOUT,
+    DB_POOL_IDLE_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_PING_INTERVAL,
+)
+from database.statements import BadAppleConnection
+
+
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """Raised when no connection became available within the checkout timeout."""
+
+
+def connect(db_name: str, **kwargs):
+    """Open a new read-only connection to the given Badapple database."""
+    kwargs.setdefault("connection_factory", BadAppleConnection)
+    connection = psycopg2.connect(
+        host=DB_NAME2HOST[db_name],
+        database=db_name,
+        user=DB_NAME2USER[db_name],
+        password=DB_NAME2PASSWORD[db_name],
+        port=DB_NAME2PORT[db_name],
+        **kwargs,
+    )
+    connection.set_session(
+        readonly=True
+    )  # user in prod will also be read-only, but this is an additional safety measure
+    return connection
+
+
+class _PooledConnection:
+    """Bookkeeping for a connection owned by a ConnectionPool."""
+
+    __slots__ = ("connection", "created_at", "last_used")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of read-only connections to a single database.
+
+    Connections are validated cheaply on checkout (closed flag + transaction status,
+    plus a "SELECT 1" ping if the connection sat idle for longer than ping_interval)
+    and are retired once they exceed idle_timeout or max_lifetime.
+    A timeout/lifetime <= 0 disables the corresponding check.
+    """
+
+    def __init__(
+        self,
+        connect_func: Callable,
+        min_size: int = DB_POOL_MIN_SIZE,
+        max_size: int = DB_POOL_MAX_SIZE,
+        idle_timeout: float = DB_POOL_IDLE_TIMEOUT,
+        max_lifetime: float = DB_POOL_MAX_LIFETIME,
+        checkout_timeout: float = DB_POOL_CHECKOUT_TIMEOUT,
+        ping_interval: float = DB_POOL_PING_INTERVAL,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(
+                f"Invalid pool size: min_size={min_size}, max_size={max_size}"
+            )
+        self._connect = connect_func
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self._idle = []  # LIFO stack of _PooledConnection, most recently used last
+        self._in_use = {}  # id(connection) -> _PooledConnection
+        self._n_opening = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        for _ in range(min_size):
+            self._idle.append(_PooledConnection(self._connect()))
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._n_opening
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+            }
+
+    def _is_expired(self, pooled: _PooledConnection, now: float) -> bool:
+        if self.max_lifetime > 0 and now - pooled.created_at > self.max_lifetime:
+            return True
+        if self.idle_timeout > 0 and now - pooled.last_used > self.idle_timeout:
+            return True
+        return False
+
+    def _is_usable(self, pooled: _PooledConnection, now: float) -> bool:
+        connection = pooled.connection
+        if connection.closed:
+            return False
+        if (
+            connection.info.transaction_status
+            != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        ):
+            return False
+        if self.ping_interval > 0 and now - pooled.last_used > self.ping_interval:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1;")
+                connection.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self, timeout: Optional[float] = None):
+        """
+        Check out a validated read-only connection, opening one if there is room.
+        Waits at most timeout seconds (default: checkout_timeout) for a connection to be returned.
+        """
+        if timeout is None:
+            timeout = self.checkout_timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                pooled = None
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if self._is_expired(candidate, time.monotonic()):
+                        self._close_quietly(candidate.connection)
+                        continue
+                    pooled = candidate
+                    break
+                if pooled is None and self.size < self.max_size:
+                    self._n_opening += 1
+                elif pooled is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"No connection available within {timeout}s (max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            if pooled is None:
+                # open new connections outside the lock so that other threads are not blocked
+                try:
+                    pooled = _PooledConnection(self._connect())
+                finally:
+                    with self._cond:
+                        self._n_opening -= 1
+                        if pooled is not None:
+                            self._in_use[id(pooled.connection)] = pooled
+                        self._cond.notify()
+                return pooled.connection
+            if not self._is_usable(pooled, time.monotonic()):
+                self._close_quietly(pooled.connection)
+                with self._cond:
+                    self._cond.notify()
+                continue
+
+            with self._cond:
+                self._in_use[id(pooled.connection)] = pooled
+            return pooled.connection
+
+    def putconn(self, connection, discard: bool = False):
+        """Return a connection to the pool (or close it if discard=True / it is unusable)."""
+        with self._cond:
+            pooled = self._in_use.pop(id(connection), None)
+        if pooled is None:
+            raise psycopg2.pool.PoolError("trying to put unkeyed connection")
+        if not discard and not connection.closed:
+            try:
+                # end the (read-only) transaction so the connection is idle again
+                connection.rollback()
+            except psycopg2.Error:
+                discard = True
+        now = time.monotonic()
+        with self._cond:
+            if (
+                discard
+                or self._closed
+                or connection.closed
+                or (
+                    self.max_lifetime > 0
+                    and now - pooled.created_at > self.max_lifetime
+                )
+            ):
+                self._close_quietly(connection)
+            else:
+                pooled.last_used = now
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for pooled in self._idle:
+                self._close_quietly(pooled.connection)
+            self._idle.clear()
+            self._cond.notify_all()
+
+
+# pools are created lazily and are keyed by process ID, so that gunicorn workers
+# (which fork from the master when using --preload) never share sockets
+_pools: Dict[str, ConnectionPool] = {}
+_pools_pid = os.getpid()
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name: str) -> ConnectionPool:
+    global _pools, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # forked: drop (but do not close!) connections inherited from the parent,
+            # closing them here would terminate the parent's sessions
+            _pools = {}
+            _pools_pid = os.getpid()
+        pool = _pools.get(db_name)
+        if pool is None:
+            DB_NAME2HOST[db_name]  # raise KeyError for unknown databases
+            pool = ConnectionPool(lambda: connect(db_name))
+            _pools[db_name] = pool
+        return pool
+
+
+def get_pool_stats() -> Dict[str, dict]:
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            return {}
+        return {db_name: pool.stats() for db_name, pool in _pools.items()}
@@ -0,0 +1,187 @@
+"""
+Description:
+Precomputed rollup tables, which turn expensive queries over the activity table into one index
+lookup:
+- scaf2aid: scaffold -> AIDs of all assays its compounds were tested in
+  (get_associated_assay_ids, instead of the nested query over activity, sub2cpd and scaf2cpd)
+- sid2outcomes: substance -> arrays of its AIDs and outcomes, ordered by AID (get_assay_outcomes)
+
+Rollups are built with database/build_rollup.py against a local (writable) copy of the database
+and then ship with it (e.g., in the dump the DB image is restored from, which does not need the
+activity table). rollup_meta records the version of the source tables each rollup was built
+from (their row counts and largest IDs, see Rollup.source_version_sql): a rollup whose source
+tables changed since (e.g., new assay results loaded into activity) is ignored and queries fall
+back to the live query. A database without the source tables (shipped with its rollups only)
+can't be checked, its rollups are used as is.
+Whether each database has a current rollup is re-checked every ROLLUP_CHECK_INTERVAL seconds.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import DB_ROLLUPS_ENABLED, ROLLUP_CHECK_INTERVAL
+from database.statements import Statement
+from loguru import logger
+
+META_TABLE = "rollup_meta"
+
+
+class Rollup:
+    def __init__(
+        self,
+        table: str,
+        select_sql: str,
+        primary_key: str,
+        source_tables: Dict[str, str],
+    ):
+        self.table = table
+        self.select_sql = select_sql  # rows of the rollup
+        self.primary_key = primary_key
+        # tables the rollup is built from -> ID column (see source_version_sql)
+        self.source_tables = source_tables
+        self.source_version_statement = Statement(
+            f"{table}_source_version", self.source_version_sql()
+        )
+
+    def source_version_sql(self) -> str:
+        """
+        Version of the source tables: the row count and largest ID of each, e.g.
+        "activity:1000:588795", which changes whenever rows are loaded into (or removed from)
+        any of them.
+        """
+        versions = [
+            f"(SELECT '{table}:' || COUNT(*) || ':' || COALESCE(MAX({column}), 0) "
+            f"FROM {table})"
+            for table, column in self.source_tables.items()
+        ]
+        return f"SELECT concat_ws(',', {', '.join(versions)}) AS source_version;"
+
+    def build_sql(self) -> List[str]:
+        # all statements run in a single transaction, so the old rollup (if any) is replaced
+        # atomically
+        build_table = f"{self.table}_build"
+        return [
+            f"DROP TABLE IF EXISTS {build_table};",
+            f"CREATE TABLE {build_table} AS\n{self.select_sql}",
+            f"ALTER TABLE {build_table} ADD CONSTRAINT {build_table}_pkey "
+            f"PRIMARY KEY ({self.primary_key});",
+            f"DROP TABLE IF EXISTS {self.table};",
+            f"ALTER TABLE {build_table} RENAME TO {self.table};",
+            f"ALTER INDEX {build_table}_pkey RENAME TO {self.table}_pkey;",
+            f"""CREATE TABLE IF NOT EXISTS {META_TABLE} (
+rollup TEXT PRIMARY KEY,
+content_version TEXT NOT NULL,
+n_rows BIGINT NOT NULL,
+built_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);""",
+        ]
+
+
+# (DISTINCT join == the nested IN query of get_associated_assay_ids, for all scaffolds at once)
+SCAF2AID = Rollup(
+    "scaf2aid",
+    """SELECT DISTINCT scaf2cpd.scafid, activity.aid
+FROM scaf2cpd
+JOIN sub2cpd ON sub2cpd.cid = scaf2cpd.cid
+JOIN activity ON activity.sid = sub2cpd.sid;""",
+    "scafid, aid",
+    {"scaf2cpd": "scafid", "sub2cpd": "sid", "activity": "aid"},
+)
+SID2OUTCOMES = Rollup(
+    "sid2outcomes",
+    """SELECT sid,
+array_agg(aid ORDER BY aid, outcome) AS aids,
+array_agg(outcome ORDER BY aid, outcome) AS outcomes
+FROM activity
+GROUP BY sid;""",
+    "sid",
+    {"activity": "aid"},
+)
+ROLLUPS = {rollup.table: rollup for rollup in [SCAF2AID, SID2OUTCOMES]}
+
+
+def build_rollup(cursor, rollup: Rollup) -> Tuple[int, str]:
+    """
+    (Re)build the rollup with cursor (of a writable connection, the transaction is left open
+    so the caller can check the result before committing).
+    Returns the number of rows and the version of the source tables it was built from.
+    """
+    cursor.execute(rollup.source_version_statement.text)
+    content_version = cursor.fetchone()[0]
+    for sql in rollup.build_sql():
+        cursor.execute(sql)
+    cursor.execute(f"SELECT COUNT(*) FROM {rollup.table};")
+    n_rows = cursor.fetchone()[0]
+    cursor.execute(
+        f"""INSERT INTO {META_TABLE} (rollup, content_version, n_rows) VALUES (%s, %s, %s)
+ON CONFLICT (rollup) DO UPDATE
+SET content_version = EXCLUDED.content_version, n_rows = EXCLUDED.n_rows, built_at = now();""",
+        (rollup.table, content_version, n_rows),
+    )
+    return n_rows, content_version
+
+
+class _RollupStatus:
+    __slots__ = ("current", "version", "source_version", "checked_at")
+
+    def __init__(self, current: bool, version, source_version):
+        self.current = current
+        self.version = version
+        self.source_version = source_version
+        self.checked_at = time.monotonic()
+
+
+_status: Dict[Tuple[str, str], _RollupStatus] = {}
+_status_lock = threading.Lock()
+
+
+def is_rollup_current(rollup: Rollup, db_name: str, db_session) -> bool:
+    """
+    True if the database of db_session (a BadAppleSession) has the rollup, built from the
+    current version of its source tables (checked at most every ROLLUP_CHECK_INTERVAL seconds
+    per process).
+    """
+    if not DB_ROLLUPS_ENABLED:
+        return False
+    key = (db_name, rollup.table)
+    status = _status.get(key)
+    if status is None or time.monotonic() - status.checked_at > ROLLUP_CHECK_INTERVAL:
+        version = db_session.get_rollup_version(rollup.table)
+        source_version: Optional[str] = None
+        if version is not None:
+            source_version = db_session.get_rollup_source_version(rollup)
+        # (without its source tables the rollup is the only copy of the data, see above)
+        current = version is not None and source_version in (None, version)
+        if version is not None and not current:
+            # (also on the first check: a rollup which is already stale when the process
+            # starts must not go unnoticed, where it is required its routes answer 503)
+            if status is None or status.current:
+                logger.warning(
+                    f"{rollup.table} rollup of {db_name} is stale (built from "
+                    f"{version}, source tables are now {source_version}), it is not used"
+                )
+        elif status is not None and status.current and not current:
+            logger.warning(
+                f"{rollup.table} rollup of {db_name} is missing, using the live query"
+            )
+        status = _RollupStatus(current, version, source_version)
+        with _status_lock:
+            _status[key] = status
+    return status.current
+
+
+def reset_rollup_status():
+    with _status_lock:
+        _status.clear()
+
+
+def get_rollup_stats() -> Dict[str, dict]:
+    stats = {}
+    for (db_name, table), status in list(_status.items()):
+        stats.setdefault(db_name, {})[table] = {
+            "current": status.current,
+            "content_version": status.version,
+            "source_version": status.source_version,
+        }
+    return stats
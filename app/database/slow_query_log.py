@@ -0,0 +1,118 @@
+"""
+Description:
+Slow query log: statements which take longer than SLOW_QUERY_THRESHOLD ms are written to a
+rotating file (SLOW_QUERY_LOG_PATH), one JSON object per line with the database, statement and
+the BadAppleSession query builder, parameters, duration and number of rows. With
+SLOW_QUERY_EXPLAIN the EXPLAIN (ANALYZE, BUFFERS) plan of the query is included too, e.g. to
+find which scafids make the active assay details query degrade.
+
+Note that the plan is captured before the rows are returned (query hooks run in the request),
+so EXPLAIN roughly doubles the latency of the request which triggered it. This is why plans
+are captured at most once per statement per SLOW_QUERY_EXPLAIN_INTERVAL seconds.
+Streamed statements (":stream") are logged with the time until their first batch was fetched.
+
+Registered as a query hook of database/statements.py by init_slow_query_log.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from typing import Optional
+
+import psycopg2
+from config import (
+    SLOW_QUERY_EXPLAIN,
+    SLOW_QUERY_EXPLAIN_INTERVAL,
+    SLOW_QUERY_LOG_BACKUP_COUNT,
+    SLOW_QUERY_LOG_MAX_BYTES,
+    SLOW_QUERY_LOG_PATH,
+    SLOW_QUERY_THRESHOLD,
+)
+from database.statements import BoundStatement, add_query_hook, remove_query_hook
+
+_logger = logging.getLogger("badapple.slow_queries")
+_logger.setLevel(logging.INFO)
+# (not passed on to the root logger, i.e. only written to the file)
+_logger.propagate = False
+_handler = None
+
+_explained = {}  # statement name -> time its plan was last captured
+_explained_lock = threading.Lock()
+
+
+def _should_explain(name: str) -> bool:
+    now = time.monotonic()
+    with _explained_lock:
+        last = _explained.get(name)
+        if last is not None and now - last < SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        _explained[name] = now
+        return True
+
+
+def explain_query(connection, query: BoundStatement) -> list[str]:
+    """
+    EXPLAIN (ANALYZE, BUFFERS) plan of query (which is run again). Run in a savepoint so that
+    an error does not abort the transaction of the session.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SAVEPOINT slow_query_explain;")
+        try:
+            cursor.execute(
+                "EXPLAIN (ANALYZE, BUFFERS) " + query.statement.text, query.params
+            )
+            plan = [row[0] for row in cursor.fetchall()]
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain;")
+            plan = [f"error: {e}"]
+        cursor.execute("RELEASE SAVEPOINT slow_query_explain;")
+    return plan
+
+
+def log_slow_query(connection, query: BoundStatement, elapsed: float, n_rows: int):
+    """Query hook, logs query if it took longer than SLOW_QUERY_THRESHOLD ms."""
+    if elapsed * 1000 < SLOW_QUERY_THRESHOLD:
+        return
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "pid": os.getpid(),
+        "database": connection.info.dbname,
+        "statement": query.statement.name,
+        "builder": query.builder,
+        "params": query.params,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "n_rows": n_rows,
+    }
+    if SLOW_QUERY_EXPLAIN and _should_explain(query.statement.name):
+        entry["explain"] = explain_query(connection, query)
+    _logger.info(json.dumps(entry, default=str))
+
+
+def init_slow_query_log(path: Optional[str] = None):
+    """Write slow queries to path (default: SLOW_QUERY_LOG_PATH), rotated by size."""
+    global _handler
+    path = path or SLOW_QUERY_LOG_PATH
+    if _handler is None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # (delay: the file is opened on the first slow query, i.e. by each gunicorn worker)
+        _handler = logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=SLOW_QUERY_LOG_BACKUP_COUNT,
+            delay=True,
+        )
+        _handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(_handler)
+    add_query_hook(log_slow_query)
+
+
+def close_slow_query_log():
+    global _handler
+    remove_query_hook(log_slow_query)
+    if _handler is not None:
+        _logger.removeHandler(_handler)
+        _handler.close()
+        _handler = None
@@ -0,0 +1,482 @@
+"""
+Description:
+Read-only, in-memory snapshot of the scaffold table, used to answer scaffold lookups
+(by SMILES or ID) without querying the database.
+
+The table is stored column-wise in NumPy arrays: numeric/boolean columns as fixed-width arrays
+(+ a null mask if needed) and text columns as one UTF-8 blob + offsets. Lookups use sorted
+arrays (64-bit hash of scafsmi -> row, id -> row) rather than Python dicts, so the snapshot
+holds almost no Python objects: when it is loaded before gunicorn forks its workers (--preload)
+the pages stay shared between workers (copy-on-write) instead of being copied by refcounting.
+
+Snapshots can also be saved to a file (see database/build_snapshot.py) and memory-mapped by the
+API instead of being read from the database, e.g. for scoring-only replicas without a database
+container. The file layout is:
+    magic (8 bytes) | format version (uint32) | reserved (uint32) | header length (uint64)
+    | header (JSON) | arrays (each aligned to FILE_ALIGNMENT bytes)
+The header holds the DB name/version stamp, column names/types, the dtype/shape/offset of every
+array and a SHA-256 checksum of the arrays. Arrays are NumPy views of the (read-only) mapping,
+so pages are only loaded when first accessed and are shared by all processes through the page cache.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from database.pool import connect
+from loguru import logger
+
+INT = "int64"
+FLOAT = "float64"
+BOOL = "bool"
+STR = "str"
+
+FILE_MAGIC = b"BADAPSNP"
+FILE_FORMAT_VERSION = 1
+FILE_ALIGNMENT = 64
+FILE_EXTENSION = ".snapshot"
+_FILE_PREAMBLE = struct.Struct(
+    "<8sIIQ"
+)  # magic, format version, reserved, header length
+
+
+class SnapshotFileError(Exception):
+    """Snapshot file is invalid (corrupt, truncated, unsupported format or stale)."""
+
+
+def hash_scafsmi(scafsmi: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(scafsmi.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def _infer_column_type(values: list) -> str:
+    column_type = None
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value_type = BOOL
+        elif isinstance(value, int):
+            value_type = INT
+        elif isinstance(value, (float, Decimal)):
+            value_type = FLOAT
+        else:
+            return STR
+        if column_type is None or (column_type, value_type) == (INT, FLOAT):
+            column_type = value_type
+        elif value_type != column_type and (column_type, value_type) != (FLOAT, INT):
+            return STR
+    return column_type or STR
+
+
+class ScaffoldSnapshot:
+    """
+    Column-oriented copy of the scaffold table.
+
+    arrays maps names to NumPy arrays:
+    - "<column>" for int64/float64/bool columns, "<column>.null" for their null masks (if any)
+    - "<column>.offsets" + "<column>.data" for text columns
+      (value of row i is data[offsets[i]:offsets[i + 1]], null if "<column>.null")
+    - "index.scafsmi_hash"/"index.scafsmi_row": hashes of scafsmi (sorted) and their rows
+    - "index.id"/"index.id_row": scaffold IDs (sorted) and their rows
+    """
+
+    def __init__(
+        self,
+        column_names: List[str],
+        column_types: Dict[str, str],
+        arrays: Dict[str, np.ndarray],
+        db_version: Optional[str] = None,
+        release: Optional[str] = None,
+        source: str = "database",
+    ):
+        self.column_names = column_names
+        self.column_types = column_types
+        self.arrays = arrays
+        self.db_version = db_version
+        # optional label of the database release (set when building snapshot files)
+        self.release = release
+        # "database" or the path of the snapshot file
+        self.source = source
+        self.n_rows = len(arrays["index.id"])
+
+    @classmethod
+    def from_columns(
+        cls,
+        column_names: List[str],
+        columns: Dict[str, list],
+        db_version: Optional[str] = None,
+    ) -> "ScaffoldSnapshot":
+        """Build a snapshot from lists of (Python) values, one list per column."""
+        arrays = {}
+        column_types = {}
+        for name in column_names:
+            values = columns[name]
+            column_type = _infer_column_type(values)
+            column_types[name] = column_type
+            null = np.fromiter(
+                (v is None for v in values), dtype=bool, count=len(values)
+            )
+            if null.any():
+                arrays[f"{name}.null"] = null
+            if column_type == STR:
+                encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                np.cumsum([len(b) for b in encoded], out=offsets[1:])
+                arrays[f"{name}.offsets"] = offsets
+                arrays[f"{name}.data"] = np.frombuffer(
+                    b"".join(encoded), dtype=np.uint8
+                )
+            else:
+                fill = False if column_type == BOOL else 0
+                arrays[name] = np.array(
+                    [fill if v is None else v for v in values], dtype=column_type
+                )
+
+        scafsmi_hash = np.fromiter(
+            (hash_scafsmi(s) for s in columns["scafsmi"]),
+            dtype=np.uint64,
+            count=len(columns["scafsmi"]),
+        )
+        # stable: rows with the same hash stay in table order
+        order = np.argsort(scafsmi_hash, kind="stable")
+        arrays["index.scafsmi_hash"] = scafsmi_hash[order]
+        arrays["index.scafsmi_row"] = order.astype(np.int64)
+        ids = np.array(columns["id"], dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        arrays["index.id"] = ids[order]
+        arrays["index.id_row"] = order.astype(np.int64)
+        return cls(column_names, column_types, arrays, db_version)
+
+    def memory_usage(self) -> int:
+        """Number of bytes used by the snapshot's arrays."""
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def stats(self) -> dict:
+        return {
+            "rows": self.n_rows,
+            "memory_bytes": self.memory_usage(),
+            "db_version": self.db_version,
+            "release": self.release,
+            "source": self.source,
+        }
+
+    def _get_value(self, name: str, row: int):
+        null = self.arrays.get(f"{name}.null")
+        if null is not None and null[row]:
+            return None
+        column_type = self.column_types[name]
+        if column_type == STR:
+            offsets = self.arrays[f"{name}.offsets"]
+            data = self.arrays[f"{name}.data"][offsets[row] : offsets[row + 1]]
+            return data.tobytes().decode("utf-8")
+        value = self.arrays[name][row]
+        if column_type == BOOL:
+            return bool(value)
+        if column_type == INT:
+            return int(value)
+        return float(value)
+
+    def get_row(self, row: int) -> dict:
+        """Row as a dict (same keys/order as "SELECT * from scaffold")."""
+        return {name: self._get_value(name, row) for name in self.column_names}
+
+    def _find_row_by_smiles(self, scafsmi: str) -> Optional[int]:
+        hashes = self.arrays["index.scafsmi_hash"]
+        rows = self.arrays["index.scafsmi_row"]
+        h = np.uint64(hash_scafsmi(scafsmi))
+        i = int(np.searchsorted(hashes, h))
+        # verify the SMILES itself (hash collisions)
+        while i < len(hashes) and hashes[i] == h:
+            if self._get_value("scafsmi", rows[i]) == scafsmi:
+                return int(rows[i])
+            i += 1
+        return None
+
+    def get_by_smiles(self, scafsmi: str) -> Optional[dict]:
+        row = self._find_row_by_smiles(scafsmi)
+        return self.get_row(row) if row is not None else None
+
+    def get_many_by_smiles(self, scafsmi_list: Iterable[str]) -> Dict[str, dict]:
+        """Maps each scafsmi found in the snapshot to its row (others are omitted)."""
+        result = {}
+        for scafsmi in scafsmi_list:
+            if scafsmi is None or scafsmi in result:
+                continue
+            row = self._find_row_by_smiles(scafsmi)
+            if row is not None:
+                result[scafsmi] = self.get_row(row)
+        return result
+
+    def get_by_id(self, scafid: int) -> Optional[dict]:
+        ids = self.arrays["index.id"]
+        i = int(np.searchsorted(ids, scafid))
+        if i < len(ids) and ids[i] == scafid:
+            return self.get_row(int(self.arrays["index.id_row"][i]))
+        return None
+
+
+def _align(n: int) -> int:
+    return -(-n // FILE_ALIGNMENT) * FILE_ALIGNMENT
+
+
+def _iter_file_data(snapshot: ScaffoldSnapshot, layout: Dict[str, dict]):
+    """Chunks of bytes of the data section (arrays + zero padding between them)."""
+    position = 0
+    for name, array in snapshot.arrays.items():
+        offset = layout[name]["offset"]
+        if offset > position:
+            yield bytes(offset - position)
+        data = memoryview(np.ascontiguousarray(array)).cast("B")
+        yield data
+        position = offset + len(data)
+
+
+def save_snapshot_file(
+    snapshot: ScaffoldSnapshot, path: str, db_name: str, release: Optional[str] = None
+):
+    """
+    Write snapshot to path (see module docstring for the layout).
+    The file is written to a temporary file first and then renamed, so a running API
+    never sees a partially written file.
+    """
+    layout = {}
+    position = 0
+    for name, array in snapshot.arrays.items():
+        position = _align(position)
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": position,
+        }
+        position += array.nbytes
+    checksum = hashlib.sha256()
+    for chunk in _iter_file_data(snapshot, layout):
+        checksum.update(chunk)
+    header = json.dumps(
+        {
+            "db_name": db_name,
+            "db_version": snapshot.db_version,
+            "release": release,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "n_rows": snapshot.n_rows,
+            "column_names": snapshot.column_names,
+            "column_types": snapshot.column_types,
+            "arrays": layout,
+            "data_size": position,
+            "checksum": checksum.hexdigest(),
+        }
+    ).encode("utf-8")
+    preamble = _FILE_PREAMBLE.pack(FILE_MAGIC, FILE_FORMAT_VERSION, 0, len(header))
+    data_start = _align(len(preamble) + len(header))
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(preamble)
+            f.write(header)
+            f.write(bytes(data_start - len(preamble) - len(header)))
+            for chunk in _iter_file_data(snapshot, layout):
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_snapshot_file_header(path: str) -> dict:
+    """Header of a snapshot file (+ "data_start", the offset of the arrays)."""
+    with open(path, "rb") as f:
+        preamble = f.read(_FILE_PREAMBLE.size)
+        if len(preamble) < _FILE_PREAMBLE.size:
+            raise SnapshotFileError(f"{path} is not a snapshot file (too short)")
+        magic, format_version, _, header_size = _FILE_PREAMBLE.unpack(preamble)
+        if magic != FILE_MAGIC:
+            raise SnapshotFileError(f"{path} is not a snapshot file")
+        if format_version != FILE_FORMAT_VERSION:
+            raise SnapshotFileError(
+                f"{path} has format version {format_version}, expected {FILE_FORMAT_VERSION}"
+            )
+        header_bytes = f.read(header_size)
+    try:
+        header = json.loads(header_bytes.decode("utf-8"))
+    except ValueError as e:
+        raise SnapshotFileError(f"{path} has an invalid header: {e}")
+    header["data_start"] = _align(_FILE_PREAMBLE.size + header_size)
+    return header
+
+
+def open_snapshot_file(
+    path: str,
+    db_name: Optional[str] = None,
+    db_version: Optional[str] = None,
+    release: Optional[str] = None,
+    verify_checksum: bool = True,
+) -> ScaffoldSnapshot:
+    """
+    Memory-map a snapshot file written by save_snapshot_file.
+    Raises SnapshotFileError if the file is invalid or does not match the given
+    db_name/db_version/release (stale file).
+    """
+    header = read_snapshot_file_header(path)
+    for key, expected in (
+        ("db_name", db_name),
+        ("db_version", db_version),
+        ("release", release),
+    ):
+        if expected is not None and header[key] != expected:
+            raise SnapshotFileError(
+                f"{path} has {key} {header[key]!r}, expected {expected!r}"
+            )
+    data_start = header["data_start"]
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(buffer) != data_start + header["data_size"]:
+        buffer.close()
+        raise SnapshotFileError(f"{path} is truncated or has trailing data")
+    if verify_checksum:
+        with memoryview(buffer) as view:
+            checksum = hashlib.sha256(view[data_start:]).hexdigest()
+        if checksum != header["checksum"]:
+            buffer.close()
+            raise SnapshotFileError(f"{path} is corrupt (checksum mismatch)")
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        arrays[name] = np.frombuffer(
+            buffer,
+            dtype=np.dtype(spec["dtype"]),
+            count=int(np.prod(shape)),
+            offset=data_start + spec["offset"],
+        ).reshape(shape)
+    # (arrays keep a reference to the mapping, it is unmapped once they are all gone)
+    return ScaffoldSnapshot(
+        header["column_names"],
+        header["column_types"],
+        arrays,
+        header["db_version"],
+        release=header["release"],
+        source=path,
+    )
+
+
+def get_snapshot_file_path(snapshot_dir: str, db_name: str) -> str:
+    return os.path.join(snapshot_dir, db_name + FILE_EXTENSION)
+
+
+def _get_live_db_version(db_name: str) -> str:
+    # imported here to avoid a circular import (badapple.py uses the snapshots)
+    from database.badapple import BadAppleSession
+
+    with BadAppleSession(db_name, pooled=False) as db_session:
+        return db_session.get_db_version()
+
+
+def load_scaffold_snapshot_file(
+    db_name: str, snapshot_dir: str, release: Optional[str] = None
+) -> ScaffoldSnapshot:
+    """
+    Open the snapshot file of db_name in snapshot_dir. If a release is given, the file
+    must have been built for it (no database is needed), otherwise its DB version stamp
+    must match the live database.
+    """
+    start = time.monotonic()
+    path = get_snapshot_file_path(snapshot_dir, db_name)
+    if release:
+        snapshot = open_snapshot_file(path, db_name=db_name, release=release)
+    else:
+        try:
+            db_version = _get_live_db_version(db_name)
+        except Exception as e:
+            raise SnapshotFileError(
+                f"Cannot check that {path} is up to date (database unavailable: {e}), "
+                "set SCAFFOLD_SNAPSHOT_RELEASE to use it without a database"
+            )
+        snapshot = open_snapshot_file(path, db_name=db_name, db_version=db_version)
+    logger.info(
+        f"Opened scaffold snapshot file {path}: {snapshot.n_rows} rows, "
+        f"{snapshot.memory_usage() / 2**20:.1f} MiB, {time.monotonic() - start:.2f}s"
+    )
+    return snapshot
+
+
+def load_scaffold_snapshot(db_name: str, fetch_size: int = 50_000) -> ScaffoldSnapshot:
+    """Read the whole scaffold table of db_name into a ScaffoldSnapshot."""
+    start = time.monotonic()
+    db_version = _get_live_db_version(db_name)
+    connection = connect(db_name)
+    try:
+        # server-side cursor, so rows are fetched in chunks rather than all at once
+        with connection.cursor(name="scaffold_snapshot") as cursor:
+            cursor.execute("SELECT * FROM scaffold ORDER BY id;")
+            columns = None
+            while True:
+                chunk = cursor.fetchmany(fetch_size)
+                if columns is None:
+                    # (description of a server-side cursor is only set after the first fetch)
+                    column_names = [column[0] for column in cursor.description]
+                    columns = {name: [] for name in column_names}
+                if len(chunk) == 0:
+                    break
+                for name, values in zip(column_names, zip(*chunk)):
+                    columns[name].extend(values)
+    finally:
+        connection.close()
+    snapshot = ScaffoldSnapshot.from_columns(column_names, columns, db_version)
+    logger.info(
+        f"Loaded scaffold snapshot of {db_name}: {snapshot.n_rows} rows, "
+        f"{snapshot.memory_usage() / 2**20:.1f} MiB, {time.monotonic() - start:.1f}s"
+    )
+    return snapshot
+
+
+_snapshots: Dict[str, ScaffoldSnapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def load_scaffold_snapshots(
+    db_names: Iterable[str],
+    snapshot_dir: Optional[str] = None,
+    release: Optional[str] = None,
+):
+    """
+    Load snapshots for the given databases, from the files in snapshot_dir if given
+    (see load_scaffold_snapshot_file) or else from the databases themselves.
+    Call this before gunicorn forks its workers (i.e., at app creation with --preload)
+    so all workers share the same memory.
+    """
+    for db_name in db_names:
+        if snapshot_dir:
+            snapshot = load_scaffold_snapshot_file(db_name, snapshot_dir, release)
+        else:
+            snapshot = load_scaffold_snapshot(db_name)
+        with _snapshots_lock:
+            _snapshots[db_name] = snapshot
+
+
+def set_scaffold_snapshot(db_name: str, snapshot: Optional[ScaffoldSnapshot]):
+    with _snapshots_lock:
+        if snapshot is None:
+            _snapshots.pop(db_name, None)
+        else:
+            _snapshots[db_name] = snapshot
+
+
+def get_scaffold_snapshot(db_name: str) -> Optional[ScaffoldSnapshot]:
+    return _snapshots.get(db_name)
+
+
+def get_snapshot_stats() -> Dict[str, dict]:
+    return {db_name: snapshot.stats() for db_name, snapshot in _snapshots.items()}
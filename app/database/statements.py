@@ -0,0 +1,205 @@
+"""
+Description:
+Query shapes used by BadAppleSession, executed as server-side prepared statements.
+
+Each Statement is a query with named parameters (%(name)s). On pooled connections it is
+PREPAREd once per connection (Postgres parses/plans it once) and then run with
+"EXECUTE <name>(<values>)"; on short-lived connections (where a PREPARE would cost an extra
+round-trip for a single use) the query is run directly with bound parameters.
+Large results can instead be streamed from a named (server-side) cursor with iter_statement.
+Timings of every statement are counted per process (see get_statement_stats) and passed to
+the query hooks (see add_query_hook, e.g. the slow query log).
+"""
+
+import itertools
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+import psycopg2.extensions
+import psycopg2.extras
+from config import DB_PREPARED_STATEMENTS_ENABLED
+
+_PARAM_PATTERN = re.compile(r"%\((\w+)\)s")
+
+
+class BadAppleConnection(psycopg2.extensions.connection):
+    """Connection which remembers the statements prepared in its (server) session."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+class Statement:
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.param_names = list(dict.fromkeys(_PARAM_PATTERN.findall(text)))
+        positions = {name: i + 1 for i, name in enumerate(self.param_names)}
+        self.prepare_sql = f"PREPARE {name} AS " + _PARAM_PATTERN.sub(
+            lambda match: f"${positions[match.group(1)]}", text
+        )
+        if self.param_names:
+            placeholders = ", ".join(f"%({p})s" for p in self.param_names)
+            self.execute_sql = f"EXECUTE {name} ({placeholders});"
+        else:
+            self.execute_sql = f"EXECUTE {name};"
+
+    def bind(self, **params) -> "BoundStatement":
+        return BoundStatement(self, params)
+
+
+class BoundStatement:
+    """A Statement with the values of its parameters."""
+
+    def __init__(self, statement: Statement, params: dict):
+        self.statement = statement
+        self.params = params
+        self.builder = (
+            None  # name of the function which built it (set by BadAppleSession)
+        )
+
+    def __repr__(self):
+        return f"BoundStatement({self.statement.name}, {self.params!r})"
+
+
+class _StatementStats:
+    __slots__ = ("calls", "total_time", "max_time", "prepares", "prepare_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.prepares = 0
+        self.prepare_time = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "total_ms": round(self.total_time * 1000, 3),
+            "mean_ms": round(self.total_time * 1000 / max(self.calls, 1), 3),
+            "max_ms": round(self.max_time * 1000, 3),
+            "prepares": self.prepares,
+            "prepare_ms": round(self.prepare_time * 1000, 3),
+        }
+
+
+_stats: Dict[str, _StatementStats] = {}
+_stats_lock = threading.Lock()
+
+
+def _get_stats(name: str) -> _StatementStats:
+    stats = _stats.get(name)
+    if stats is None:
+        with _stats_lock:
+            stats = _stats.setdefault(name, _StatementStats())
+    return stats
+
+
+def _record_time(name: str, elapsed: float):
+    stats = _get_stats(name)
+    with _stats_lock:
+        stats.calls += 1
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+
+
+# functions called after every statement with (connection, query, elapsed seconds, number of rows)
+_query_hooks: List[Callable] = []
+
+
+def add_query_hook(hook: Callable):
+    if hook not in _query_hooks:
+        _query_hooks.append(hook)
+
+
+def remove_query_hook(hook: Callable):
+    if hook in _query_hooks:
+        _query_hooks.remove(hook)
+
+
+def _finish_query(
+    connection, query: BoundStatement, name: str, elapsed: float, n_rows: int
+):
+    _record_time(name, elapsed)
+    for hook in _query_hooks:
+        hook(connection, query, elapsed, n_rows)
+
+
+def _prepare(cursor, statement: Statement, prepared: set):
+    start = time.perf_counter()
+    cursor.execute(statement.prepare_sql)
+    elapsed = time.perf_counter() - start
+    # (prepared statements are not transactional: a later rollback does not remove them)
+    prepared.add(statement.name)
+    stats = _get_stats(statement.name)
+    with _stats_lock:
+        stats.prepares += 1
+        stats.prepare_time += elapsed
+
+
+def execute_statement(cursor, query: BoundStatement, prepare: bool) -> List[Dict]:
+    """
+    Run query with cursor and return all rows. If prepare is True (and the connection is a
+    BadAppleConnection) the statement is prepared on the connection first if needed.
+    """
+    statement = query.statement
+    prepared: Optional[set] = getattr(cursor.connection, "prepared_statements", None)
+    use_prepared = (
+        prepare and DB_PREPARED_STATEMENTS_ENABLED and isinstance(prepared, set)
+    )
+    if use_prepared and statement.name not in prepared:
+        _prepare(cursor, statement, prepared)
+    start = time.perf_counter()
+    if use_prepared:
+        cursor.execute(statement.execute_sql, query.params)
+    else:
+        cursor.execute(statement.text, query.params)
+    rows = cursor.fetchall()
+    _finish_query(
+        cursor.connection,
+        query,
+        statement.name,
+        time.perf_counter() - start,
+        len(rows),
+    )
+    return rows
+
+
+_cursor_ids = itertools.count()
+
+
+def iter_statement(connection, query: BoundStatement, itersize: int) -> Iterator[Dict]:
+    """
+    Yield the rows of query from a named (server-side) cursor, which fetches itersize rows
+    per round-trip, so only one batch of rows is held in memory at a time.
+    (A cursor can't be declared for an EXECUTE, so the query is not a prepared statement.)
+    The duration passed to the query hooks is the time until the first batch was fetched,
+    the time until the last row was consumed depends on the client.
+    """
+    statement = query.statement
+    n_rows = 0
+    elapsed = None
+    start = time.perf_counter()
+    with connection.cursor(
+        name=f"stream_{statement.name}_{next(_cursor_ids)}",
+        cursor_factory=psycopg2.extras.RealDictCursor,
+    ) as cursor:
+        cursor.itersize = itersize
+        cursor.execute(statement.text, query.params)
+        for row in cursor:
+            if elapsed is None:
+                elapsed = time.perf_counter() - start
+            n_rows += 1
+            yield row
+    if elapsed is None:  # no rows
+        elapsed = time.perf_counter() - start
+    # (counted separately: a first fetch is not comparable with a fetchall)
+    _finish_query(connection, query, f"{statement.name}:stream", elapsed, n_rows)
+
+
+def get_statement_stats() -> Dict[str, dict]:
+    with _stats_lock:
+        return {name: stats.as_dict() for name, stats in _stats.items()}
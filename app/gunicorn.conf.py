@@ -0,0 +1,26 @@
+"""
+Description:
+gunicorn hooks, loaded automatically when gunicorn is started from the app directory
+(settings such as the number of workers are given on the command line).
+
+If PROMETHEUS_MULTIPROC_DIR is set, each worker writes its metrics to files in that directory,
+which /metrics aggregates (see utils/metrics.py). The directory is emptied at startup, and the
+files of exited workers are marked dead (so their gauges are no longer reported).
+"""
+
+import glob
+import os
+
+_multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if _multiproc_dir:
+    # (here rather than in on_starting, which runs after the app was loaded with --preload)
+    os.makedirs(_multiproc_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(_multiproc_dir, "*.db")):
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    if _multiproc_dir:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -7,6 +7,7 @@ Note here that I'm just checking that the structure of results fetched by the AP
 Verifying that the DBs themselves are "accurate" is part of the DB construction.
 """
 
+import json
 from typing import Union
 
 from tests.helpers import validate_scaffold_keys
@@ -512,3 +513,43 @@ class TestGetAssociatedScaffoldsOrdered:
             database="badapple_classic",
             method="POST",
         )
+
+    def test_get_associated_scaffolds_ordered_stream(self, test_client, url_prefix):
+        """Test that streamed (NDJSON) output matches the regular JSON output."""
+        url = f"{url_prefix}/compound_search/get_associated_scaffolds_ordered"
+        smiles = [
+            "CN1C(=O)N(C)C(=O)C(N(C)C=N2)=C12",
+            "asdnasjd",
+            "COc1cc2c(ccnc2cc1)C(O)C4CC(CC3)C(C=C)CN34",
+        ] * 5
+        names = [f"compound_{i}" for i in range(len(smiles))]
+        expected = test_client.post(url, json={"SMILES": smiles, "Names": names})
+        assert expected.status_code == 200
+
+        for response in [
+            test_client.post(
+                url, json={"SMILES": smiles, "Names": names, "stream": True}
+            ),
+            test_client.post(
+                url,
+                json={"SMILES": smiles, "Names": names},
+                headers={"Accept": "application/x-ndjson"},
+            ),
+        ]:
+            assert response.status_code == 200
+            assert response.mimetype == "application/x-ndjson"
+            lines = response.get_data(as_text=True).splitlines()
+            assert [json.loads(line) for line in lines] == expected.get_json()
+
+    def test_get_associated_scaffolds_ordered_stream_get(self, test_client, url_prefix):
+        """Test streamed output with GET."""
+        url = f"{url_prefix}/compound_search/get_associated_scaffolds_ordered"
+        smiles = "CN1C(=O)N(C)C(=O)C(N(C)C=N2)=C12,asdnasjd"
+        response = test_client.get(f"{url}?SMILES={smiles}&stream=true")
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        data = [
+            json.loads(line) for line in response.get_data(as_text=True).splitlines()
+        ]
+        assert [entry["molecule_smiles"] for entry in data] == smiles.split(",")
+        assert data[1]["error_msg"] == "Invalid SMILES, please check input"
@@ -0,0 +1,70 @@
+"""
+Description:
+Functional tests for jobs blueprint endpoints.
+Jobs are not processed here (the job runner is not started when testing, see test_job_runner.py
+in tests/unit for the processing itself).
+"""
+
+import io
+
+import pytest
+import utils.jobs
+from utils.jobs import JobStore
+
+INPUT_CSV = "smiles,name\nCCC,propane\nc1ccccc1CC1CCNCC1,mol_1\n"
+
+
+@pytest.fixture
+def job_store(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path))
+    monkeypatch.setattr(utils.jobs, "_store", store)
+    return store
+
+
+def submit(test_client, url_prefix, content: str, filename="input.csv", **form):
+    data = {"file": (io.BytesIO(content.encode()), filename)}
+    data.update(form)
+    return test_client.post(
+        f"{url_prefix}/jobs/submit", data=data, content_type="multipart/form-data"
+    )
+
+
+def test_submit_job(test_client, url_prefix, job_store):
+    response = submit(test_client, url_prefix, INPUT_CSV, iheader="true")
+    assert response.status_code == 202
+    data = response.get_json()
+    assert data["status"] == "queued"
+    assert data["filename"] == "input.csv"
+    job = job_store.get_job(data["job_id"])
+    assert job["idelim"] == ","  # inferred from file extension
+    assert job["iheader"] == 1
+
+    response = test_client.get(f"{url_prefix}/jobs/get_status?job_id={data['job_id']}")
+    assert response.status_code == 200
+    assert response.get_json()["job_id"] == data["job_id"]
+
+    # result is not available until the job is done
+    response = test_client.get(f"{url_prefix}/jobs/get_result?job_id={data['job_id']}")
+    assert response.status_code == 409
+
+
+def test_submit_job_invalid(test_client, url_prefix, job_store):
+    response = test_client.post(
+        f"{url_prefix}/jobs/submit", data={}, content_type="multipart/form-data"
+    )
+    assert response.status_code == 400
+    # only 2 columns in input
+    response = submit(test_client, url_prefix, INPUT_CSV, name_column="2")
+    assert response.status_code == 400
+    response = submit(test_client, url_prefix, INPUT_CSV, max_rings="11")
+    assert response.status_code == 400
+    response = submit(test_client, url_prefix, INPUT_CSV, database="not_a_db")
+    assert response.status_code == 400
+    assert job_store.claim_job("test", max_running=1) is None
+
+
+def test_job_not_found(test_client, url_prefix, job_store):
+    response = test_client.get(f"{url_prefix}/jobs/get_status?job_id={'0' * 32}")
+    assert response.status_code == 404
+    response = test_client.get(f"{url_prefix}/jobs/get_status?job_id=../jobs.db")
+    assert response.status_code == 400
@@ -7,6 +7,8 @@ Note here that I'm just checking that the structure of results fetched by the AP
 Verifying that the DBs themselves are "accurate" is part of the DB construction.
 """
 
+import json
+
 import pytest
 from tests.helpers import (
     validate_active_assay_details_keys,
@@ -151,6 +153,32 @@ class TestGetAssociatedCompounds(ScaffoldSearchTestBase):
             test_client, url_prefix, scafid=scafid, database="badapple_classic"
         )
 
+    def test_get_associated_compounds_stream(self, test_client, url_prefix):
+        """Test that streamed (NDJSON) output matches the regular JSON output."""
+        url = self.build_url(url_prefix, scafid=1)
+        expected = test_client.get(url)
+        assert expected.status_code == 200
+        response = test_client.get(f"{url}&stream=true")
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line) for line in lines] == expected.get_json()
+
+    def test_get_associated_compounds_paginated(self, test_client, url_prefix):
+        """Test that paging through the compounds returns all of them (ordered by CID)."""
+        url = self.build_url(url_prefix, scafid=1)
+        expected = test_client.get(url).get_json()
+        pages = []
+        response = test_client.get(f"{url}&limit=2")
+        while True:
+            assert response.status_code == 200
+            pages.extend(response.get_json())
+            next_cursor = response.headers.get("X-Next-Cursor")
+            if next_cursor is None:
+                break
+            response = test_client.get(f"{url}&limit=2&after_cid={next_cursor}")
+        assert pages == sorted(expected, key=lambda d: d["cid"])
+
 
 @pytest.mark.requires_activity
 class TestGetAssociatedAssayIDs(ScaffoldSearchTestBase):
@@ -263,3 +291,53 @@ class TestGetAssociatedDrugs(ScaffoldSearchTestBase):
             database="badapple_classic",
             status_code=400,
         )
+
+
+class TestBatchEndpoints:
+    """Functional tests for the batch (list of scafids) endpoints."""
+
+    scafids = [1, 2, 10**9, 1]  # (10**9 not in DB, duplicate 1)
+
+    @pytest.mark.parametrize(
+        "endpoint,key,default",
+        [
+            ("get_scaffold_info", "scaffold", None),
+            ("get_active_targets", "targets", []),
+            ("get_active_assay_details", "assay_details", []),
+            ("get_associated_drugs", "drugs", []),
+        ],
+    )
+    def test_batch_matches_single(
+        self, test_client, url_prefix, endpoint, key, default
+    ):
+        """Test that batch results (GET and POST) match those of the single endpoint."""
+        url = f"{url_prefix}/scaffold_search/{endpoint}"
+        expected = []
+        for scafid in [1, 2, 10**9]:
+            response = test_client.get(f"{url}?scafid={scafid}")
+            assert response.status_code == 200
+            result = response.get_json()
+            if key != "scaffold":
+                result = sorted(result, key=json.dumps)
+            expected.append({"scafid": scafid, key: result})
+
+        scafids_str = ",".join(map(str, self.scafids))
+        for response in [
+            test_client.get(f"{url}_batch?scafids={scafids_str}"),
+            test_client.post(f"{url}_batch", json={"scafids": self.scafids}),
+        ]:
+            assert response.status_code == 200
+            data = response.get_json()
+            if key != "scaffold":
+                for d in data:
+                    d[key] = sorted(d[key], key=json.dumps)
+            assert data == expected
+
+    def test_batch_invalid(self, test_client, url_prefix):
+        url = f"{url_prefix}/scaffold_search/get_associated_drugs_batch"
+        assert test_client.get(url).status_code == 400
+        assert test_client.get(f"{url}?scafids=1,abc").status_code == 400
+        too_many = ",".join(["1"] * 1001)
+        assert test_client.get(f"{url}?scafids={too_many}").status_code == 400
+        response = test_client.get(f"{url}?scafids=1&database=badapple_classic")
+        assert response.status_code == 400
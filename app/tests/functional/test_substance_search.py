@@ -51,3 +51,27 @@ class TestGetAssayOutcomes:
     def test_get_assay_outcomes_database_parameter(self, test_client, url_prefix):
         SID = 842121
         self.run_test(test_client, url_prefix, SID, database="badapple_classic")
+
+    @pytest.mark.parametrize("output_format", ["columns", "rle"])
+    def test_get_assay_outcomes_compact_format(
+        self, test_client, url_prefix, output_format
+    ):
+        """Test that compact formats contain the same outcomes as the rows."""
+        SID = 842121
+        url = f"{url_prefix}/substance_search/get_assay_outcomes?SID={SID}"
+        rows = test_client.get(url).get_json()
+        response = test_client.get(f"{url}&format={output_format}")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["aids"] == sorted(data["aids"])
+        if output_format == "rle":
+            outcomes = [value for value, n in data["outcome_runs"] for _ in range(n)]
+        else:
+            outcomes = data["outcomes"]
+        assert sorted(zip(data["aids"], outcomes)) == sorted(
+            (row["aid"], row["outcome"]) for row in rows
+        )
+
+    def test_get_assay_outcomes_invalid_format(self, test_client, url_prefix):
+        url = f"{url_prefix}/substance_search/get_assay_outcomes?SID=842121&format=xml"
+        assert test_client.get(url).status_code == 400
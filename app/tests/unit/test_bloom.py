@@ -0,0 +1,81 @@
+"""
+Description:
+Tests for the Bloom filter over scaffold SMILES (no database is required).
+"""
+
+from unittest.mock import patch
+
+import database.bloom
+from database.badapple import BadAppleSession
+from database.bloom import ScaffoldBloomFilter, set_bloom_filter
+
+IN_DB = [f"C1CC{i}CC1" for i in range(5000)]
+NOT_IN_DB = [f"c1ccc{i}cc1" for i in range(5000)]
+
+
+def test_bloom_filter():
+    """
+    GIVEN a Bloom filter built from scaffold SMILES
+    WHEN SMILES are checked against it
+    THEN all SMILES it was built from may be present (no false negatives)
+    AND the false positive rate is close to the configured one
+    """
+    bloom_filter = ScaffoldBloomFilter.from_scafsmi(IN_DB, fp_rate=0.01)
+    assert bloom_filter.filter_candidates(IN_DB) == IN_DB
+    n_false_positives = len(bloom_filter.filter_candidates(NOT_IN_DB))
+    assert n_false_positives < 0.02 * len(NOT_IN_DB)
+    stats = bloom_filter.stats()
+    assert stats["checks"] == len(IN_DB) + len(NOT_IN_DB)
+    assert stats["queries_saved"] == len(NOT_IN_DB) - n_false_positives
+    # lower false positive rate -> more bits
+    assert (
+        ScaffoldBloomFilter.from_scafsmi(IN_DB, fp_rate=0.001).n_bits
+        > bloom_filter.n_bits
+    )
+
+
+def test_bloom_filter_file(tmp_path):
+    bloom_filter = ScaffoldBloomFilter.from_scafsmi(IN_DB, 0.01, db_version="v1")
+    path = str(tmp_path / "badapple2.bloom.npz")
+    bloom_filter.save(path)
+    loaded = ScaffoldBloomFilter.load(path)
+    assert loaded.db_version == "v1"
+    assert (loaded.bits == bloom_filter.bits).all()
+    assert loaded.filter_candidates(IN_DB) == IN_DB
+
+
+def test_session_uses_bloom_filter():
+    """
+    GIVEN a Bloom filter loaded for a database
+    WHEN scaffolds are looked up through BadAppleSession
+    THEN scaffolds which are definitely not in the DB are not queried
+    AND the filter is no longer used once the DB version changes
+    """
+    bloom_filter = ScaffoldBloomFilter.from_scafsmi(IN_DB[:10], 0.01, db_version="v1")
+    set_bloom_filter("badapple2", bloom_filter)
+    try:
+        with patch("database.badapple.connect"), patch(
+            "database.badapple.execute_query", return_value=[]
+        ) as query:
+            with BadAppleSession("badapple2", pooled=False) as db_session:
+                assert db_session.search_scaffold_by_smiles(NOT_IN_DB[0]) == []
+                assert query.call_count == 0
+                assert (
+                    db_session.search_scaffolds_by_smiles_batch(
+                        [IN_DB[0], NOT_IN_DB[0]]
+                    )
+                    == {}
+                )
+            # only the scaffold which may be in the DB was queried
+            assert query.call_count == 1
+            assert NOT_IN_DB[0] not in str(query.call_args)
+            assert bloom_filter.false_positives == 1
+
+            with patch.object(database.bloom, "DB_VERSION_CHECK_INTERVAL", -1):
+                with patch.object(BadAppleSession, "get_db_version", return_value="v2"):
+                    with BadAppleSession("badapple2", pooled=False) as db_session:
+                        db_session.search_scaffold_by_smiles(NOT_IN_DB[0])
+            assert query.call_count == 2
+        assert bloom_filter.stats()["stale"]
+    finally:
+        set_bloom_filter("badapple2", None)
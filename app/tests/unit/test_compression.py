@@ -0,0 +1,122 @@
+"""
+Description:
+Tests for the compression of responses (gzip, no optional packages are required).
+"""
+
+import gzip
+import io
+import json
+import zlib
+from unittest.mock import patch
+
+import pytest
+import utils.compression
+from flask import Flask, jsonify, send_file
+from utils.compression import init_compression, negotiate_encoding
+from utils.streaming import ndjson_response
+from werkzeug.http import parse_accept_header
+
+ROWS = [
+    {"scafsmi": "c1ccc2ncccc2c1", "pscore": 428, "nsub_tested": i} for i in range(500)
+]
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    init_compression(app)
+
+    @app.route("/json")
+    def json_route():
+        return jsonify(ROWS)
+
+    @app.route("/small")
+    def small_route():
+        return jsonify(ROWS[0])
+
+    @app.route("/ndjson")
+    def ndjson_route():
+        return ndjson_response(ROWS)
+
+    @app.route("/file")
+    def file_route():
+        data = "\n".join(json.dumps(row) for row in ROWS).encode()
+        return send_file(io.BytesIO(data), mimetype="text/tab-separated-values")
+
+    with app.test_client() as client:
+        yield client
+
+
+def test_buffered_response(client):
+    """
+    GIVEN a large JSON response
+    WHEN the client accepts gzip
+    THEN it is compressed, else it is sent as is
+    """
+    response = client.get("/json", headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.content_length == len(response.data)
+    assert json.loads(gzip.decompress(response.data)) == ROWS
+    assert response.content_length < len(json.dumps(ROWS)) / 10
+
+    for headers in [{}, {"Accept-Encoding": "gzip;q=0, identity"}]:
+        response = client.get("/json", headers=headers)
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert response.get_json() == ROWS
+
+
+def test_small_response(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.get_json() == ROWS[0]
+
+
+def test_streamed_response(client):
+    """
+    GIVEN a streamed (NDJSON) response
+    WHEN the client accepts gzip
+    THEN it is compressed as it is streamed, and each chunk can be decoded as soon as it arrives
+    """
+    response = client.get(
+        "/ndjson", headers={"Accept-Encoding": "gzip"}, buffered=False
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    decompressor = zlib.decompressobj(31)
+    chunks = iter(response.response)
+    first_line = decompressor.decompress(next(chunks))
+    assert json.loads(first_line) == ROWS[0]
+    rest = b"".join(decompressor.decompress(chunk) for chunk in chunks)
+    lines = (first_line + rest).decode().splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+    assert decompressor.eof
+
+
+def test_file_response(client):
+    response = client.get("/file", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Ranges" not in response.headers
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+    # byte ranges are served from the uncompressed file
+    response = client.get(
+        "/file", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-9"}
+    )
+    assert response.status_code == 206
+    assert "Content-Encoding" not in response.headers
+
+
+def test_negotiate_encoding():
+    with patch.object(utils.compression, "COMPRESSION_ENCODINGS", ["zstd", "gzip"]):
+        assert negotiate_encoding(parse_accept_header("gzip")) == "gzip"
+        assert negotiate_encoding(parse_accept_header("br, gzip;q=0.5")) == "gzip"
+        assert negotiate_encoding(parse_accept_header("br")) is None
+        assert negotiate_encoding(parse_accept_header("gzip;q=0")) is None
+        with patch.dict(
+            utils.compression._COMPRESSORS, {"zstd": utils.compression._GzipCompressor}
+        ):
+            # highest quality first, then our preference
+            assert negotiate_encoding(parse_accept_header("gzip, zstd")) == "zstd"
+            assert negotiate_encoding(parse_accept_header("gzip, zstd;q=0.5")) == "gzip"
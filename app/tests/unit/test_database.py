@@ -112,6 +112,50 @@ class TestBadAppleSessionMethods:
 
         assert result == "Error handled"
 
+    def test_search_scaffolds_by_smiles_batch(self, mock_session):
+        """Test that batch lookup dedupes input, chunks queries, and keys results by scafsmi."""
+        mock_session.cursor.fetchall.side_effect = [
+            [{"id": 1, "scafsmi": "c1ccncc1"}, {"id": 2, "scafsmi": "C1CCNCC1"}],
+            [],
+        ]
+
+        result = mock_session.search_scaffolds_by_smiles_batch(
+            ["c1ccncc1", "C1CCNCC1", "c1ccncc1", None, "C1CCOC1"], chunk_size=2
+        )
+
+        assert result == {
+            "c1ccncc1": {"id": 1, "scafsmi": "c1ccncc1"},
+            "C1CCNCC1": {"id": 2, "scafsmi": "C1CCNCC1"},
+        }
+        # 3 unique (non-null) scafsmi with chunk_size=2 -> 2 queries
+        assert mock_session.cursor.execute.call_count == 2
+
+    def test_search_scaffolds_by_smiles_batch_empty(self, mock_session):
+        assert mock_session.search_scaffolds_by_smiles_batch([]) == {}
+        mock_session.cursor.execute.assert_not_called()
+
+    def test_search_scaffolds_by_ids(self, mock_session):
+        mock_session.cursor.fetchall.return_value = [{"id": 3, "scafsmi": "C1CCNCC1"}]
+        assert mock_session.search_scaffolds_by_ids([3, 4]) == {
+            3: {"id": 3, "scafsmi": "C1CCNCC1"}
+        }
+        assert mock_session.cursor.execute.call_count == 1
+
+    def test_batch_query_grouped_by_scafid(self, mock_session):
+        """Test that rows of batch queries are grouped by scafid (with one query)."""
+        mock_session.cursor.fetchall.return_value = [
+            {"batch_scafid": 1, "drug_id": 10, "inn": "a"},
+            {"batch_scafid": 1, "drug_id": 11, "inn": "b"},
+            {"batch_scafid": 5, "drug_id": 10, "inn": "a"},
+        ]
+        assert mock_session.get_associated_drugs_batch([1, 5, 7]) == {
+            1: [{"drug_id": 10, "inn": "a"}, {"drug_id": 11, "inn": "b"}],
+            5: [{"drug_id": 10, "inn": "a"}],
+        }
+        assert mock_session.cursor.execute.call_count == 1
+        assert mock_session.get_active_targets_batch([]) == {}
+        assert mock_session.cursor.execute.call_count == 1
+
 
 class TestIntegration:
     """Integration tests that require actual database connectivity."""
@@ -130,6 +174,21 @@ class TestIntegration:
             else:
                 raise
 
+    def test_real_database_scaffold_batch_search(self):
+        """Test that batch scaffold search agrees with single scaffold search."""
+        scafsmi_list = ["c1ccncc1", "C1CCNCC1", "not_a_scaffold"]
+        try:
+            with BadAppleSession("badapple2") as session:
+                batch_result = session.search_scaffolds_by_smiles_batch(scafsmi_list)
+                for scafsmi in scafsmi_list:
+                    single_result = session.search_scaffold_by_smiles(scafsmi)
+                    if len(single_result) > 0:
+                        assert batch_result[scafsmi] == single_result[0]
+                    else:
+                        assert scafsmi not in batch_result
+        except psycopg2.OperationalError:
+            pytest.skip("Database not available for integration test")
+
     def test_real_database_table_existence(self):
         """Test that expected tables exist in the databases."""
         shared_tables = ["scaffold", "compound", "sub2cpd", "scaf2cpd"]
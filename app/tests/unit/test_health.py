@@ -0,0 +1,148 @@
+"""
+Description:
+Tests for the /health endpoints (database checks are mocked, so no database is required).
+"""
+
+from unittest.mock import patch
+
+import blueprints.health
+import psycopg2
+import pytest
+from blueprints.health import check_database, health_bp, reset_database_status
+from database.pool import PoolTimeoutError
+from flask import Flask
+
+DB_NAMES = ["badapple_classic", "badapple2"]
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(health_bp)
+    reset_database_status()
+    with patch.object(blueprints.health, "ALLOWED_DB_NAMES", DB_NAMES):
+        with app.test_client() as client:
+            yield client
+    reset_database_status()
+
+
+def test_live(client):
+    with patch.object(blueprints.health, "check_database") as check_database:
+        response = client.get("/health/live")
+        check_database.assert_not_called()
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "alive"}
+
+
+def test_database_checks_cached(client):
+    """
+    GIVEN frequent health probes
+    WHEN they arrive within HEALTH_CHECK_CACHE_TTL seconds
+    THEN each database is only checked once
+    """
+    with patch.object(
+        blueprints.health, "check_database", return_value="ok"
+    ) as check_database:
+        for _ in range(3):
+            response = client.get("/health")
+            assert response.status_code == 200
+            assert response.get_json() == {
+                "status": "healthy",
+                "databases": {db_name: "ok" for db_name in DB_NAMES},
+            }
+        client.get("/health/ready")
+        assert check_database.call_count == len(DB_NAMES)
+
+        with patch.object(blueprints.health, "HEALTH_CHECK_CACHE_TTL", 0):
+            client.get("/health")
+        assert check_database.call_count == 2 * len(DB_NAMES)
+
+
+def test_database_error(client):
+    with patch.object(
+        blueprints.health, "check_database", return_value="error: timeout"
+    ):
+        response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.get_json()["status"] == "unhealthy"
+    assert response.get_json()["databases"]["badapple2"] == "error: timeout"
+
+
+def test_snapshot_replica(client):
+    """
+    GIVEN a scoring-only replica serving badapple2 from a snapshot file built for a release
+    WHEN it is probed
+    THEN badapple2 is reported as "snapshot" (not pinged) and the replica is ready
+    """
+    with patch.object(
+        blueprints.health, "SCAFFOLD_SNAPSHOT_DIR", "/snapshots"
+    ), patch.object(
+        blueprints.health, "SCAFFOLD_SNAPSHOT_RELEASE", "2025.1"
+    ), patch.object(
+        blueprints.health,
+        "get_scaffold_snapshot",
+        side_effect=lambda db_name: object() if db_name == "badapple2" else None,
+    ), patch.object(
+        blueprints.health, "check_database", return_value="error: no database"
+    ) as check_database:
+        response = client.get("/health/ready")
+        assert response.get_json()["databases"] == {
+            "badapple_classic": "error: no database",
+            "badapple2": "snapshot",
+        }
+        check_database.assert_called_once_with("badapple_classic")
+
+        with patch.object(blueprints.health, "ALLOWED_DB_NAMES", ["badapple2"]):
+            for path in ["/health", "/health/ready"]:
+                response = client.get(path)
+                assert response.status_code == 200
+                assert response.get_json()["status"] == "healthy"
+                assert response.get_json()["databases"] == {"badapple2": "snapshot"}
+        check_database.assert_called_once()
+
+        # (without a release, the snapshot file is checked against the database)
+        with patch.object(blueprints.health, "SCAFFOLD_SNAPSHOT_RELEASE", None):
+            reset_database_status()
+            assert client.get("/health").status_code == 503
+
+
+def test_database_check_pool_saturated():
+    """
+    GIVEN a connection pool with no connection available
+    WHEN the database is checked
+    THEN a new connection is used, so the saturated pool is not reported as an error
+    """
+    with patch.object(blueprints.health, "DB_POOL_ENABLED", True), patch.object(
+        blueprints.health, "get_pool"
+    ) as get_pool, patch.object(blueprints.health, "connect") as connect:
+        get_pool.return_value.getconn.side_effect = PoolTimeoutError("timeout")
+        assert check_database("badapple2") == "ok"
+        connect.assert_called_once()
+        connect.return_value.close.assert_called_once()
+
+        connect.side_effect = psycopg2.OperationalError("connection refused")
+        assert check_database("badapple2") == "error: connection refused"
+
+
+def test_ready_saturated(client):
+    """
+    GIVEN a worker whose connection pool is fully in use
+    WHEN it is probed for readiness
+    THEN it reports 503 (so the load balancer sends requests elsewhere), along with its load
+    """
+    pool_stats = {"badapple2": {"size": 4, "in_use": 2, "idle": 2, "max_size": 4}}
+    with patch.object(
+        blueprints.health, "check_database", return_value="ok"
+    ), patch.object(blueprints.health, "get_pool_stats", return_value=pool_stats):
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        load = response.get_json()["load"]
+        assert load["db_pools"] == {"badapple2": 0.5}
+        assert load["scaffold_engine"] == 0
+
+        pool_stats["badapple2"]["in_use"] = 4
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.get_json()["status"] == "saturated"
+        # (liveness is not affected)
+        assert client.get("/health/live").status_code == 200
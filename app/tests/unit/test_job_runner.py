@@ -0,0 +1,219 @@
+"""
+Description:
+Tests for the background scoring jobs in utils/jobs.py
+(scores are faked, so no database is required).
+"""
+
+import csv
+
+import psycopg2
+import pytest
+from utils.jobs import (
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    OUTPUT_HEADER,
+    JobRunner,
+    JobStore,
+)
+
+SMILES = ["CCC", "asdnasjd", "c1ccccc1CC1CCNCC1", "C1CCCCC1"]
+INPUT_TSV = "smiles\tname\n" + "".join(
+    f"{smi}\tmol_{i}\n" for i, smi in enumerate(SMILES * 3)
+)
+
+
+class Crash(BaseException):
+    """Simulates the worker process dying mid-job."""
+
+
+def fake_score_batch(smiles_list, name_list, max_rings, database):
+    results = []
+    for smiles, name in zip(smiles_list, name_list):
+        d = {"molecule_smiles": smiles, "name": name}
+        if smiles == "asdnasjd":
+            d["scaffolds"] = None
+            d["error_msg"] = "Invalid SMILES, please check input"
+        elif smiles == "CCC":
+            d["scaffolds"] = []
+        else:
+            d["scaffolds"] = [
+                {"scafsmi": "C1CCNCC1", "in_db": True, "id": 7, "pscore": 3},
+                {"scafsmi": smiles, "in_db": False},
+            ]
+        results.append(d)
+    return results
+
+
+def create_job(store: JobStore, content: str = INPUT_TSV) -> dict:
+    def save_input(path):
+        with open(path, "w") as f:
+            f.write(content)
+
+    return store.create_job(
+        save_input,
+        filename="input.tsv",
+        idelim="\t",
+        iheader=True,
+        smiles_column=0,
+        name_column=1,
+        max_rings=5,
+        database="badapple2",
+    )
+
+
+def read_output(job: dict) -> list[list[str]]:
+    with open(job["output_path"], newline="") as f:
+        return list(csv.reader(f, delimiter="\t"))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path))
+
+
+def test_job_output(store):
+    """
+    GIVEN a queued job
+    WHEN it is claimed and processed
+    THEN the output has the same columns as get_compound_scores.py, one row per scaffold
+    """
+    job = create_job(store)
+    runner = JobRunner(store, fake_score_batch, batch_size=5)
+    owner = "test"
+    runner.process_job(store.claim_job(owner, max_running=1), owner)
+
+    job = store.get_job(job["job_id"])
+    assert job["status"] == JOB_DONE
+    assert job["n_total"] == job["n_done"] == len(SMILES) * 3
+    rows = read_output(job)
+    assert rows[0] == OUTPUT_HEADER[:2] + ["name"] + OUTPUT_HEADER[3:]
+    assert rows[1] == ["0", "CCC", "mol_0", "True"] + [""] * 11
+    assert rows[2] == ["1", "asdnasjd", "mol_1", "False"] + [""] * 11
+    assert rows[3][:9] == ["2", SMILES[2], "mol_2", "True", "C1CCNCC1"] + [
+        "True",
+        "7",
+        "3",
+        "",
+    ]
+    assert len(rows) == 1 + 3 * (1 + 1 + 2 + 2)
+
+
+def test_job_resume(store):
+    """
+    GIVEN a job whose worker died after some batches
+    WHEN the job is re-queued (stale heartbeat) and claimed by another runner
+    THEN it resumes from the last completed batch and the output matches an uninterrupted run
+    """
+    expected_job = create_job(store)
+    JobRunner(store, fake_score_batch, batch_size=5).process_job(
+        store.claim_job("a", max_running=1), "a"
+    )
+
+    job = create_job(store)
+    n_batches = 0
+
+    def crashing_score_batch(*args):
+        nonlocal n_batches
+        n_batches += 1
+        if n_batches == 2:
+            raise Crash()
+        return fake_score_batch(*args)
+
+    with pytest.raises(Crash):
+        JobRunner(store, crashing_score_batch, batch_size=5).process_job(
+            store.claim_job("b", max_running=1), "b"
+        )
+    assert store.get_job(job["job_id"])["n_done"] == 5
+    # simulate a partially written batch
+    with open(job["output_path"], "a") as f:
+        f.write("garbage")
+
+    assert store.requeue_stale_jobs(stale_timeout=-1) == 1
+    assert store.get_job(job["job_id"])["status"] == JOB_QUEUED
+    runner = JobRunner(store, fake_score_batch, batch_size=5)
+    runner.process_job(store.claim_job("c", max_running=1), "c")
+    job = store.get_job(job["job_id"])
+    assert job["status"] == JOB_DONE
+    assert read_output(job) == read_output(store.get_job(expected_job["job_id"]))
+
+
+def test_job_claim(store):
+    """
+    GIVEN two queued jobs
+    WHEN jobs are claimed with max_running=1
+    THEN only one runs at a time, and a runner which lost its job can no longer update it
+    """
+    job1 = create_job(store)
+    job2 = create_job(store)
+    assert store.claim_job("a", max_running=1)["job_id"] == job1["job_id"]
+    assert store.claim_job("b", max_running=1) is None
+    assert store.get_job(job1["job_id"])["status"] == JOB_RUNNING
+
+    store.requeue_stale_jobs(stale_timeout=-1)
+    assert store.claim_job("b", max_running=1)["job_id"] == job1["job_id"]
+    assert not store.update_progress(job1["job_id"], "a", 1, 1)
+    assert store.update_progress(job1["job_id"], "b", 1, 1)
+    assert store.claim_job("c", max_running=2)["job_id"] == job2["job_id"]
+
+
+def test_job_failure(store):
+    def failing_score_batch(*args):
+        raise ValueError("bad input")
+
+    job = create_job(store)
+    JobRunner(store, failing_score_batch).process_job(
+        store.claim_job("a", max_running=1), "a"
+    )
+    job = store.get_job(job["job_id"])
+    assert job["status"] == JOB_FAILED
+    assert job["error_msg"] == "ValueError: bad input"
+
+
+def test_job_requeued_on_db_error(store):
+    """
+    GIVEN a job whose batch fails because the database is unavailable
+    WHEN it is processed
+    THEN the job is re-queued (not failed) and the runner can process it again once the DB is back
+    """
+    n_batches = 0
+
+    def flaky_score_batch(*args):
+        nonlocal n_batches
+        n_batches += 1
+        if n_batches == 2:
+            raise psycopg2.OperationalError("could not connect to server")
+        return fake_score_batch(*args)
+
+    job = create_job(store)
+    runner = JobRunner(store, flaky_score_batch, batch_size=5)
+    runner.process_job(store.claim_job("a", max_running=1), "a")
+    job = store.get_job(job["job_id"])
+    assert job["status"] == JOB_QUEUED
+    assert job["n_done"] == 5
+
+    runner.process_job(store.claim_job("b", max_running=1), "b")
+    job = store.get_job(job["job_id"])
+    assert job["status"] == JOB_DONE
+    assert job["n_done"] == len(SMILES) * 3
+
+
+def test_create_job_invalid_input(store, tmp_path):
+    def validate_input(job):
+        raise ValueError("invalid")
+
+    with pytest.raises(ValueError):
+        store.create_job(
+            lambda path: open(path, "w").close(),
+            validate_input,
+            filename="input.tsv",
+            idelim="\t",
+            iheader=True,
+            smiles_column=0,
+            name_column=1,
+            max_rings=5,
+            database="badapple2",
+        )
+    assert store.claim_job("a", max_running=1) is None
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == []
@@ -0,0 +1,115 @@
+"""
+Description:
+Tests that the orjson JSON provider produces the same responses as Flask's default provider.
+"""
+
+import dataclasses
+import datetime
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.extras import RealDictRow
+from utils.json_provider import FastJSONProvider
+
+pytest.importorskip("orjson")
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: float
+
+
+def _row(**values) -> RealDictRow:
+    row = RealDictRow()
+    row.update(values)
+    return row
+
+
+COMPOUND = _row(
+    cid=3216680,
+    cansmi="Cc1ccccc1N(C(=O)Cc1cccs1)C(C(=O)NCC1CCCO1)c1cccnc1",
+    isosmi="CC1=CC=CC=C1N(C(C2=CN=CC=C2)C(=O)NCC3CCCO3)C(=O)CC4=CC=CS4",
+    nass_active=0,
+    nass_tested=649,
+    nsam_active=0,
+    nsam_tested=651,
+    nsub_active=0,
+    nsub_tested=1,
+    nsub_total=2,
+)
+SCAFFOLD = _row(
+    id=3,
+    scafsmi="c1ccc2ncccc2c1",
+    kekule_scafsmi=None,
+    in_drug=True,
+    pscore=428,
+    prank=215,
+    scores=[0.1, 2.5, -0.0, 1 / 3],
+)
+PAYLOADS = {
+    "compounds": [COMPOUND] * 1000,
+    "scaffolds": {"C1CCNCC1": [SCAFFOLD, SCAFFOLD], "molecule_smiles": "c1ccccc1"},
+    "empty": [],
+    "scalars": [None, True, False, 0, -1, 2**63 - 1, "", 'quote " and \\ slash'],
+    "types of default": {
+        "decimal": Decimal("1.50"),
+        "date": datetime.date(2025, 1, 2),
+        "datetime": datetime.datetime(2025, 1, 2, 3, 4, 5),
+        "uuid": uuid.UUID(int=1),
+        "dataclass": Point(1, 0.5),
+    },
+    # (serialized by the default provider)
+    "non-ASCII": {"target": "α-synuclein"},
+    "int keys": {2: "b", 10: "a"},
+    "big int": [2**70],
+    "exponent floats": [1e-7, 7.2e-05, 1e16, 1e22, -1.5e300, 0.0001, 1e15],
+    "non-finite floats": {
+        "pscore": float("nan"),
+        "scores": [float("inf"), -float("inf"), None],
+        "dataclass": Point(1, float("nan")),
+    },
+}
+
+
+@pytest.fixture
+def providers():
+    app = Flask(__name__)
+    # (yield, not return: providers only keep a weak reference to app)
+    yield DefaultJSONProvider(app), FastJSONProvider(app)
+
+
+@pytest.mark.parametrize("name", list(PAYLOADS))
+def test_identical_response(providers, name):
+    """
+    GIVEN a response payload
+    WHEN it is serialized by the orjson provider
+    THEN the response body is identical to that of the default provider
+    """
+    default_provider, fast_provider = providers
+    expected = default_provider.response(PAYLOADS[name])
+    response = fast_provider.response(PAYLOADS[name])
+    assert response.get_data() == expected.get_data()
+    assert response.mimetype == expected.mimetype
+
+
+def test_orjson_used(providers):
+    _, fast_provider = providers
+    with patch.object(DefaultJSONProvider, "response") as default_response:
+        fast_provider.response(PAYLOADS["compounds"])
+        fast_provider.response(cid=1, scafsmi="C1CCNCC1")  # (jsonify(**kwargs))
+        default_response.assert_not_called()
+        fast_provider.response(PAYLOADS["scaffolds"])  # (null, but no NaN)
+        default_response.assert_not_called()
+        fast_provider.response(PAYLOADS["non-ASCII"])
+        default_response.assert_called_once()
+
+
+def test_unserializable(providers):
+    _, fast_provider = providers
+    with pytest.raises(TypeError):
+        fast_provider.response({"a": object()})
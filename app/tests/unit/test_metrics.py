@@ -0,0 +1,109 @@
+"""
+Description:
+Tests for the Prometheus metrics (no database is required).
+"""
+
+import pytest
+from blueprints.metrics import metrics_bp
+from flask import Flask, jsonify
+from prometheus_client import REGISTRY
+from utils.metrics import init_metrics, instrument_session_methods
+from utils.streaming import ndjson_response
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    init_metrics(app)
+    app.register_blueprint(metrics_bp)
+
+    @app.route("/scaffold/<int:scafid>")
+    def scaffold_route(scafid):
+        return jsonify(id=scafid)
+
+    @app.route("/ndjson")
+    def ndjson_route():
+        return ndjson_response({"id": i} for i in range(10))
+
+    with app.test_client() as client:
+        yield client
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_request_latency(client):
+    """
+    GIVEN requests to a route with a URL parameter
+    WHEN they are handled
+    THEN their latency is recorded per route template and status
+    """
+    labels = dict(route="/scaffold/<int:scafid>", method="GET", status="200")
+    before = _sample("badapple_request_duration_seconds_count", **labels)
+    for scafid in [1, 2]:
+        # (recorded once the WSGI server closes the response)
+        with client.get(f"/scaffold/{scafid}") as response:
+            assert response.status_code == 200
+    assert _sample("badapple_request_duration_seconds_count", **labels) == before + 2
+    assert _sample("badapple_requests_in_progress", route=labels["route"]) == 0
+
+    labels = dict(route="unmatched", method="GET", status="404")
+    before = _sample("badapple_request_duration_seconds_count", **labels)
+    client.get("/missing").close()
+    assert _sample("badapple_request_duration_seconds_count", **labels) == before + 1
+
+
+def test_streamed_request(client):
+    labels = dict(route="/ndjson", method="GET", status="200")
+    before = _sample("badapple_request_duration_seconds_count", **labels)
+    response = client.get("/ndjson", buffered=False)
+    next(iter(response.response))
+    assert _sample("badapple_requests_in_progress", route="/ndjson") == 1
+    response.close()
+    assert _sample("badapple_request_duration_seconds_count", **labels) == before + 1
+    assert _sample("badapple_requests_in_progress", route="/ndjson") == 0
+
+
+def test_session_methods():
+    @instrument_session_methods
+    class Session:
+        db_name = "test_db"
+
+        def get_rows(self):
+            return [1, 2]
+
+        def iter_rows(self):
+            yield from [1, 2]
+
+        def _private(self):
+            return None
+
+    def count(method: str) -> float:
+        return _sample(
+            "badapple_db_session_duration_seconds_count",
+            db_name="test_db",
+            method=method,
+        )
+
+    before = count("get_rows")
+    assert Session().get_rows() == [1, 2]
+    assert count("get_rows") == before + 1
+    # generators are timed until they are exhausted
+    before = count("iter_rows")
+    rows = Session().iter_rows()
+    assert count("iter_rows") == before
+    assert list(rows) == [1, 2]
+    assert count("iter_rows") == before + 1
+    Session()._private()
+    assert count("_private") == 0
+
+
+def test_metrics_endpoint(client):
+    client.get("/scaffold/1").close()
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert "badapple_request_duration_seconds_bucket{" in text
+    assert "badapple_scaffold_generation_seconds_per_molecule" in text
@@ -0,0 +1,128 @@
+"""
+Description:
+Tests for the per-worker connection pool used by BadAppleSession
+(uses fake connections, so no database is required).
+"""
+
+import threading
+import time
+
+import psycopg2.extensions
+import pytest
+from database.pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.n_rollbacks = 0
+        self.info = self
+        self.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.n_rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect():
+        connection = FakeConnection()
+        opened.append(connection)
+        return connection
+
+    params = dict(
+        min_size=0,
+        max_size=2,
+        idle_timeout=0,
+        max_lifetime=0,
+        checkout_timeout=0.2,
+        ping_interval=0,
+    )
+    params.update(kwargs)
+    return ConnectionPool(connect, **params), opened
+
+
+def test_connection_reused():
+    pool, opened = make_pool()
+    conn1 = pool.getconn()
+    pool.putconn(conn1)
+    conn2 = pool.getconn()
+    assert conn1 is conn2
+    assert len(opened) == 1
+    assert conn1.n_rollbacks == 1  # transaction ended when returned
+
+
+def test_min_size_opens_eagerly():
+    pool, opened = make_pool(min_size=2)
+    assert len(opened) == 2
+    assert pool.stats() == {"size": 2, "in_use": 0, "idle": 2, "max_size": 2}
+
+
+def test_pool_is_bounded():
+    pool, opened = make_pool(max_size=1)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    assert len(opened) == 1
+    pool.putconn(conn)
+
+
+def test_checkout_timeout_override():
+    pool, _ = make_pool(max_size=1, checkout_timeout=5)
+    conn = pool.getconn()
+    start = time.monotonic()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn(timeout=0.05)
+    assert time.monotonic() - start < 1
+    pool.putconn(conn)
+
+
+def test_waiting_thread_gets_returned_connection():
+    pool, _ = make_pool(max_size=1, checkout_timeout=5)
+    conn = pool.getconn()
+    result = {}
+
+    def worker():
+        result["conn"] = pool.getconn()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    time.sleep(0.05)
+    pool.putconn(conn)
+    thread.join(timeout=5)
+    assert result["conn"] is conn
+
+
+def test_discarded_and_broken_connections_not_reused():
+    pool, opened = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn, discard=True)
+    assert conn.closed
+
+    conn = pool.getconn()
+    assert conn is opened[1]
+    pool.putconn(conn)
+    conn.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+    new_conn = pool.getconn()
+    assert new_conn is not conn
+    assert conn.closed
+
+
+def test_expired_connections_are_closed():
+    pool, opened = make_pool(idle_timeout=0.01)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    time.sleep(0.05)
+    assert pool.getconn() is not conn
+    assert conn.closed
+
+    pool, opened = make_pool(max_lifetime=0.01)
+    conn = pool.getconn()
+    time.sleep(0.05)
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()["size"] == 0
@@ -0,0 +1,121 @@
+"""
+Description:
+Tests for the sampling profiler of requests.
+"""
+
+import time
+from unittest.mock import patch
+
+import blueprints.profiler
+import pytest
+import utils.profiler
+from blueprints.profiler import profiler
+from flask import Flask, jsonify
+from utils.profiler import SamplingProfiler, init_profiler, top_functions
+from utils.streaming import ndjson_response
+
+
+def busy_function(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    init_profiler(app)
+    app.register_blueprint(profiler)
+
+    @app.route("/busy")
+    def busy_route():
+        busy_function(0.05)
+        return jsonify({"done": True})
+
+    @app.route("/stream")
+    def stream_route():
+        def rows():
+            for i in range(2):
+                busy_function(0.025)
+                yield {"i": i}
+
+        return ndjson_response(rows())
+
+    sampler = SamplingProfiler(interval=0.001, history=3)
+    with patch.object(
+        utils.profiler, "get_profiler", return_value=sampler
+    ), patch.object(blueprints.profiler, "get_profiler", return_value=sampler):
+        with app.test_client() as client:
+            yield client
+
+
+def _collapsed_stacks(text: str) -> dict[str, int]:
+    stacks = {}
+    for line in text.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        stacks[stack] = int(count)
+    return stacks
+
+
+def test_profile_header(client):
+    """
+    GIVEN a request with the X-Profile header
+    WHEN it is handled
+    THEN the collapsed stacks of the request are returned instead of its body
+    """
+    response = client.get("/busy", headers={"X-Profile": "1"})
+    assert response.mimetype == "text/plain"
+    assert response.headers["X-Profiled-Status"] == "200"
+    stacks = _collapsed_stacks(response.get_data(as_text=True))
+    busy_samples = sum(
+        count
+        for stack, count in stacks.items()
+        if "busy_route;test_profiler:busy_function" in stack
+    )
+    # (at most one sample per GIL switch interval, 5ms)
+    assert busy_samples >= 3
+    assert busy_samples >= 0.5 * sum(stacks.values())
+
+    # streamed responses are profiled until their last row
+    response = client.get("/stream", headers={"X-Profile": "1"})
+    stacks = _collapsed_stacks(response.get_data(as_text=True))
+    assert any("rows;test_profiler:busy_function" in stack for stack in stacks)
+
+
+def test_top_functions(client):
+    """
+    GIVEN the profiles of the last requests
+    WHEN the top functions are requested
+    THEN they are ranked by cumulative time, over at most the last PROFILER_HISTORY requests
+    """
+    for _ in range(2):
+        client.get("/busy").close()
+    assert client.get("/busy").get_json() == {"done": True}
+    client.get("/busy").close()
+    response = client.get("/profiler/top?n=200")
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["n_requests"] == 3  # (history=3)
+    assert result["requests"][0]["request"] == "GET /busy"
+    functions = {row["function"]: row for row in result["functions"]}
+    busy = functions["test_profiler:busy_function"]
+    assert busy["cumulative_percent"] >= 50
+    assert busy["self_ms"] <= busy["cumulative_ms"]
+    cumulative = [row["cumulative_ms"] for row in result["functions"]]
+    assert cumulative == sorted(cumulative, reverse=True)
+
+    assert client.get("/profiler/top?requests=1").get_json()["n_requests"] == 1
+    stacks = _collapsed_stacks(client.get("/profiler/collapsed").get_data(as_text=True))
+    assert sum(stacks.values()) == result["n_samples"]
+
+
+def test_top_functions_counts_recursion_once():
+    profile = utils.profiler.Profile(0, "GET /")
+    profile.stacks.update({"m:a;m:b;m:a": 3, "m:a;m:c": 1})
+    functions = top_functions([profile], 10, interval=0.001)
+    assert functions[0] == {
+        "function": "m:a",
+        "cumulative_ms": 4.0,
+        "self_ms": 3.0,
+        "cumulative_percent": 100.0,
+    }
@@ -8,12 +8,16 @@ Tests for functions in request_processing.py
 import pytest
 from flask import request
 from utils.request_processing import (
+    get_bool_param,
     get_database,
+    get_page_params,
     int_check,
     param_given,
     process_integer_list_input,
     process_list_input,
+    wants_ndjson,
 )
+from utils.result_processing import NEXT_CURSOR_HEADER, paginated_response
 from werkzeug.exceptions import BadRequest
 
 
@@ -226,3 +230,98 @@ class TestProcessIntegerListInput:
         ):
             result = process_integer_list_input(request, "ids", limit=5)
             assert result == [1, 2, 3]
+
+
+class TestGetBoolParam:
+    def test_true_values(self, flask_app):
+        for value in ["true", "True", "1"]:
+            with flask_app.test_request_context(f"/?stream={value}"):
+                assert get_bool_param(request, "stream") == True
+
+    def test_false_values(self, flask_app):
+        for value in ["false", "FALSE", "0"]:
+            with flask_app.test_request_context(f"/?stream={value}"):
+                assert get_bool_param(request, "stream") == False
+
+    def test_default(self, flask_app):
+        with flask_app.test_request_context("/"):
+            assert get_bool_param(request, "stream") == False
+            assert get_bool_param(request, "stream", default_val=True) == True
+
+    def test_post(self, flask_app):
+        with flask_app.test_request_context("/", method="POST", json={"stream": True}):
+            assert get_bool_param(request, "stream") == True
+
+    def test_post_int(self, flask_app):
+        for value, expected in [(1, True), (0, False)]:
+            with flask_app.test_request_context(
+                "/", method="POST", json={"stream": value}
+            ):
+                assert get_bool_param(request, "stream") == expected
+
+    def test_invalid(self, flask_app):
+        with flask_app.test_request_context("/?stream=maybe"):
+            with pytest.raises(BadRequest):
+                get_bool_param(request, "stream")
+
+    def test_invalid_post(self, flask_app):
+        for value in [2, 0.5, ["true"], {"a": 1}]:
+            with flask_app.test_request_context(
+                "/", method="POST", json={"stream": value}
+            ):
+                with pytest.raises(BadRequest):
+                    get_bool_param(request, "stream")
+
+
+class TestWantsNdjson:
+    def test_default(self, flask_app):
+        with flask_app.test_request_context("/"):
+            assert wants_ndjson(request) == False
+        with flask_app.test_request_context("/", headers={"Accept": "*/*"}):
+            assert wants_ndjson(request) == False
+
+    def test_stream_param(self, flask_app):
+        with flask_app.test_request_context("/?stream=true"):
+            assert wants_ndjson(request) == True
+
+    def test_accept_header(self, flask_app):
+        with flask_app.test_request_context(
+            "/", headers={"Accept": "application/x-ndjson"}
+        ):
+            assert wants_ndjson(request) == True
+        with flask_app.test_request_context(
+            "/", headers={"Accept": "application/json, application/x-ndjson;q=0.5"}
+        ):
+            assert wants_ndjson(request) == False
+
+
+class TestPagination:
+    def test_not_paginated(self, flask_app):
+        with flask_app.test_request_context("/?scafid=1"):
+            assert get_page_params(request, "after_cid") is None
+
+    def test_page_params(self, flask_app):
+        with flask_app.test_request_context("/?limit=10"):
+            assert get_page_params(request, "after_cid") == (0, 10)
+        with flask_app.test_request_context("/?after_cid=123"):
+            assert get_page_params(request, "after_cid") == (123, 1000)
+        with flask_app.test_request_context("/?after_cid=123&limit=5"):
+            assert get_page_params(request, "after_cid") == (123, 5)
+
+    def test_invalid_page_params(self, flask_app):
+        for query in ["limit=0", "limit=100000", "after_cid=-1"]:
+            with flask_app.test_request_context(f"/?{query}"):
+                with pytest.raises(BadRequest):
+                    get_page_params(request, "after_cid")
+
+    def test_paginated_response(self, flask_app):
+        with flask_app.app_context():
+            page = [{"cid": 3}, {"cid": 7}]
+            response = paginated_response(page, 2, "cid")
+            assert response.get_json() == page
+            assert response.headers[NEXT_CURSOR_HEADER] == "7"
+            # last page
+            response = paginated_response(page, 3, "cid")
+            assert NEXT_CURSOR_HEADER not in response.headers
+            response = paginated_response([5, 9], 2)
+            assert response.headers[NEXT_CURSOR_HEADER] == "9"
@@ -0,0 +1,71 @@
+"""
+Description:
+Tests for the per-molecule result cache used by the compound_search endpoints
+(no database is required).
+"""
+
+import time
+
+import pytest
+from utils.cache import LRUCache
+from utils.result_cache import MemoryResultCache, SQLiteResultCache
+
+SCAFFOLDS = [{"scafsmi": "c1ccccc1", "in_db": True, "pscore": 10}]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def result_cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryResultCache(maxsize=100, ttl=0)
+    return SQLiteResultCache(str(tmp_path / "result_cache.db"), maxsize=100, ttl=0)
+
+
+def test_result_cache_get_put(result_cache):
+    """
+    GIVEN results for a valid and an invalid (None) SMILES
+    WHEN they are put in the cache and fetched again
+    THEN both are returned for the same DB version, none are returned for other versions
+    """
+    key_valid = ("c1ccccc1C", 5)
+    key_invalid = ("asdnasjd", 5)
+    result_cache.put_many("badapple2", "v1", {key_valid: SCAFFOLDS, key_invalid: None})
+    assert result_cache.get_many(
+        "badapple2", "v1", [key_valid, key_invalid, ("CCC", 5)]
+    ) == {key_valid: SCAFFOLDS, key_invalid: None}
+    # max_rings, database, and version are all part of the key
+    assert result_cache.get_many("badapple2", "v1", [("c1ccccc1C", 4)]) == {}
+    assert result_cache.get_many("badapple_classic", "v1", [key_valid]) == {}
+    assert result_cache.get_many("badapple2", "v2", [key_valid]) == {}
+
+    result_cache.invalidate("badapple2", "v2")
+    assert result_cache.get_many("badapple2", "v1", [key_valid]) == {}
+    assert result_cache.stats()["size"] == 0
+
+
+def test_sqlite_result_cache_shared(tmp_path):
+    """
+    GIVEN two SQLite result caches using the same file (e.g., two gunicorn workers)
+    WHEN one of them puts a result
+    THEN the other one can read it
+    """
+    path = str(tmp_path / "result_cache.db")
+    cache1 = SQLiteResultCache(path, maxsize=100, ttl=0)
+    cache2 = SQLiteResultCache(path, maxsize=100, ttl=0)
+    cache1.put_many("badapple2", "v1", {("CCC", 5): SCAFFOLDS})
+    assert cache2.get_many("badapple2", "v1", [("CCC", 5)]) == {("CCC", 5): SCAFFOLDS}
+
+
+def test_sqlite_result_cache_prune(tmp_path):
+    cache = SQLiteResultCache(str(tmp_path / "result_cache.db"), maxsize=2, ttl=0)
+    cache.put_many("badapple2", "v1", {(str(i), 5): None for i in range(5)})
+    cache.prune()
+    assert cache.stats()["size"] == 2
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(10, ttl=0.05)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
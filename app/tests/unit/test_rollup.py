@@ -0,0 +1,209 @@
+"""
+Description:
+Tests for the scaf2aid/sid2outcomes rollups and compact assay outcomes (with mocked database).
+"""
+
+from unittest.mock import MagicMock, patch
+
+import database.rollup
+import pytest
+from database.badapple import BadAppleSession
+from database.build_rollup import find_parity_mismatches
+from database.rollup import (
+    SCAF2AID,
+    SID2OUTCOMES,
+    build_rollup,
+    get_rollup_stats,
+    is_rollup_current,
+    reset_rollup_status,
+)
+from utils.result_processing import run_length_encode
+from werkzeug.exceptions import ServiceUnavailable
+
+
+VERSION = "scaf2cpd:10:12,sub2cpd:10:20,activity:30:5"
+
+
+@pytest.fixture(autouse=True)
+def rollup_status():
+    reset_rollup_status()
+    yield
+    reset_rollup_status()
+
+
+def _statement_names(query_mock) -> list:
+    return [call.args[0].statement.name for call in query_mock.call_args_list]
+
+
+def test_session_uses_current_rollup():
+    """
+    GIVEN a database with a scaf2aid rollup
+    WHEN associated assay IDs are queried through BadAppleSession
+    THEN they are read from the rollup while it matches the DB version, else the live query is used
+    """
+    with patch("database.badapple.connect"), patch(
+        "database.badapple.execute_query", return_value=[{"aid": 1}]
+    ) as query, patch.object(
+        BadAppleSession, "get_rollup_source_version", return_value=VERSION
+    ), patch.object(
+        BadAppleSession, "get_rollup_version", return_value=VERSION
+    ) as rollup_version:
+        with BadAppleSession("badapple2", pooled=False) as db_session:
+            assert db_session.get_associated_assay_ids(1) == [{"aid": 1}]
+            db_session.get_associated_assay_ids_page(1, 0, 10)
+            db_session.get_associated_assay_ids(1, use_rollup=False)
+        assert _statement_names(query) == [
+            "scaf2aid_assay_ids",
+            "scaf2aid_assay_ids_page",
+            "associated_assay_ids",
+        ]
+        # the rollup version is only checked once per interval
+        assert rollup_version.call_count == 1
+        assert get_rollup_stats()["badapple2"]["scaf2aid"] == {
+            "current": True,
+            "content_version": VERSION,
+            "source_version": VERSION,
+        }
+
+        rollup_version.return_value = "scaf2aid:9:11,sub2cpd:10:20,activity:30:5"
+        with patch.object(database.rollup, "ROLLUP_CHECK_INTERVAL", -1):
+            with BadAppleSession("badapple2", pooled=False) as db_session:
+                db_session.get_associated_assay_ids(1)
+        assert _statement_names(query)[-1] == "associated_assay_ids"
+        assert not get_rollup_stats()["badapple2"]["scaf2aid"]["current"]
+
+
+def test_session_requires_rollup():
+    with patch("database.badapple.connect"), patch(
+        "database.badapple.execute_query"
+    ) as query, patch.object(BadAppleSession, "get_rollup_version", return_value=None):
+        with BadAppleSession("badapple2", pooled=False) as db_session:
+            with pytest.raises(ServiceUnavailable):
+                db_session.get_associated_assay_ids(1, use_rollup=True)
+        query.assert_not_called()
+
+        with patch.object(database.rollup, "DB_ROLLUPS_ENABLED", False):
+            with BadAppleSession("badapple2", pooled=False) as db_session:
+                db_session.get_associated_assay_ids(1)
+        assert _statement_names(query) == ["associated_assay_ids"]
+
+
+def test_build_rollup():
+    cursor = MagicMock()
+    cursor.fetchone.side_effect = [(VERSION,), (42,)]
+    assert build_rollup(cursor, SCAF2AID) == (42, VERSION)
+    sql_executed = [call.args[0] for call in cursor.execute.call_args_list]
+    # (the source tables are versioned before the rollup is built from them)
+    assert sql_executed[0] == SCAF2AID.source_version_sql()
+    assert sql_executed[1] == "DROP TABLE IF EXISTS scaf2aid_build;"
+    assert "ALTER TABLE scaf2aid_build RENAME TO scaf2aid;" in sql_executed
+    assert cursor.execute.call_args.args[1] == ("scaf2aid", VERSION, 42)
+
+
+def test_source_version_sql():
+    assert SID2OUTCOMES.source_version_sql() == (
+        "SELECT concat_ws(',', (SELECT 'activity:' || COUNT(*) || ':' || "
+        "COALESCE(MAX(aid), 0) FROM activity)) AS source_version;"
+    )
+    assert list(SCAF2AID.source_tables) == ["scaf2cpd", "sub2cpd", "activity"]
+
+
+@pytest.mark.parametrize("rollup", [SCAF2AID, SID2OUTCOMES])
+def test_rollup_stale_after_activity_reload(rollup):
+    """
+    GIVEN a rollup built from the activity table
+    WHEN new assay results are loaded into activity (the scaffold table is unchanged)
+    THEN the rollup is no longer current; a DB without the source tables uses it as is
+    """
+    db_session = MagicMock()
+    db_session.get_rollup_version.return_value = "activity:30:5"
+    db_session.get_rollup_source_version.return_value = "activity:30:5"
+    assert is_rollup_current(rollup, "badapple2", db_session)
+
+    db_session.get_rollup_source_version.return_value = "activity:31:5"
+    with patch.object(database.rollup, "ROLLUP_CHECK_INTERVAL", -1):
+        assert not is_rollup_current(rollup, "badapple2", db_session)
+
+        db_session.get_rollup_source_version.return_value = None
+        assert is_rollup_current(rollup, "badapple2", db_session)
+
+        db_session.get_rollup_version.return_value = None
+        assert not is_rollup_current(rollup, "badapple2", db_session)
+
+
+def test_find_parity_mismatches():
+    def mock_execute_query(query, cursor):
+        scafid = query.params["scafid"]
+        if query.statement.name == "scaf2aid_assay_ids" and scafid == 2:
+            return [{"aid": 5}]
+        return [{"aid": 5}, {"aid": 7}]
+
+    with patch("database.build_rollup.execute_query", side_effect=mock_execute_query):
+        assert find_parity_mismatches(MagicMock(), "scaf2aid", [1, 2, 3]) == [2]
+
+
+def test_assay_outcome_columns():
+    """
+    GIVEN the assay outcomes of a substance
+    WHEN they are requested as columns
+    THEN they are ordered by AID, whether read from the sid2outcomes rollup or the live query
+    """
+    columns = {"aids": [3, 5, 9], "outcomes": [1, 1, 2]}
+    with patch("database.badapple.connect"), patch(
+        "database.badapple.execute_query"
+    ) as query, patch.object(BadAppleSession, "get_rollup_version", return_value=None):
+        query.return_value = [
+            {"aid": 9, "outcome": 2},
+            {"aid": 3, "outcome": 1},
+            {"aid": 5, "outcome": 1},
+        ]
+        with BadAppleSession("badapple2", pooled=False) as db_session:
+            assert db_session.get_assay_outcome_columns(842121) == columns
+        assert _statement_names(query) == ["assay_outcomes"]
+
+    with patch("database.badapple.connect"), patch(
+        "database.badapple.execute_query", return_value=[columns]
+    ) as query, patch.object(
+        BadAppleSession, "get_rollup_source_version", return_value="activity:30:5"
+    ), patch.object(
+        BadAppleSession, "get_rollup_version", return_value="activity:30:5"
+    ):
+        reset_rollup_status()
+        with BadAppleSession("badapple2", pooled=False) as db_session:
+            assert db_session.get_assay_outcome_columns(842121) == columns
+            query.return_value = []
+            assert db_session.get_assay_outcome_columns(1) == {
+                "aids": [],
+                "outcomes": [],
+            }
+            db_session.get_assay_outcomes(1)
+        assert _statement_names(query) == [
+            "sid2outcomes_columns",
+            "sid2outcomes_columns",
+            "sid2outcomes",
+        ]
+
+
+def test_run_length_encode():
+    assert run_length_encode([]) == []
+    assert run_length_encode([1, 1, 1, 2, 1, 1]) == [[1, 3], [2, 1], [1, 2]]
+
+
+def test_stale_rollup_warning():
+    """
+    GIVEN a scaf2aid rollup which is already stale when the process starts
+    WHEN it is first checked
+    THEN a warning is logged (once, not on every check)
+    """
+    db_session = MagicMock()
+    db_session.get_rollup_version.return_value = VERSION
+    db_session.get_rollup_source_version.return_value = VERSION.replace(
+        "activity:30", "activity:31"
+    )
+    with patch.object(database.rollup, "logger") as logger, patch.object(
+        database.rollup, "ROLLUP_CHECK_INTERVAL", -1
+    ):
+        assert not is_rollup_current(SCAF2AID, "badapple2", db_session)
+        assert not is_rollup_current(SCAF2AID, "badapple2", db_session)
+    logger.warning.assert_called_once()
+    assert "scaf2aid rollup of badapple2 is stale" in logger.warning.call_args.args[0]
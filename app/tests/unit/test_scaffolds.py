@@ -6,7 +6,23 @@ Defines unit tests to ensure scaffolds are generated
 as expected by method in hiers.py.
 """
 
-from utils.process_scaffolds import get_scaffolds_single_mol, is_valid_scaf
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import utils.process_scaffolds
+from prometheus_client import REGISTRY
+from rdkit import Chem
+from utils.cache import LRUCache
+from utils.process_scaffolds import (
+    get_scaffolds_batch,
+    get_scaffolds_single_mol,
+    is_valid_scaf,
+)
+from utils.scaffold_engine import ScaffoldEngine
+from utils.scaffolds.cached_hiers import memoized_canon_smiles
+from utils.scaffolds.hiers import CustomHierS, canon_smiles
 
 
 def test_is_valid_scaf():
@@ -84,3 +100,195 @@ def test_get_scaffolds_single_mol():
     assert get_scaffolds_single_mol(" ", NULL_NAME, max_rings=5) == {}
     assert get_scaffolds_single_mol("asdnasjd", NULL_NAME, max_rings=5) == {}
     assert get_scaffolds_single_mol("NC(C)Cc1cdcccc1", NULL_NAME, max_rings=5) == {}
+
+
+EXAMPLE_INPUT_TSV = (
+    Path(__file__).parents[3] / "example_scripts" / "data" / "example_input.tsv"
+)
+
+
+def test_get_scaffolds_batch_edge_cases():
+    """
+    GIVEN a list of (possibly invalid or duplicate) SMILES
+    WHEN scaffolds are generated for the whole list at once
+    THEN the results are identical to processing each molecule on its own
+    """
+    smiles_list = [
+        "",
+        " ",
+        "asdnasjd",
+        "CCC",
+        "NC(C)Cc1ccccc1",
+        "O=c1oc2cccc3c(=O)oc4cccc1c4c23",
+        "O=c1oc2cccc3c(=O)oc4cccc1c4c23",  # duplicate
+        "Cn1cc(C2=C(c3cn(C4CCN(Cc5ccccn5)CC4)c4ccccc34)C(=O)NC2=O)c2ccccc21",
+    ]
+    for max_rings in [4, 5]:
+        expected = [
+            get_scaffolds_single_mol(smi, "", max_rings=max_rings)
+            for smi in smiles_list
+        ]
+        assert get_scaffolds_batch(smiles_list, max_rings=max_rings) == expected
+    assert get_scaffolds_batch([], max_rings=5) == []
+    assert get_scaffolds_batch([""], max_rings=5) == [{}]
+
+
+@pytest.mark.skipif(
+    not EXAMPLE_INPUT_TSV.exists(), reason="example_scripts data not available"
+)
+def test_get_scaffolds_batch_parity():
+    """
+    GIVEN the compounds in example_scripts/data/example_input.tsv
+    WHEN scaffolds are generated for all compounds in one batch
+    THEN the output is identical to the single-molecule path for every compound
+    """
+    smiles_list = pd.read_csv(EXAMPLE_INPUT_TSV, sep="\t")["canonical_smiles"].tolist()
+    expected = [get_scaffolds_single_mol(smi, "", max_rings=5) for smi in smiles_list]
+    assert get_scaffolds_batch(smiles_list, max_rings=5) == expected
+
+
+# scaffolds of the compounds in EXAMPLE_INPUT_TSV (max_rings=5), as generated before the
+# batch path and the hierarchy cache were added
+EXPECTED_SCAFFOLDS_JSON = (
+    Path(__file__).parent / "data" / "example_input_scaffolds.json"
+)
+
+
+@pytest.mark.skipif(
+    not EXAMPLE_INPUT_TSV.exists(), reason="example_scripts data not available"
+)
+@pytest.mark.parametrize("cache_size", [0, 10_000])
+def test_scaffold_order_unchanged(monkeypatch, cache_size):
+    """
+    GIVEN the compounds in example_scripts/data/example_input.tsv
+    WHEN scaffolds are generated one by one, in batches and with the hierarchy cache
+    THEN the scaffolds (and their order) are identical to those of the original
+         single-molecule implementation
+    """
+    smiles_list = pd.read_csv(EXAMPLE_INPUT_TSV, sep="\t")["canonical_smiles"].tolist()
+    with open(EXPECTED_SCAFFOLDS_JSON) as file:
+        expected = json.load(file)
+    monkeypatch.setattr(
+        utils.process_scaffolds, "_hierarchy_cache", LRUCache(cache_size)
+    )
+    single = [get_scaffolds_single_mol(smi, "", max_rings=5) for smi in smiles_list]
+    assert single == expected
+    batch = []
+    for i in range(0, len(smiles_list), 100):
+        batch.extend(get_scaffolds_batch(smiles_list[i : i + 100], max_rings=5))
+    assert batch == expected
+
+
+@pytest.mark.skipif(
+    not EXAMPLE_INPUT_TSV.exists(), reason="example_scripts data not available"
+)
+def test_hierarchy_cache(monkeypatch):
+    """
+    GIVEN compounds sharing top-level scaffolds
+    WHEN scaffolds are generated with the hierarchy cache enabled
+    THEN the output is identical to generating them without the cache, and the cache is hit
+    """
+    smiles_list = pd.read_csv(EXAMPLE_INPUT_TSV, sep="\t")["canonical_smiles"].tolist()
+    smiles_list = smiles_list[:200]
+
+    monkeypatch.setattr(utils.process_scaffolds, "_hierarchy_cache", LRUCache(0))
+    expected = get_scaffolds_batch(smiles_list, max_rings=5)
+
+    cache = LRUCache(10_000)
+    monkeypatch.setattr(utils.process_scaffolds, "_hierarchy_cache", cache)
+    assert get_scaffolds_batch(smiles_list, max_rings=5) == expected
+    n_misses = cache.misses
+    assert n_misses > 0 and len(cache) > 0
+    # second pass: every molecule with a top-level scaffold is served from the cache
+    assert get_scaffolds_batch(smiles_list, max_rings=5) == expected
+    assert cache.misses == n_misses
+    assert cache.hits >= len(cache)
+    # single-molecule path uses the same cache
+    assert [
+        get_scaffolds_single_mol(smi, "", max_rings=5) for smi in smiles_list
+    ] == expected
+
+
+def test_memoized_canon_smiles():
+    """
+    GIVEN scaffolds generated from example compounds (plus known edge cases from hiers.py)
+    WHEN identifiers are computed with memoized_canon_smiles
+    THEN they match canon_smiles exactly (aromatic and kekule)
+    """
+    smiles_list = [
+        "O=C1C=CN2CCCC3=CC=CC1=C32",
+        "C1=NC(c2ccccc2)=NP=N1",
+        "c1ccc(-c2ncnpn2)cc1",
+        "C(=NC1=C(N2CCCCC2)C=CC=C1)C1=CNN=C1",
+        "C(=NC1=CC=CC=C1N1CCCCC1)C1=CNN=C1",
+    ]
+    mols = [Chem.MolFromSmiles(smi) for smi in smiles_list]
+    # fragment which can't be re-parsed by RDKit (canon_smiles falls back to the original SMILES)
+    mols.append(
+        Chem.MolFromSmiles(
+            "[c-]1cccc1.c1cc(N2CCCC2)[c-]2[cH-][cH-][cH-][c-]2n1", sanitize=False
+        )
+    )
+    if EXAMPLE_INPUT_TSV.exists():
+        df = pd.read_csv(EXAMPLE_INPUT_TSV, sep="\t").head(200)
+        df = df.rename(columns={"canonical_smiles": "Smiles", "molregno": "Name"})
+        network = CustomHierS.from_dataframe(df[["Smiles", "Name"]], ring_cutoff=5)
+        mols.extend(Chem.MolFromSmiles(smi) for smi in network.get_scaffold_nodes())
+    for _ in range(2):  # second round is served from the cache
+        for mol in mols:
+            assert memoized_canon_smiles(mol) == canon_smiles(mol)
+            assert memoized_canon_smiles(mol, kekule=True) == canon_smiles(
+                mol, kekule=True
+            )
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1}
+
+    disabled_cache = LRUCache(0)
+    disabled_cache.put("a", 1)
+    assert disabled_cache.get("a") is None
+    assert len(disabled_cache) == 0
+
+
+def test_scaffold_engine_preserves_order():
+    """
+    GIVEN a list of (possibly invalid) SMILES
+    WHEN scaffolds are generated across multiple worker processes in chunks
+    THEN the results match the serial results and are in input order
+    """
+    smiles_list = [
+        "O=c1oc2cccc3c(=O)oc4cccc1c4c23",
+        "asdnasjd",
+        r"CCN(CC)CCNC(=O)c1c(C)[nH]c(/C=C2\C(=O)Nc3ccc(F)cc32)c1C",
+        "CCC",
+        "",
+        "Cn1cc(C2=C(c3cn(C4CCN(Cc5ccccn5)CC4)c4ccccc34)C(=O)NC2=O)c2ccccc21",
+        "NC(C)Cc1ccccc1",
+    ]
+    expected = [get_scaffolds_single_mol(smi, "", max_rings=5) for smi in smiles_list]
+
+    n_observed = REGISTRY.get_sample_value(
+        "badapple_scaffold_generation_seconds_per_molecule_count"
+    )
+    engine = ScaffoldEngine(n_workers=2, chunk_size=2, max_pending=2)
+    try:
+        assert engine.get_scaffolds(smiles_list, max_rings=5) == expected
+        assert engine.stats()["pending_chunks"] == 0
+    finally:
+        engine._reset_executor()
+    # one latency observation per molecule (including those timed in worker processes)
+    assert REGISTRY.get_sample_value(
+        "badapple_scaffold_generation_seconds_per_molecule_count"
+    ) == n_observed + len(smiles_list)
+
+    # pool disabled -> same result computed in calling thread
+    engine = ScaffoldEngine(n_workers=0)
+    assert engine.get_scaffolds(smiles_list, max_rings=5) == expected
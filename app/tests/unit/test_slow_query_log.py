@@ -0,0 +1,77 @@
+"""
+Description:
+Tests for the slow query log (with mocked database).
+"""
+
+import json
+from unittest.mock import MagicMock, patch
+
+import database.slow_query_log
+import pytest
+from database.badapple import _build_active_assay_details_query
+from database.slow_query_log import close_slow_query_log, init_slow_query_log
+from database.statements import execute_statement
+
+
+def mock_cursor():
+    cursor = MagicMock()
+    cursor.connection.prepared_statements = set()
+    cursor.connection.info.dbname = "badapple2"
+    cursor.fetchall.return_value = [{"aid": 1}, {"aid": 2}]
+    # (plain cursor used for EXPLAIN)
+    explain_cursor = cursor.connection.cursor.return_value.__enter__.return_value
+    explain_cursor.fetchall.return_value = [("Seq Scan on scaf2cpd",), ("Execution",)]
+    return cursor
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / "slow_queries.log"
+    init_slow_query_log(str(path))
+    yield path
+    close_slow_query_log()
+    database.slow_query_log._explained.clear()
+
+
+def _read_log(path) -> list[dict]:
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_fast_query_not_logged(log_path):
+    query = _build_active_assay_details_query(3)
+    execute_statement(mock_cursor(), query, prepare=False)
+    assert _read_log(log_path) == []
+
+
+def test_slow_query_logged(log_path):
+    """
+    GIVEN a query slower than SLOW_QUERY_THRESHOLD
+    WHEN it is executed
+    THEN it is logged with its builder, parameters and row count (and EXPLAIN plan if enabled)
+    """
+    query = _build_active_assay_details_query(3)
+    query.builder = "_build_active_assay_details_query"
+    with patch.object(database.slow_query_log, "SLOW_QUERY_THRESHOLD", 0):
+        execute_statement(mock_cursor(), query, prepare=False)
+        with patch.object(database.slow_query_log, "SLOW_QUERY_EXPLAIN", True):
+            cursor = mock_cursor()
+            for _ in range(2):
+                execute_statement(cursor, query, prepare=False)
+    entries = _read_log(log_path)
+    assert len(entries) == 3
+    entry = entries[0]
+    assert entry["database"] == "badapple2"
+    assert entry["statement"] == query.statement.name
+    assert entry["builder"] == "_build_active_assay_details_query"
+    assert entry["params"] == {"scafid": 3}
+    assert entry["n_rows"] == 2
+    assert "explain" not in entry
+    assert entries[1]["explain"] == ["Seq Scan on scaf2cpd", "Execution"]
+    explain_cursor = cursor.connection.cursor.return_value.__enter__.return_value
+    sql_executed = [call.args[0] for call in explain_cursor.execute.call_args_list]
+    assert sql_executed[0] == "SAVEPOINT slow_query_explain;"
+    assert sql_executed[1].startswith("EXPLAIN (ANALYZE, BUFFERS) ")
+    # (the plan of a statement is captured at most once per SLOW_QUERY_EXPLAIN_INTERVAL)
+    assert "explain" not in entries[2]
@@ -0,0 +1,168 @@
+"""
+Description:
+Tests for the in-memory scaffold table snapshot (no database is required).
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+from database.badapple import BadAppleSession
+from database.snapshot import (
+    ScaffoldSnapshot,
+    SnapshotFileError,
+    get_scaffold_snapshot,
+    load_scaffold_snapshots,
+    open_snapshot_file,
+    save_snapshot_file,
+    set_scaffold_snapshot,
+)
+
+COLUMN_NAMES = ["id", "scafsmi", "kekule_scafsmi", "pscore", "in_drug", "prank"]
+ROWS = [
+    {
+        "id": 3,
+        "scafsmi": "c1ccc2ncccc2c1",
+        "kekule_scafsmi": "C1=CC=C2N=CC=CC2=C1",
+        "pscore": 428,
+        "in_drug": True,
+        "prank": 215,
+    },
+    {
+        "id": 534,
+        "scafsmi": "O=c1[nH]c(=O)c2[nH]cnc2[nH]1",
+        "kekule_scafsmi": None,
+        "pscore": None,
+        "in_drug": False,
+        "prank": 2926,
+    },
+    {
+        "id": 1,
+        "scafsmi": "C1CCNCC1",
+        "kekule_scafsmi": "C1CCNCC1",
+        "pscore": 0,
+        "in_drug": None,
+        "prank": 1,
+    },
+]
+
+
+@pytest.fixture
+def snapshot():
+    columns = {name: [row[name] for row in ROWS] for name in COLUMN_NAMES}
+    return ScaffoldSnapshot.from_columns(COLUMN_NAMES, columns, db_version="v1")
+
+
+def test_snapshot_lookups(snapshot):
+    """
+    GIVEN a snapshot built from rows of the scaffold table (with nulls)
+    WHEN scaffolds are looked up by SMILES or ID
+    THEN the rows are identical to the original ones, and missing scaffolds are None
+    """
+    for row in ROWS:
+        assert snapshot.get_by_smiles(row["scafsmi"]) == row
+        assert snapshot.get_by_id(row["id"]) == row
+        assert list(snapshot.get_by_id(row["id"]).keys()) == COLUMN_NAMES
+    assert snapshot.get_by_smiles("c1ccccc1") is None
+    assert snapshot.get_by_id(2) is None
+    assert snapshot.get_by_id(10**6) is None
+    assert snapshot.get_many_by_smiles(["C1CCNCC1", None, "c1ccccc1", "C1CCNCC1"]) == {
+        "C1CCNCC1": ROWS[2]
+    }
+    # values are plain Python types (so jsonify output is unchanged)
+    assert type(snapshot.get_by_id(3)["pscore"]) is int
+    assert type(snapshot.get_by_id(3)["in_drug"]) is bool
+
+
+def test_snapshot_stats(snapshot):
+    stats = snapshot.stats()
+    assert stats["rows"] == len(ROWS)
+    assert stats["db_version"] == "v1"
+    assert stats["memory_bytes"] == sum(a.nbytes for a in snapshot.arrays.values())
+
+
+def test_session_uses_snapshot(snapshot):
+    """
+    GIVEN a snapshot loaded for a database
+    WHEN scaffolds are looked up through BadAppleSession
+    THEN they are answered from the snapshot without connecting to the database
+    """
+    set_scaffold_snapshot("badapple2", snapshot)
+    try:
+        with patch(
+            "database.badapple.connect", side_effect=AssertionError("DB accessed")
+        ):
+            with BadAppleSession("badapple2", pooled=False) as db_session:
+                assert db_session.search_scaffold_by_smiles("C1CCNCC1") == [ROWS[2]]
+                assert db_session.search_scaffold_by_smiles("c1ccccc1") == []
+                assert db_session.search_scaffold_by_id(534) == [ROWS[1]]
+                assert db_session.search_scaffolds_by_smiles_batch(
+                    ["C1CCNCC1", "c1ccccc1"]
+                ) == {"C1CCNCC1": ROWS[2]}
+    finally:
+        set_scaffold_snapshot("badapple2", None)
+
+
+def test_snapshot_file(snapshot, tmp_path):
+    """
+    GIVEN a snapshot saved to a file
+    WHEN the file is memory-mapped
+    THEN lookups give the same rows as the original snapshot
+    """
+    path = str(tmp_path / "badapple2.snapshot")
+    save_snapshot_file(snapshot, path, "badapple2", release="2025.1")
+    mapped = open_snapshot_file(path, "badapple2", db_version="v1", release="2025.1")
+    assert mapped.source == path
+    assert mapped.stats()["release"] == "2025.1"
+    for row in ROWS:
+        assert mapped.get_by_smiles(row["scafsmi"]) == row
+        assert mapped.get_by_id(row["id"]) == row
+    assert mapped.get_by_smiles("c1ccccc1") is None
+    for name, array in snapshot.arrays.items():
+        assert mapped.arrays[name].dtype == array.dtype
+        assert (mapped.arrays[name] == array).all()
+    # no database needed when the release is given
+    set_scaffold_snapshot("badapple2", None)
+    with patch("database.badapple.connect", side_effect=AssertionError("DB accessed")):
+        load_scaffold_snapshots(["badapple2"], str(tmp_path), release="2025.1")
+    try:
+        assert get_scaffold_snapshot("badapple2").source == path
+    finally:
+        set_scaffold_snapshot("badapple2", None)
+
+
+def test_snapshot_file_refused(snapshot, tmp_path):
+    """
+    GIVEN a snapshot file
+    WHEN it is stale (other DB version/release) or corrupt
+    THEN it is refused
+    """
+    path = str(tmp_path / "badapple2.snapshot")
+    save_snapshot_file(snapshot, path, "badapple2", release="2025.1")
+    with pytest.raises(SnapshotFileError, match="db_version"):
+        open_snapshot_file(path, db_version="v2")
+    with pytest.raises(SnapshotFileError, match="release"):
+        open_snapshot_file(path, release="2026.1")
+    with pytest.raises(SnapshotFileError, match="db_name"):
+        open_snapshot_file(path, db_name="badapple_classic")
+    with patch(
+        "database.snapshot._get_live_db_version", side_effect=Exception("no DB")
+    ):
+        with pytest.raises(SnapshotFileError, match="database unavailable"):
+            load_scaffold_snapshots(["badapple2"], str(tmp_path))
+
+    with open(path, "r+b") as f:
+        f.seek(-1, 2)
+        last_byte = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last_byte[0] ^ 0xFF]))
+    with pytest.raises(SnapshotFileError, match="checksum"):
+        open_snapshot_file(path)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 8)
+    with pytest.raises(SnapshotFileError, match="truncated"):
+        open_snapshot_file(path)
+    with open(path, "wb") as f:
+        f.write(b"not a snapshot file" * 10)
+    with pytest.raises(SnapshotFileError, match="not a snapshot file"):
+        open_snapshot_file(path)
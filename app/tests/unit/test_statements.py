@@ -0,0 +1,122 @@
+"""
+Description:
+Tests for the prepared statements used by BadAppleSession (with mocked database).
+"""
+
+import time
+from unittest.mock import MagicMock
+
+from database.badapple import _build_associated_sids_query, _build_db_version_query
+from database.statements import (
+    Statement,
+    add_query_hook,
+    execute_statement,
+    get_statement_stats,
+    iter_statement,
+    remove_query_hook,
+)
+
+
+def mock_cursor():
+    cursor = MagicMock()
+    cursor.connection.prepared_statements = set()
+    cursor.fetchall.return_value = [{"id": 1}]
+    return cursor
+
+
+def test_statement_sql():
+    statement = Statement(
+        "test_statement", "SELECT * FROM t WHERE a=%(a)s AND b=%(b)s OR a2=%(a)s;"
+    )
+    assert statement.param_names == ["a", "b"]
+    assert (
+        statement.prepare_sql
+        == "PREPARE test_statement AS SELECT * FROM t WHERE a=$1 AND b=$2 OR a2=$1;"
+    )
+    assert statement.execute_sql == "EXECUTE test_statement (%(a)s, %(b)s);"
+    query = _build_db_version_query()
+    assert query.statement.execute_sql == "EXECUTE db_version;"
+    assert query.params == {}
+    assert _build_associated_sids_query((1, 2)).params == {"cid_list": [1, 2]}
+
+
+def test_execute_statement_prepares_once():
+    """
+    GIVEN a statement executed several times on the same connection
+    WHEN prepared statements are used
+    THEN it is only PREPAREd once, then EXECUTEd with its parameters
+    """
+    statement = Statement("test_prepared", "SELECT * FROM t WHERE a=%(a)s;")
+    cursor = mock_cursor()
+    for a in range(3):
+        assert execute_statement(cursor, statement.bind(a=a), prepare=True) == [
+            {"id": 1}
+        ]
+    sql_executed = [call.args[0] for call in cursor.execute.call_args_list]
+    assert sql_executed == [statement.prepare_sql] + [statement.execute_sql] * 3
+    assert cursor.execute.call_args.args[1] == {"a": 2}
+    assert cursor.connection.prepared_statements == {"test_prepared"}
+
+    # a new connection needs its own PREPARE
+    cursor = mock_cursor()
+    execute_statement(cursor, statement.bind(a=1), prepare=True)
+    assert cursor.execute.call_count == 2
+
+    stats = get_statement_stats()["test_prepared"]
+    assert stats["calls"] == 4
+    assert stats["prepares"] == 2
+
+
+def test_execute_statement_unprepared():
+    statement = Statement("test_unprepared", "SELECT * FROM t WHERE a=%(a)s;")
+    cursor = mock_cursor()
+    execute_statement(cursor, statement.bind(a=1), prepare=False)
+    cursor.execute.assert_called_once_with(statement.text, {"a": 1})
+    assert cursor.connection.prepared_statements == set()
+    assert get_statement_stats()["test_unprepared"]["prepares"] == 0
+
+
+def test_iter_statement():
+    """
+    GIVEN a statement whose rows are streamed
+    WHEN the rows are consumed
+    THEN they come from a named (server-side) cursor fetching itersize rows at a time
+    """
+    statement = Statement("test_stream", "SELECT * FROM t WHERE a=%(a)s;")
+    connection = MagicMock()
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.__iter__.return_value = iter([{"id": 1}, {"id": 2}])
+    rows = iter_statement(connection, statement.bind(a=1), itersize=100)
+    connection.cursor.assert_not_called()  # (nothing runs until rows are consumed)
+    assert list(rows) == [{"id": 1}, {"id": 2}]
+    assert connection.cursor.call_args.kwargs["name"].startswith("stream_test_stream")
+    assert cursor.itersize == 100
+    cursor.execute.assert_called_once_with(statement.text, {"a": 1})
+    assert get_statement_stats()["test_stream:stream"]["calls"] == 1
+
+
+def test_iter_statement_elapsed():
+    """
+    GIVEN a statement whose rows are streamed to a slow client
+    WHEN the rows are consumed
+    THEN the query hooks get the time until the first fetch, not the client's time
+    """
+    statement = Statement("test_stream_elapsed", "SELECT * FROM t;")
+    connection = MagicMock()
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.__iter__.return_value = iter([{"id": 1}, {"id": 2}])
+    calls = []
+
+    def hook(connection, query, elapsed, n_rows):
+        calls.append((query.statement.name, elapsed, n_rows))
+
+    add_query_hook(hook)
+    try:
+        for _ in iter_statement(connection, statement.bind(), itersize=100):
+            time.sleep(0.05)
+    finally:
+        remove_query_hook(hook)
+    assert len(calls) == 1
+    name, elapsed, n_rows = calls[0]
+    assert name == "test_stream_elapsed" and n_rows == 2
+    assert elapsed < 0.05
@@ -0,0 +1,52 @@
+"""
+Description:
+Tests for utils/streaming.py
+"""
+
+import json
+
+import psycopg2
+import pytest
+from flask import Flask
+from utils.streaming import ndjson_response
+from werkzeug.exceptions import ServiceUnavailable
+
+
+def _rows_then(error: Exception):
+    yield {"scafsmi": "c1ccc2ncccc2c1"}
+    raise error
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route("/busy")
+    def busy_route():
+        return ndjson_response(_rows_then(ServiceUnavailable("Server busy")))
+
+    @app.route("/db_error")
+    def db_error_route():
+        return ndjson_response(_rows_then(psycopg2.OperationalError("gone")))
+
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.mark.parametrize(
+    "route, error_msg",
+    [
+        ("/busy", "Server busy"),
+        ("/db_error", "Database error, please try again later"),
+    ],
+)
+def test_error_while_streaming(client, route, error_msg):
+    """
+    GIVEN a streamed response
+    WHEN producing the items fails after the first item
+    THEN the error is reported as a final line (the status code was already sent)
+    """
+    response = client.get(route)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert lines == [{"scafsmi": "c1ccc2ncccc2c1"}, {"error_msg": error_msg}]
@@ -0,0 +1,113 @@
+"""
+Description:
+Tests for request tracing (Server-Timing header and OpenTelemetry JSON export).
+"""
+
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+import utils.tracing
+from database.badapple import _build_scaffold_by_id_query
+from database.statements import execute_statement, remove_query_hook
+from flask import Flask, jsonify
+from utils.tracing import init_tracing, span
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+@pytest.fixture
+def export_path(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    with patch.object(utils.tracing, "TRACING_EXPORTER", "file"), patch.object(
+        utils.tracing, "TRACING_EXPORT_PATH", str(path)
+    ):
+        yield path
+
+
+@pytest.fixture
+def client(export_path):
+    app = Flask(__name__)
+    init_tracing(app)
+
+    @app.route("/scaffolds")
+    def scaffolds_route():
+        with span("parse"):
+            pass
+        with span("hiers", n_molecules=2):
+            time.sleep(0.01)
+        cursor = MagicMock()
+        cursor.connection.info.dbname = "badapple2"
+        cursor.fetchall.return_value = [{"id": 1}]
+        for scafid in [1, 2]:
+            execute_statement(cursor, _build_scaffold_by_id_query(scafid), False)
+        with span("serialize"):
+            return jsonify([])
+
+    with app.test_client() as client:
+        yield client
+    remove_query_hook(utils.tracing._trace_query)
+
+
+def _server_timing(response) -> dict[str, float]:
+    timings = {}
+    for metric in response.headers["Server-Timing"].split(", "):
+        name, duration = metric.split(";dur=")
+        timings[name] = float(duration)
+    return timings
+
+
+def test_server_timing(client):
+    """
+    GIVEN a request which passes through several stages
+    WHEN it is traced
+    THEN the Server-Timing header has the total time per stage
+    """
+    with client.get("/scaffolds") as response:
+        timings = _server_timing(response)
+    assert list(timings) == ["parse", "hiers", "db", "serialize", "total"]
+    assert timings["hiers"] >= 10
+    assert timings["total"] >= sum(
+        duration for name, duration in timings.items() if name != "total"
+    )
+    assert response.headers["Timing-Allow-Origin"] == "*"
+
+
+def test_export(client, export_path):
+    headers = {"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"}
+    client.get("/scaffolds", headers=headers).close()
+    client.get("/scaffolds").close()
+    lines = export_path.read_text().splitlines()
+    assert len(lines) == 2
+    spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == [
+        "GET /scaffolds",
+        "parse",
+        "hiers",
+        "db",
+        "db",
+        "serialize",
+    ]
+    root = spans[0]
+    # (continues the trace of the client)
+    assert all(span["traceId"] == TRACE_ID for span in spans)
+    assert root["parentSpanId"] == "00f067aa0ba902b7"
+    assert all(span["parentSpanId"] == root["spanId"] for span in spans[1:])
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in root[
+        "attributes"
+    ]
+    assert {"key": "db.statement.name", "value": {"stringValue": "scaffold_by_id"}} in (
+        spans[3]["attributes"]
+    )
+    assert all(
+        int(span["startTimeUnixNano"]) <= int(span["endTimeUnixNano"]) for span in spans
+    )
+    other_spans = json.loads(lines[1])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert other_spans[0]["traceId"] != TRACE_ID
+    assert "parentSpanId" not in other_spans[0]
+
+
+def test_span_outside_request():
+    with span("parse") as current:
+        assert current is None
@@ -0,0 +1,170 @@
+"""
+Description:
+Compression of responses, negotiated with the Accept-Encoding header of the request: gzip, and
+zstd/brotli if the optional zstandard/brotli packages are installed.
+
+Buffered responses are compressed if they are at least COMPRESSION_MIN_SIZE bytes (and get
+smaller). Streamed responses (NDJSON, job result files) are compressed as they are sent, each
+chunk is flushed so that clients can decode every row as soon as it arrives.
+"""
+
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from config import (
+    COMPRESSION_BROTLI_LEVEL,
+    COMPRESSION_ENCODINGS,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_MIN_SIZE,
+    COMPRESSION_ZSTD_LEVEL,
+)
+from flask import Flask, request
+from utils.request_processing import NDJSON_MIMETYPE
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    NDJSON_MIMETYPE,
+    "text/tab-separated-values",
+    "text/csv",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/javascript",
+    "application/javascript",
+}
+
+
+class _GzipCompressor:
+    def __init__(self):
+        self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _ZstdCompressor:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(
+            level=COMPRESSION_ZSTD_LEVEL
+        ).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_LEVEL)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+_COMPRESSORS = {"gzip": _GzipCompressor}
+if zstandard is not None:
+    _COMPRESSORS["zstd"] = _ZstdCompressor
+if brotli is not None:
+    _COMPRESSORS["br"] = _BrotliCompressor
+
+
+def get_available_encodings() -> list[str]:
+    """Encodings used for responses, in order of preference (COMPRESSION_ENCODINGS)."""
+    return [encoding for encoding in COMPRESSION_ENCODINGS if encoding in _COMPRESSORS]
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """
+    Encoding with the highest quality in accept_encodings (werkzeug's Accept of the
+    Accept-Encoding header), ties are broken by our preference. None if none is acceptable.
+    """
+    best, best_quality = None, 0
+    for encoding in get_available_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compress_stream(chunks: Iterable, compressor) -> Iterator[bytes]:
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _should_compress(response) -> bool:
+    if not (200 <= response.status_code < 300) or response.status_code in (204, 206):
+        return False
+    if "Content-Encoding" in response.headers or "Range" in request.headers:
+        return False
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return False
+    # (size of streamed responses is only known for files)
+    size = response.content_length
+    return size is None or size >= COMPRESSION_MIN_SIZE
+
+
+def compress_response(response):
+    if not _should_compress(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    compressor = _COMPRESSORS[encoding]()
+    if response.is_streamed:
+        chunks = response.response
+        response.response = ClosingIterator(
+            _compress_stream(chunks, compressor), getattr(chunks, "close", None)
+        )
+        response.direct_passthrough = False
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        compressed = compressor.compress(data) + compressor.finish()
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    # the compressed body is a different representation (no byte ranges of it are served)
+    response.headers.pop("Accept-Ranges", None)
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app: Flask):
+    app.after_request(compress_response)
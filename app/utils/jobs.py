@@ -0,0 +1,474 @@
+"""
+Description:
+Background jobs for scoring large compound files (see blueprints/jobs.py).
+
+Jobs are stored in a SQLite database under JOB_DIR (no external services required), along with
+one directory per job holding the uploaded input file and the output TSV. Every gunicorn worker
+runs a JobRunner: a dispatcher thread which claims queued jobs (at most JOB_MAX_CONCURRENT
+running jobs across all workers) and processes them in batches. After each batch the output is
+flushed to disk and the job's progress (number of molecules done + output size) is committed,
+so a job whose worker died is picked up again (once its heartbeat is older than
+JOB_STALE_TIMEOUT) and resumed from the last completed batch.
+"""
+
+import csv
+import io
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+import pandas as pd
+import psycopg2
+from config import (
+    JOB_BATCH_SIZE,
+    JOB_DIR,
+    JOB_MAX_CONCURRENT,
+    JOB_POLL_INTERVAL,
+    JOB_RETENTION,
+    JOB_STALE_TIMEOUT,
+)
+from loguru import logger
+from werkzeug.exceptions import HTTPException
+
+# same columns as the output of example_scripts/get_compound_scores.py
+OUTPUT_HEADER = [
+    "molIdx",
+    "molSmiles",
+    "molName",
+    "validMol",
+    "scafSmiles",
+    "inDB",
+    "scafID",
+    "pScore",
+    "inDrug",
+    "substancesTested",
+    "substancesActive",
+    "assaysTested",
+    "assaysActive",
+    "samplesTested",
+    "samplesActive",
+]
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+def get_output_rows(mol_idx: int, badapple_dict: dict) -> list[list]:
+    """Output TSV rows for one molecule (entry of get_associated_scaffolds_ordered)."""
+    scaffold_infos = badapple_dict.get("scaffolds", None)
+    valid_mol = scaffold_infos is not None
+    if not valid_mol or len(scaffold_infos) == 0:
+        return [
+            [
+                mol_idx,
+                badapple_dict["molecule_smiles"],
+                badapple_dict["name"],
+                valid_mol,
+            ]
+            + [None] * (len(OUTPUT_HEADER) - 4)
+        ]
+    rows = []
+    for d in scaffold_infos:
+        rows.append(
+            [
+                mol_idx,
+                badapple_dict["molecule_smiles"],
+                badapple_dict["name"],
+                valid_mol,
+                d["scafsmi"],
+                d["in_db"],
+                d.get("id", None),  # None if not(in_db)
+                d.get("pscore", None),
+                d.get("in_drug", None),
+                d.get("nsub_tested", None),
+                d.get("nsub_active", None),
+                d.get("nass_tested", None),
+                d.get("nass_active", None),
+                d.get("nsam_tested", None),
+                d.get("nsam_active", None),
+            ]
+        )
+    return rows
+
+
+def _to_tsv(rows: list[list]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter="\t").writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def read_input(job: dict, chunksize: Optional[int] = None, nrows: Optional[int] = None):
+    """Read the input file of a job (all values as strings, like they were given)."""
+    return pd.read_csv(
+        job["input_path"],
+        sep=job["idelim"],
+        header=0 if job["iheader"] else None,
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunksize,
+        nrows=nrows,
+    )
+
+
+class JobStore:
+    """
+    SQLite-backed job queue. Safe to use from several threads and processes
+    (each thread of each process uses its own connection).
+    """
+
+    def __init__(self, job_dir: str = JOB_DIR):
+        self.job_dir = job_dir
+        os.makedirs(job_dir, exist_ok=True)
+        self.db_path = os.path.join(job_dir, "jobs.db")
+        self._local = threading.local()
+        conn = self._get_connection()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            filename TEXT,
+            idelim TEXT NOT NULL,
+            iheader INTEGER NOT NULL,
+            smiles_column INTEGER NOT NULL,
+            name_column INTEGER NOT NULL,
+            max_rings INTEGER NOT NULL,
+            database TEXT NOT NULL,
+            n_total INTEGER,
+            n_done INTEGER NOT NULL DEFAULT 0,
+            output_offset INTEGER NOT NULL DEFAULT 0,
+            owner TEXT,
+            heartbeat REAL,
+            error_msg TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+            )"""
+        )
+
+    def _get_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # autocommit mode, transactions are started explicitly where needed
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_job_dir(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, job_id)
+
+    def _to_dict(self, row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job_dir = self.get_job_dir(job["job_id"])
+        job["input_path"] = os.path.join(job_dir, "input")
+        job["output_path"] = os.path.join(job_dir, "output.tsv")
+        return job
+
+    def create_job(
+        self,
+        save_input: Callable[[str], None],
+        validate_input: Optional[Callable[[dict], None]] = None,
+        **params,
+    ) -> dict:
+        """
+        Create a new (queued) job. save_input is called with the path the input file
+        should be saved to, params are the columns of the jobs table (idelim, iheader, ...).
+        validate_input (optional) is called with the job before it is queued, if it raises
+        the job's files are removed and the exception is propagated.
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = self.get_job_dir(job_id)
+        os.makedirs(job_dir)
+        now = time.time()
+        params = dict(params, job_id=job_id, status=JOB_QUEUED)
+        params["created_at"] = params["updated_at"] = now
+        try:
+            save_input(os.path.join(job_dir, "input"))
+            if validate_input is not None:
+                validate_input(self._to_dict(params))
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        columns = ", ".join(params.keys())
+        placeholders = ", ".join("?" * len(params))
+        self._get_connection().execute(
+            f"INSERT INTO jobs ({columns}) VALUES ({placeholders})",
+            list(params.values()),
+        )
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        row = (
+            self._get_connection()
+            .execute("SELECT * FROM jobs WHERE job_id = ?", [job_id])
+            .fetchone()
+        )
+        return self._to_dict(row) if row is not None else None
+
+    def claim_job(self, owner: str, max_running: int) -> Optional[dict]:
+        """
+        Mark the oldest queued job as running (owned by owner) and return it,
+        None if there is no queued job or max_running jobs are already running.
+        """
+        conn = self._get_connection()
+        conn.execute("BEGIN IMMEDIATE")  # lock, so two workers can't claim the same job
+        try:
+            (n_running,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", [JOB_RUNNING]
+            ).fetchone()
+            row = None
+            if n_running < max_running:
+                row = conn.execute(
+                    "SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                    [JOB_QUEUED],
+                ).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, updated_at = ? WHERE job_id = ?",
+                    [JOB_RUNNING, owner, now, now, row["job_id"]],
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get_job(row["job_id"]) if row is not None else None
+
+    def _update_owned(self, job_id: str, current_owner: str, **values) -> bool:
+        # only the current owner may update a running job, returns False if ownership was lost
+        values["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        cursor = self._get_connection().execute(
+            f"UPDATE jobs SET {assignments} WHERE job_id = ? AND owner = ? AND status = ?",
+            list(values.values()) + [job_id, current_owner, JOB_RUNNING],
+        )
+        return cursor.rowcount == 1
+
+    def set_total(self, job_id: str, owner: str, n_total: int) -> bool:
+        return self._update_owned(job_id, owner, n_total=n_total)
+
+    def update_progress(
+        self, job_id: str, owner: str, n_done: int, output_offset: int
+    ) -> bool:
+        return self._update_owned(
+            job_id,
+            owner,
+            n_done=n_done,
+            output_offset=output_offset,
+            heartbeat=time.time(),
+        )
+
+    def finish_job(self, job_id: str, owner: str) -> bool:
+        return self._update_owned(job_id, owner, status=JOB_DONE, owner=None)
+
+    def fail_job(self, job_id: str, owner: str, error_msg: str) -> bool:
+        return self._update_owned(
+            job_id, owner, status=JOB_FAILED, owner=None, error_msg=error_msg
+        )
+
+    def release_job(self, job_id: str, owner: str) -> bool:
+        """Put a running job back in the queue (it will resume from its last batch)."""
+        return self._update_owned(job_id, owner, status=JOB_QUEUED, owner=None)
+
+    def requeue_stale_jobs(self, stale_timeout: float) -> int:
+        """Re-queue running jobs whose owner stopped sending heartbeats (e.g., worker restart)."""
+        cursor = self._get_connection().execute(
+            "UPDATE jobs SET status = ?, owner = NULL, updated_at = ? WHERE status = ? AND heartbeat < ?",
+            [JOB_QUEUED, time.time(), JOB_RUNNING, time.time() - stale_timeout],
+        )
+        return cursor.rowcount
+
+    def delete_old_jobs(self, retention: float) -> int:
+        """Delete finished/failed jobs (and their files) last updated more than retention seconds ago."""
+        conn = self._get_connection()
+        rows = conn.execute(
+            "SELECT job_id FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            [JOB_DONE, JOB_FAILED, time.time() - retention],
+        ).fetchall()
+        for row in rows:
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", [row["job_id"]])
+            shutil.rmtree(self.get_job_dir(row["job_id"]), ignore_errors=True)
+        return len(rows)
+
+
+class _OwnershipLost(Exception):
+    """The job was re-queued/claimed by another worker while it was being processed."""
+
+
+class JobRunner:
+    """
+    Claims queued jobs from a JobStore and processes them in background threads.
+
+    score_batch(smiles_list, name_list, max_rings, database) must return one
+    get_associated_scaffolds_ordered entry per input molecule, in input order.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        score_batch: Callable,
+        max_concurrent: int = JOB_MAX_CONCURRENT,
+        batch_size: int = JOB_BATCH_SIZE,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        stale_timeout: float = JOB_STALE_TIMEOUT,
+        retention: float = JOB_RETENTION,
+    ):
+        self.store = store
+        self.score_batch = score_batch
+        self.max_concurrent = max_concurrent
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stale_timeout = stale_timeout
+        self.retention = retention
+        self._threads = []
+        self._stop = threading.Event()
+        self._dispatcher = None
+
+    def _new_owner(self) -> str:
+        return f"{os.getpid()}:{uuid.uuid4().hex}"
+
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(
+                target=self._dispatch_loop, name="job-dispatcher", daemon=True
+            )
+            self._dispatcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Job dispatcher error")
+            self._stop.wait(self.poll_interval)
+
+    def run_once(self):
+        """Re-queue stale jobs, delete old ones, and start threads for newly claimed jobs."""
+        self.store.requeue_stale_jobs(self.stale_timeout)
+        if self.retention > 0:
+            self.store.delete_old_jobs(self.retention)
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.max_concurrent:
+            owner = self._new_owner()
+            job = self.store.claim_job(owner, self.max_concurrent)
+            if job is None:
+                break
+            thread = threading.Thread(
+                target=self.process_job,
+                args=(job, owner),
+                name=f"job-{job['job_id']}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def process_job(self, job: dict, owner: str):
+        job_id = job["job_id"]
+        try:
+            self._process_job(job, owner)
+        except _OwnershipLost:
+            logger.warning(f"Job {job_id} was taken over by another worker")
+        except Exception as e:
+            if isinstance(e, psycopg2.OperationalError) or (
+                isinstance(e, HTTPException) and e.code == 503
+            ):
+                # server busy or DB unavailable: retry later, from the last completed batch
+                logger.warning(
+                    f"Job {job_id} re-queued: {getattr(e, 'description', None) or e}"
+                )
+                self.store.release_job(job_id, owner)
+                return
+            logger.exception(f"Job {job_id} failed")
+            self.store.fail_job(job_id, owner, f"{type(e).__name__}: {e}")
+
+    def _process_job(self, job: dict, owner: str):
+        job_id = job["job_id"]
+        n_total = job["n_total"]
+        if n_total is None:
+            n_total = sum(len(chunk) for chunk in read_input(job, chunksize=100_000))
+            if not self.store.set_total(job_id, owner, n_total):
+                raise _OwnershipLost()
+
+        n_done = job["n_done"]
+        mode = "r+b" if os.path.exists(job["output_path"]) else "wb"
+        with open(job["output_path"], mode) as output_file:
+            if n_done == 0:
+                header = list(OUTPUT_HEADER)
+                if job["iheader"]:
+                    columns = read_input(job, nrows=0).columns
+                    header[2] = columns[job["name_column"]]
+                output_file.truncate(0)
+                output_offset = output_file.write(_to_tsv([header]))
+                self._commit_progress(output_file, job_id, owner, 0, output_offset)
+            else:
+                # drop anything written after the last committed batch
+                output_offset = job["output_offset"]
+                output_file.truncate(output_offset)
+                output_file.seek(output_offset)
+
+            mol_idx = 0
+            for chunk in read_input(job, chunksize=self.batch_size):
+                if mol_idx + len(chunk) <= n_done:
+                    mol_idx += len(chunk)
+                    continue
+                chunk = chunk.iloc[max(0, n_done - mol_idx) :]
+                mol_idx = max(mol_idx, n_done)
+                smiles_list = chunk.iloc[:, job["smiles_column"]].tolist()
+                name_list = chunk.iloc[:, job["name_column"]].tolist()
+                results = self.score_batch(
+                    smiles_list, name_list, job["max_rings"], job["database"]
+                )
+                rows = []
+                for badapple_dict in results:
+                    rows.extend(get_output_rows(mol_idx, badapple_dict))
+                    mol_idx += 1
+                output_offset += output_file.write(_to_tsv(rows))
+                n_done = mol_idx
+                self._commit_progress(output_file, job_id, owner, n_done, output_offset)
+
+        if not self.store.finish_job(job_id, owner):
+            raise _OwnershipLost()
+
+    def _commit_progress(self, output_file, job_id, owner, n_done, output_offset):
+        # make sure the output is on disk before recording it as done
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        if not self.store.update_progress(job_id, owner, n_done, output_offset):
+            raise _OwnershipLost()
+
+
+_store = None
+_runner = None
+_runner_pid = None
+_runner_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    global _store
+    with _runner_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
+
+
+def get_job_runner(score_batch: Callable) -> JobRunner:
+    """Start (if needed) and return this process's JobRunner."""
+    global _runner, _runner_pid
+    store = get_job_store()
+    with _runner_lock:
+        # one runner per gunicorn worker (created lazily so its threads are not lost to a fork)
+        if _runner is None or _runner_pid != os.getpid():
+            _runner = JobRunner(store, score_batch)
+            _runner_pid = os.getpid()
+            _runner.start()
+        return _runner
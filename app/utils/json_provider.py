@@ -0,0 +1,82 @@
+"""
+Description:
+JSON provider which serializes responses (jsonify) with orjson, if it is installed (optional),
+instead of the json module used by Flask's default provider. RealDictRow results (dict
+subclasses) are then serialized natively in C instead of field by field in Python.
+
+The output is identical to that of the default provider (sorted keys, compact separators, and
+the types handled by its default, e.g., Decimal or date). Anything orjson can't produce the same
+way is serialized by the default provider instead: non-str keys, ints beyond 64 bits,
+non-ASCII strings (which the default provider escapes), floats which the json module writes
+with an exponent (1e-07 rather than 1e-7 or 0.0000001) and NaN/Infinity (which orjson writes as
+null). The floats are detected in orjson's output, so the check may also send payloads with
+strings like "3e5" to the default provider, which only costs time.
+"""
+
+import dataclasses
+import math
+import re
+from typing import Optional
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# floats orjson writes differently than the json module: with an exponent (1e-7 vs 1e-07,
+# 1e16 vs 1e+16), or without one where the json module uses one (0.00001 vs 1e-05)
+_DIVERGENT_FLOAT = re.compile(rb"[0-9][eE]|0\.0000")
+
+
+def _has_non_finite_float(obj) -> bool:
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+            stack.extend(vars(value).values())
+    return False
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def _orjson_dumps(self, obj) -> Optional[bytes]:
+        """obj serialized by orjson, or None if it must be serialized by the default provider."""
+        # (default handles the same types as for the json module, e.g. dates as HTTP dates)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            data = orjson.dumps(obj, default=self.default, option=option)
+        except orjson.JSONEncodeError:
+            return None
+        if self.ensure_ascii and not data.isascii():
+            return None
+        if _DIVERGENT_FLOAT.search(data) is not None:
+            return None
+        # (NaN/Infinity are written as null, so only payloads with a null can contain them)
+        if b"null" in data and _has_non_finite_float(obj):
+            return None
+        return data
+
+    def _use_orjson(self) -> bool:
+        # (pretty printed output, e.g. in debug mode, is left to the default provider)
+        return orjson is not None and (
+            self.compact or (self.compact is None and not self._app.debug)
+        )
+
+    def response(self, *args, **kwargs):
+        if not self._use_orjson():
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        data = self._orjson_dumps(obj)
+        if data is None:
+            return super().response(obj)
+        return self._app.response_class(data + b"\n", mimetype=self.mimetype)
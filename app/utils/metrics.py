@@ -0,0 +1,154 @@
+"""
+Description:
+Prometheus metrics of the API, exported by the /metrics endpoint (see blueprints/metrics.py):
+- latency of requests (per route) and number of requests in progress
+- latency of BadAppleSession methods (database queries, or snapshot lookups)
+- scaffold generation (HierS) time per molecule, molecules per request and scaffolds per molecule
+  (to tell whether slow compound_search requests are RDKit- or Postgres-bound)
+
+With gunicorn, set PROMETHEUS_MULTIPROC_DIR (an empty directory, see gunicorn.conf.py) so the
+metrics of all workers are aggregated, otherwise each worker only reports its own.
+"""
+
+import functools
+import inspect
+import os
+import time
+
+from flask import Flask, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    # (metric files are created as soon as metrics are defined)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# seconds
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+REQUEST_LATENCY = Histogram(
+    "badapple_request_duration_seconds",
+    "Time to handle a request (until the last byte of streamed responses)",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "badapple_requests_in_progress",
+    "Requests currently being handled",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+DB_SESSION_LATENCY = Histogram(
+    "badapple_db_session_duration_seconds",
+    "Time spent in BadAppleSession methods (until the last row of iter_* methods)",
+    ["db_name", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+SCAFFOLD_GENERATION_LATENCY = Histogram(
+    "badapple_scaffold_generation_seconds_per_molecule",
+    "Scaffold generation (HierS) time per molecule",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+MOLECULES_PER_REQUEST = Histogram(
+    "badapple_molecules_per_request",
+    "Number of molecules (SMILES) per compound_search request",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000),
+)
+SCAFFOLDS_PER_MOLECULE = Histogram(
+    "badapple_scaffolds_per_molecule",
+    "Number of scaffolds of each (valid) molecule",
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50),
+)
+
+
+def _get_route() -> str:
+    # (route template, e.g. ".../get_associated_compounds", so the number of labels is bounded)
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _before_request():
+    g.metrics_route = _get_route()
+    g.metrics_start = time.perf_counter()
+    REQUESTS_IN_PROGRESS.labels(g.metrics_route).inc()
+
+
+def _after_request(response):
+    # recorded once the response was sent (i.e. after the last chunk of streamed responses)
+    route, start = g.pop("metrics_route", None), g.pop("metrics_start", None)
+    if start is None:
+        return response
+    method, status = request.method, response.status_code
+
+    def observe():
+        REQUEST_LATENCY.labels(route, method, status).observe(
+            time.perf_counter() - start
+        )
+        REQUESTS_IN_PROGRESS.labels(route).dec()
+
+    response.call_on_close(observe)
+    return response
+
+
+def init_metrics(app: Flask):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+def _observe_iterator(iterator, histogram, start: float):
+    try:
+        yield from iterator
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def _instrument_method(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        histogram = DB_SESSION_LATENCY.labels(self.db_name, method.__name__)
+        start = time.perf_counter()
+        result = method(self, *args, **kwargs)
+        if inspect.isgenerator(result):
+            return _observe_iterator(result, histogram, start)
+        histogram.observe(time.perf_counter() - start)
+        return result
+
+    return wrapper
+
+
+def instrument_session_methods(cls):
+    """Class decorator, records the latency of each public method of a BadAppleSession."""
+    for name, method in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.isfunction(method):
+            setattr(cls, name, _instrument_method(method))
+    return cls
+
+
+def generate_metrics() -> tuple[bytes, str]:
+    """Metrics in the Prometheus text format (of all gunicorn workers in multiprocess mode)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
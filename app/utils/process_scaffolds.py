@@ -5,9 +5,21 @@ Description:
 Functions related to getting scaffolds from input molecule(s).
 """
 
+from typing import Iterator
+
 import pandas as pd
+from config import SCAFFOLD_HIERARCHY_CACHE_SIZE
+from utils.cache import LRUCache
+from utils.scaffolds.cached_hiers import CachedHierS
 from utils.scaffolds.hiers import CustomHierS
 
+# process-wide cache: top-level scaffold identifier -> valid scaffolds in its hierarchy
+_hierarchy_cache = LRUCache(SCAFFOLD_HIERARCHY_CACHE_SIZE)
+
+
+def get_hierarchy_cache() -> LRUCache:
+    return _hierarchy_cache
+
 
 # NOTE: the functions/lines in scaffolds.hiers and below should match exactly what was used in generate_scaffolds.py
 # https://github.com/unmtransinfo/Badapple2/blob/main/src/generate_scaffolds.py
@@ -30,28 +42,52 @@ def is_valid_scaf(scaf_rep: str):
 # END OF EXACT MATCH
 
 
+def _get_scaffolds_for_molecule(network: CustomHierS, mol_name: str) -> list[str]:
+    if isinstance(network, CachedHierS):
+        if mol_name in network.cached_scaffolds:
+            return list(network.cached_scaffolds[mol_name])
+        scaffolds = _traverse_scaffolds_for_molecule(network, mol_name)
+        if mol_name in network.top_level_scaffolds:
+            network.hierarchy_cache.put(
+                network.top_level_scaffolds[mol_name], tuple(scaffolds)
+            )
+        return scaffolds
+    return _traverse_scaffolds_for_molecule(network, mol_name)
+
+
+def _traverse_scaffolds_for_molecule(network: CustomHierS, mol_name: str) -> list[str]:
+    scaffolds = []
+    for scaf_node in network.get_scaffolds_for_molecule(mol_name, data=True):
+        scaf_rep = scaf_node[0]
+        if is_valid_scaf(scaf_rep):
+            scaffolds.append(scaf_rep)
+    return scaffolds
+
+
 def get_mol2scaf_dict(network: CustomHierS) -> dict[str, list[str]]:
     mol_to_scafs = {}
     for mol_node in network.get_molecule_nodes(data=True):
         mol_name = mol_node[0]
         mol_smiles = mol_node[1]["smiles"]
-        mol_to_scafs[mol_smiles] = []
-        mol_scaffolds = network.get_scaffolds_for_molecule(mol_name, data=True)
-        for scaf_node in mol_scaffolds:
-            scaf_rep = scaf_node[0]
-            if is_valid_scaf(scaf_rep):
-                mol_to_scafs[mol_smiles].append(scaf_rep)
+        mol_to_scafs[mol_smiles] = _get_scaffolds_for_molecule(network, mol_name)
     return mol_to_scafs
 
 
-def get_scaffolds_single_mol(mol_smiles: str, name: str, max_rings: int):
+def get_scaffolds_single_mol(
+    mol_smiles: str, name: str, max_rings: int, fragment_cache: dict = None
+):
     if mol_smiles == "":
         # technically the empty string is considered a valid SMILES, but don't bother processing
         return {}
     # setup network
     smiles_dict = {"Smiles": [mol_smiles], "Name": [name]}
     smiles_df = pd.DataFrame.from_dict(smiles_dict)
-    network = CustomHierS.from_dataframe(smiles_df, ring_cutoff=max_rings)
+    network = CachedHierS.from_dataframe(
+        smiles_df,
+        ring_cutoff=max_rings,
+        hierarchy_cache=_hierarchy_cache,
+        fragment_cache=fragment_cache,
+    )
     # get scaffolds, convert to json for use with API / UI
     mol2scafs = get_mol2scaf_dict(network)
     if len(mol2scafs.keys()) < 1:
@@ -62,3 +98,23 @@ def get_scaffolds_single_mol(mol_smiles: str, name: str, max_rings: int):
         "scaffolds": list(mol2scafs.values())[0],
     }
     return result
+
+
+def iter_scaffolds_batch(smiles_list: list[str], max_rings: int) -> Iterator[dict]:
+    """
+    Equivalent to (get_scaffolds_single_mol(smi, "", max_rings) for smi in smiles_list),
+    but scaffolds shared between molecules (and their parents) are only fragmented once.
+    Each molecule still gets its own network: the order of a molecule's scaffolds depends on
+    the atom ordering of the scaffolds they were fragmented from, which a network shared with
+    other molecules would not preserve.
+    """
+    fragment_cache = {}
+    for smiles in smiles_list:
+        yield get_scaffolds_single_mol(
+            smiles, "", max_rings, fragment_cache=fragment_cache
+        )
+
+
+def get_scaffolds_batch(smiles_list: list[str], max_rings: int) -> list[dict]:
+    """Scaffolds for each SMILES in smiles_list, see iter_scaffolds_batch."""
+    return list(iter_scaffolds_batch(smiles_list, max_rings))
@@ -0,0 +1,196 @@
+"""
+Description:
+Sampling profiler for dev deployments (PROFILER_ENABLED, never registered in production, see
+app.py). While a request is handled, a background thread samples the stack of the thread
+handling it every PROFILER_INTERVAL ms, so hot spots of real inputs (e.g., canon_smiles,
+RingSystemFinder, fragment, psycopg2) show up without reproducing them by hand.
+
+- requests with the header "X-Profile: 1" get the collapsed stacks of the request
+  ("frame;frame;frame count" lines, the input of flamegraph.pl/speedscope) instead of its body
+- the profiles of the last PROFILER_HISTORY requests are kept, see blueprints/profiler.py
+  for the top functions (by cumulative time) and their collapsed stacks
+
+Time in C extensions (RDKit, psycopg2) is attributed to the Python function calling them.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from config import PROFILER_HISTORY, PROFILER_INTERVAL
+from flask import Flask, Response, g, request
+
+PROFILE_HEADER = "X-Profile"
+PROFILED_STATUS_HEADER = "X-Profiled-Status"
+
+
+class Profile:
+    """Samples of the stack of one request (thread)."""
+
+    def __init__(self, thread_id: int, name: str):
+        self.thread_id = thread_id
+        self.name = name
+        self.stacks = Counter()  # collapsed stack -> number of samples
+        self.n_samples = 0
+        self.start = time.time()
+        self.duration = None
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+_labels = {}  # code object -> frame label
+
+
+def _frame_label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        label = f"{module}:{code.co_qualname}"
+        _labels[code] = label
+    return label
+
+
+def collapse_stack(frame) -> str:
+    """Frames of the stack from the outermost to frame, separated by ";"."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads being profiled every interval seconds (from a daemon
+    thread, which waits while no thread is profiled) and keeps the last history profiles.
+    """
+
+    def __init__(self, interval: float, history: int):
+        self.interval = interval
+        self.history = deque(maxlen=history)
+        self._active = {}  # thread ID -> Profile
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self, name: str) -> Profile:
+        """Start profiling the calling thread."""
+        profile = Profile(threading.get_ident(), name)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="sampling-profiler", daemon=True
+                )
+                self._thread.start()
+            self._active[profile.thread_id] = profile
+            self._cond.notify()
+        return profile
+
+    def stop(self, profile: Profile):
+        with self._cond:
+            if self._active.get(profile.thread_id) is profile:
+                del self._active[profile.thread_id]
+                profile.duration = time.time() - profile.start
+                self.history.append(profile)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._cond:
+                for thread_id, profile in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.stacks[collapse_stack(frame)] += 1
+                        profile.n_samples += 1
+            del frames
+
+    def get_profiles(self, n_requests: Optional[int] = None) -> list[Profile]:
+        """The last n_requests (default: all kept) finished profiles."""
+        with self._cond:
+            profiles = list(self.history)
+        if n_requests is not None:
+            profiles = profiles[-n_requests:] if n_requests > 0 else []
+        return profiles
+
+
+def merge_stacks(profiles: list[Profile]) -> Counter:
+    stacks = Counter()
+    for profile in profiles:
+        stacks.update(profile.stacks)
+    return stacks
+
+
+def top_functions(profiles: list[Profile], n: int, interval: float) -> list[dict]:
+    """
+    The n functions with the most cumulative time (samples in which they are on the stack)
+    over profiles, with their self time (samples in which they are the innermost frame).
+    """
+    cumulative, own = Counter(), Counter()
+    n_samples = 0
+    for stack, count in merge_stacks(profiles).items():
+        labels = stack.split(";")
+        n_samples += count
+        for label in set(labels):
+            cumulative[label] += count
+        own[labels[-1]] += count
+    return [
+        {
+            "function": label,
+            "cumulative_ms": round(count * interval * 1000, 1),
+            "self_ms": round(own[label] * interval * 1000, 1),
+            "cumulative_percent": round(100 * count / n_samples, 1),
+        }
+        for label, count in cumulative.most_common(n)
+    ]
+
+
+_profiler = None
+_profiler_pid = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> SamplingProfiler:
+    # one profiler (and sampling thread) per gunicorn worker
+    global _profiler, _profiler_pid
+    with _profiler_lock:
+        if _profiler is None or _profiler_pid != os.getpid():
+            _profiler = SamplingProfiler(PROFILER_INTERVAL / 1000, PROFILER_HISTORY)
+            _profiler_pid = os.getpid()
+        return _profiler
+
+
+def _before_request():
+    if request.blueprint is not None and request.blueprint.endswith("profiler"):
+        return
+    g.profile = get_profiler().start(f"{request.method} {request.path}")
+
+
+def _after_request(response):
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+    if not request.headers.get(PROFILE_HEADER):
+        # (stopped once the response was sent, i.e. including streamed responses)
+        response.call_on_close(lambda: get_profiler().stop(profile))
+        return response
+    if response.is_streamed:
+        # produce (and discard) the whole body so that it is profiled too
+        for _ in response.response:
+            pass
+    response.close()
+    get_profiler().stop(profile)
+    collapsed = Response(profile.collapsed(), mimetype="text/plain")
+    collapsed.headers[PROFILED_STATUS_HEADER] = str(response.status_code)
+    return collapsed
+
+
+def init_profiler(app: Flask):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -14,9 +14,13 @@ from config import (
     MAX_RING_DEFAULT,
     MAX_RING_LOWER_BOUND,
     MAX_RING_UPPER_BOUND,
+    PAGE_LIMIT_DEFAULT,
+    PAGE_LIMIT_MAX,
 )
 from flask import abort
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+
 
 def _method_not_supported(request):
     return abort(405, f"Method {request.method} not supported")
@@ -53,6 +57,45 @@ def get_required_param(request, param_name: str, type):
     return val
 
 
+def get_bool_param(request, param_name: str, default_val: bool = False) -> bool:
+    val = get_param(request, param_name, type=str, default_val=default_val)
+    if isinstance(val, bool):
+        return val
+    if isinstance(val, int) and val in (0, 1):
+        # JSON 0/1
+        return bool(val)
+    if isinstance(val, str) and val.lower() in ("true", "1"):
+        return True
+    if isinstance(val, str) and val.lower() in ("false", "0"):
+        return False
+    return abort(
+        400,
+        f"Invalid {param_name} provided. Expected true/false but got: {val}",
+    )
+
+
+def get_choice_param(
+    request, param_name: str, choices: list[str], default_val: str
+) -> str:
+    val = get_param(request, param_name, type=str, default_val=default_val)
+    if val not in choices:
+        return abort(
+            400,
+            f"Invalid {param_name} provided, select from: {','.join(choices)}",
+        )
+    return val
+
+
+def wants_ndjson(request) -> bool:
+    """True if NDJSON output was requested (stream=true or Accept: application/x-ndjson)."""
+    if get_bool_param(request, "stream"):
+        return True
+    best_match = request.accept_mimetypes.best_match(
+        ["application/json", NDJSON_MIMETYPE]
+    )
+    return best_match == NDJSON_MIMETYPE
+
+
 def int_check(
     request,
     var_name: str,
@@ -86,6 +129,19 @@ def get_max_rings(request):
     return max_rings
 
 
+def get_page_params(request, cursor_name: str) -> Union[None, tuple[int, int]]:
+    """
+    (after, limit) of the requested page for keyset pagination, where after is the value of
+    cursor_name (e.g., "after_cid": only return rows with a greater CID). None if neither
+    limit nor cursor_name were given (i.e., return all rows).
+    """
+    if not (param_given(request, "limit") or param_given(request, cursor_name)):
+        return None
+    limit = int_check(request, "limit", 1, PAGE_LIMIT_MAX, PAGE_LIMIT_DEFAULT)
+    after = int_check(request, cursor_name, 0, None, 0)
+    return after, limit
+
+
 def get_database(
     request,
     default_val: str = DEFAULT_DB,
@@ -0,0 +1,227 @@
+"""
+Description:
+Cache for the per-molecule results of compound_search (scaffolds + their info from the DB),
+keyed by (input SMILES, max_rings, database).
+Entries are tagged with the version of the database they were computed from, so results
+from an older release are never returned (and are dropped once a new version is seen).
+
+Backends (RESULT_CACHE_BACKEND in config.py):
+- "memory": LRU cache in each gunicorn worker
+- "sqlite": SQLite file shared by all workers (and containers mounting the same volume),
+  put RESULT_CACHE_PATH under /dev/shm to keep it in shared memory
+- "none": disabled
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import (
+    DB_VERSION_CHECK_INTERVAL,
+    RESULT_CACHE_BACKEND,
+    RESULT_CACHE_PATH,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL,
+)
+from database.badapple import BadAppleSession
+from database.snapshot import get_scaffold_snapshot
+from utils.cache import LRUCache
+
+_MISSING = object()
+
+
+class MemoryResultCache:
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL):
+        self._cache = LRUCache(maxsize, ttl=ttl)
+
+    def get_many(self, db_name: str, db_version: str, keys: list) -> dict:
+        result = {}
+        for key in keys:
+            value = self._cache.get((db_name, db_version, key), _MISSING)
+            if value is not _MISSING:
+                result[key] = value
+        return result
+
+    def put_many(self, db_name: str, db_version: str, items: dict):
+        for key, value in items.items():
+            self._cache.put((db_name, db_version, key), value)
+
+    def invalidate(self, db_name: str, db_version: str):
+        # version is part of the key, so older entries can never be hit again,
+        # drop them now rather than waiting for them to be evicted
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+class SQLiteResultCache:
+    """
+    Result cache stored in a SQLite database (WAL mode), safe to share between processes.
+    Each thread of each process uses its own connection.
+    """
+
+    # only check the size of the cache (and evict) every PRUNE_INTERVAL puts
+    PRUNE_INTERVAL = 100
+
+    def __init__(
+        self,
+        path: str = RESULT_CACHE_PATH,
+        maxsize: int = RESULT_CACHE_SIZE,
+        ttl: float = RESULT_CACHE_TTL,
+    ):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._n_puts = 0
+        self._local = threading.local()
+        with self._get_connection() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS result_cache (
+                db_name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                db_version TEXT NOT NULL,
+                value TEXT,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (db_name, key)
+                )"""
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS result_cache_expires_at ON result_cache (expires_at)"
+            )
+
+    def _get_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _to_str(key) -> str:
+        return json.dumps(key)
+
+    def get_many(self, db_name: str, db_version: str, keys: list) -> dict:
+        result = {}
+        if len(keys) < 1:
+            return result
+        str2key = {self._to_str(key): key for key in keys}
+        str_keys = list(str2key.keys())
+        conn = self._get_connection()
+        now = time.time()
+        # stay below SQLite's limit on the number of variables in a query
+        chunk_size = 500
+        for i in range(0, len(str_keys), chunk_size):
+            chunk = str_keys[i : i + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, value FROM result_cache WHERE db_name = ? AND db_version = ? AND expires_at > ? AND key IN ({placeholders})",
+                [db_name, db_version, now] + chunk,
+            ).fetchall()
+            for str_key, value in rows:
+                result[str2key[str_key]] = json.loads(value)
+        self.hits += len(result)
+        self.misses += len(str2key) - len(result)
+        return result
+
+    def put_many(self, db_name: str, db_version: str, items: dict):
+        if self.maxsize <= 0 or len(items) < 1:
+            return
+        expires_at = time.time() + self.ttl if self.ttl > 0 else float("inf")
+        rows = [
+            (db_name, self._to_str(key), db_version, json.dumps(value), expires_at)
+            for key, value in items.items()
+        ]
+        with self._get_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO result_cache (db_name, key, db_version, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        self._n_puts += 1
+        if self._n_puts % self.PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def prune(self):
+        """Remove expired entries, then the entries closest to expiring if over maxsize."""
+        with self._get_connection() as conn:
+            conn.execute(
+                "DELETE FROM result_cache WHERE expires_at <= ?", [time.time()]
+            )
+            (size,) = conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()
+            if size > self.maxsize:
+                conn.execute(
+                    "DELETE FROM result_cache WHERE rowid IN (SELECT rowid FROM result_cache ORDER BY expires_at LIMIT ?)",
+                    [size - self.maxsize],
+                )
+
+    def invalidate(self, db_name: str, db_version: str):
+        with self._get_connection() as conn:
+            conn.execute(
+                "DELETE FROM result_cache WHERE db_name = ? AND db_version != ?",
+                [db_name, db_version],
+            )
+
+    def stats(self) -> dict:
+        (size,) = (
+            self._get_connection()
+            .execute("SELECT COUNT(*) FROM result_cache")
+            .fetchone()
+        )
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+_db_versions = {}  # db_name -> (version, time it was fetched)
+
+
+def get_result_cache():
+    """Result cache configured by RESULT_CACHE_BACKEND (None if disabled)."""
+    global _result_cache
+    if RESULT_CACHE_BACKEND == "none":
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            if RESULT_CACHE_BACKEND == "memory":
+                _result_cache = MemoryResultCache()
+            elif RESULT_CACHE_BACKEND == "sqlite":
+                _result_cache = SQLiteResultCache()
+            else:
+                raise ValueError(
+                    f"Unrecognized RESULT_CACHE_BACKEND: {RESULT_CACHE_BACKEND}"
+                )
+        return _result_cache
+
+
+def get_db_version(db_name: str) -> str:
+    """
+    Version of the given database (see BadAppleSession.get_db_version).
+    Re-checked at most every DB_VERSION_CHECK_INTERVAL seconds, when it changes
+    entries computed from the previous version are dropped from the result cache.
+    """
+    snapshot = get_scaffold_snapshot(db_name)
+    if snapshot is not None:
+        # scaffold info is served from the snapshot, so results depend on its version
+        return snapshot.db_version
+    version, fetched_at = _db_versions.get(db_name, (None, 0))
+    if time.monotonic() - fetched_at > DB_VERSION_CHECK_INTERVAL:
+        with BadAppleSession(db_name) as db_session:
+            new_version = db_session.get_db_version()
+        _db_versions[db_name] = (new_version, time.monotonic())
+        cache = get_result_cache()
+        if version != new_version and cache is not None:
+            cache.invalidate(db_name, new_version)
+        version = new_version
+    return version
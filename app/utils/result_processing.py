@@ -5,6 +5,12 @@ Description:
 Utils to help process results from SQL queries before jsonify.
 """
 
+from typing import Optional, Sequence
+
+from flask import Response, jsonify
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 
 def process_singleton_list(result: list) -> dict:
     # for endpoints where we know the result is a list of length 1
@@ -13,3 +19,30 @@ def process_singleton_list(result: list) -> dict:
     else:
         result = None
     return result
+
+
+def paginated_response(
+    result: list, limit: int, cursor_key: Optional[str] = None
+) -> Response:
+    """
+    JSON response for a page of results (sorted by their cursor: item[cursor_key], or the
+    item itself if cursor_key is None). If the page is full there may be more results, so
+    the cursor of the next page (that of the last result) is given in the X-Next-Cursor header.
+    """
+    response = jsonify(result)
+    if len(result) == limit:
+        last = result[-1]
+        next_cursor = last if cursor_key is None else last[cursor_key]
+        response.headers[NEXT_CURSOR_HEADER] = str(next_cursor)
+    return response
+
+
+def run_length_encode(values: Sequence) -> list[list]:
+    """Runs of equal consecutive values as [value, run length] pairs, e.g. [1, 1, 2] -> [[1, 2], [2, 1]]."""
+    runs = []
+    for value in values:
+        if len(runs) > 0 and runs[-1][0] == value:
+            runs[-1][1] += 1
+        else:
+            runs.append([value, 1])
+    return runs
@@ -0,0 +1,198 @@
+"""
+Description:
+Process pool for generating scaffolds (HierS) for many molecules in parallel.
+Inputs are split into chunks which are fanned out across worker processes,
+results are returned in the same order as the input SMILES.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import (
+    SCAFFOLD_ENGINE_CHUNK_SIZE,
+    SCAFFOLD_ENGINE_MAX_PENDING,
+    SCAFFOLD_ENGINE_QUEUE_TIMEOUT,
+    SCAFFOLD_ENGINE_WORKERS,
+)
+from flask import abort
+from utils.metrics import SCAFFOLD_GENERATION_LATENCY
+from utils.process_scaffolds import (
+    get_hierarchy_cache,
+    get_scaffolds_single_mol,
+    iter_scaffolds_batch,
+)
+from utils.tracing import span
+
+
+def _init_worker():
+    # import RDKit + ScaffoldGraph (and warm them up) once per worker process,
+    # rather than paying for it on the first chunk of every request
+    get_scaffolds_single_mol("c1ccc(CC2CCNCC2)cc1", name="", max_rings=1)
+
+
+def get_scaffolds_chunk(
+    smiles_list: list[str], max_rings: int
+) -> tuple[list[dict], list[float]]:
+    """
+    Scaffolds for each SMILES in smiles_list (see iter_scaffolds_batch), along with the time
+    (seconds) it took to generate them for each SMILES.
+    """
+    result, durations = [], []
+    molecules = iter_scaffolds_batch(smiles_list, max_rings)
+    while True:
+        start = time.perf_counter()
+        scaffolds = next(molecules, None)
+        if scaffolds is None:
+            break
+        durations.append(time.perf_counter() - start)
+        result.append(scaffolds)
+    return result, durations
+
+
+def _get_scaffolds_chunk_in_worker(smiles_list: list[str], max_rings: int):
+    # also report the state of this worker's hierarchy cache so the engine can aggregate it
+    result, durations = get_scaffolds_chunk(smiles_list, max_rings)
+    return os.getpid(), result, durations, get_hierarchy_cache().stats()
+
+
+class ScaffoldEngine:
+    """
+    Generate scaffolds for a list of SMILES using a pool of worker processes.
+
+    n_workers <= 0 disables the pool (scaffolds are generated in the calling thread).
+    max_pending bounds the number of chunks queued/running at once across all requests
+    handled by this process, requests that cannot enqueue a chunk within queue_timeout
+    seconds are rejected (503) rather than oversubscribing the machine.
+    """
+
+    def __init__(
+        self,
+        n_workers: int = SCAFFOLD_ENGINE_WORKERS,
+        chunk_size: int = SCAFFOLD_ENGINE_CHUNK_SIZE,
+        max_pending: int = SCAFFOLD_ENGINE_MAX_PENDING,
+        queue_timeout: float = SCAFFOLD_ENGINE_QUEUE_TIMEOUT,
+    ):
+        self.n_workers = n_workers
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._n_pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._worker_cache_stats = {}  # worker PID -> latest hierarchy cache stats
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # "spawn" so that workers don't inherit DB connections/threads of the gunicorn worker
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.n_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._worker_cache_stats = {}
+
+    def _release_slot(self, _future):
+        with self._lock:
+            self._n_pending -= 1
+        self._slots.release()
+
+    @property
+    def n_pending(self) -> int:
+        return self._n_pending
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.n_workers,
+            "pending_chunks": self._n_pending,
+            "max_pending_chunks": self.max_pending,
+        }
+
+    def hierarchy_cache_stats(self) -> dict:
+        """Hierarchy cache stats summed over this process and its worker processes."""
+        all_stats = [get_hierarchy_cache().stats()]
+        all_stats.extend(self._worker_cache_stats.values())
+        return {
+            key: sum(stats[key] for stats in all_stats)
+            for key in ["size", "maxsize", "hits", "misses"]
+        }
+
+    def get_scaffolds(self, smiles_list: list[str], max_rings: int) -> list[dict]:
+        """Scaffolds for each SMILES in smiles_list, in input order (see get_scaffolds_batch)."""
+        if len(smiles_list) == 0:
+            return []
+        with span("hiers", n_molecules=len(smiles_list)):
+            result, durations = self._get_scaffolds(smiles_list, max_rings)
+        # (observed here rather than in the worker processes, which have their own registry)
+        for duration in durations:
+            SCAFFOLD_GENERATION_LATENCY.observe(duration)
+        return result
+
+    def _get_scaffolds(
+        self, smiles_list: list[str], max_rings: int
+    ) -> tuple[list[dict], list[float]]:
+        if self.n_workers <= 0 or len(smiles_list) <= self.chunk_size:
+            # not worth the IPC overhead
+            return get_scaffolds_chunk(smiles_list, max_rings)
+
+        executor = self._get_executor()
+        futures = []
+        try:
+            for i in range(0, len(smiles_list), self.chunk_size):
+                if not self._slots.acquire(timeout=self.queue_timeout):
+                    return abort(503, "Server busy, please try again later")
+                with self._lock:
+                    self._n_pending += 1
+                try:
+                    future = executor.submit(
+                        _get_scaffolds_chunk_in_worker,
+                        smiles_list[i : i + self.chunk_size],
+                        max_rings,
+                    )
+                except BaseException:
+                    self._release_slot(None)
+                    raise
+                future.add_done_callback(self._release_slot)
+                futures.append(future)
+
+            result, durations = [], []
+            for future in futures:
+                worker_pid, chunk_result, chunk_durations, cache_stats = future.result()
+                self._worker_cache_stats[worker_pid] = cache_stats
+                result.extend(chunk_result)
+                durations.extend(chunk_durations)
+            return result, durations
+        except BrokenProcessPool:
+            # a worker died (e.g., OOM), start a fresh pool for the next request
+            self._reset_executor()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def get_scaffold_engine() -> ScaffoldEngine:
+    # one engine per gunicorn worker (created lazily so it's never forked with --preload)
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is None or _engine_pid != os.getpid():
+            _engine = ScaffoldEngine()
+            _engine_pid = os.getpid()
+        return _engine
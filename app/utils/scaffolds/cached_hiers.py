@@ -0,0 +1,162 @@
+"""
+Description:
+CustomHierS variant which reuses previously computed scaffold hierarchies
+and memoizes SMILES canonicalization.
+Kept separate from hiers.py, which should match generate_scaffolds.py in Badapple2.
+"""
+
+from functools import lru_cache
+
+from config import CANON_SMILES_CACHE_SIZE
+from rdkit import Chem
+from scaffoldgraph.core.fragment import get_murcko_scaffold
+from utils.cache import LRUCache
+from utils.scaffolds.hiers import CustomHierS, canon_smiles
+
+
+@lru_cache(maxsize=CANON_SMILES_CACHE_SIZE)
+def _recanonicalize_smiles(smiles: str, kekule: bool):
+    # second pass of canon_smiles (SMILES -> Mol -> SMILES), which only depends on the
+    # first-pass SMILES, None if it fails (canon_smiles then falls back to the original SMILES)
+    try:
+        return Chem.MolToSmiles(
+            Chem.MolFromSmiles(smiles), canonical=True, kekuleSmiles=kekule
+        )
+    except:
+        return None
+
+
+def memoized_canon_smiles(mol: Chem.Mol, kekule=False):
+    """
+    Same output as canon_smiles in hiers.py, but the expensive re-parse of the first-pass SMILES
+    is only done once per distinct string. ScaffoldGraph hashes the same scaffolds many times
+    (e.g., for every "parent in self.nodes" check), so most calls are cache hits.
+    """
+    try:
+        smiles = Chem.MolToSmiles(mol, canonical=True, kekuleSmiles=kekule)
+    except:
+        return canon_smiles(mol, kekule=kekule)
+    result = _recanonicalize_smiles(smiles, kekule)
+    if result is None:
+        # rare edge case, defer to canon_smiles so the fallback is identical
+        return canon_smiles(mol, kekule=kekule)
+    return result
+
+
+def atom_order_key(mol: Chem.Mol) -> tuple:
+    """
+    The atoms and bonds of mol in index order. The order in which a scaffold's parents are
+    fragmented (and so the traversal order of a molecule's scaffolds) depends on the atom
+    ordering of the scaffold, not just on its canonical identifier.
+    """
+    atoms = tuple(
+        (
+            atom.GetAtomicNum(),
+            atom.GetFormalCharge(),
+            atom.GetIsAromatic(),
+            atom.GetNumExplicitHs(),
+            atom.GetNoImplicit(),
+            atom.GetNumRadicalElectrons(),
+            atom.GetIsotope(),
+            int(atom.GetChiralTag()),
+        )
+        for atom in mol.GetAtoms()
+    )
+    bonds = tuple(
+        (
+            bond.GetBeginAtomIdx(),
+            bond.GetEndAtomIdx(),
+            int(bond.GetBondType()),
+            int(bond.GetStereo()),
+        )
+        for bond in mol.GetBonds()
+    )
+    return atoms, bonds
+
+
+def get_canon_smiles_cache_stats() -> dict:
+    info = _recanonicalize_smiles.cache_info()
+    return {
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hits": info.hits,
+        "misses": info.misses,
+    }
+
+
+class MemoizedFragmenter:
+    """
+    Wraps a scaffoldgraph Fragmenter so that each distinct scaffold is only fragmented once.
+    Parents are keyed by atom_order_key (rather than the canonical identifier), since the
+    order of the parents depends on the atom ordering of the fragmented scaffold.
+    """
+
+    def __init__(self, fragmenter, cache: dict):
+        self.fragmenter = fragmenter
+        self.cache = cache
+
+    def fragment(self, scaffold):
+        key = atom_order_key(scaffold.mol)
+        parents = self.cache.get(key)
+        if parents is None:
+            parents = list(self.fragmenter.fragment(scaffold))
+            self.cache[key] = parents
+        return parents
+
+
+class CachedHierS(CustomHierS):
+    """
+    The set of parent scaffolds of a scaffold only depends on the scaffold itself, so once the
+    hierarchy of a top-level (Murcko) scaffold has been computed it can be reused for any other
+    molecule with the same top-level scaffold.
+
+    SMILES identifiers are computed with memoized_canon_smiles (same output as canon_smiles).
+
+    hierarchy_cache maps the atom_order_key of a top-level scaffold to its (valid) scaffolds, in
+    traversal order. Keying by canonical SMILES would hit more often, but some of these hits
+    would return the scaffolds in a different order (see benchmark/bench_hierarchy_cache.py). Molecules with a cached top-level scaffold are added to the graph without any
+    scaffold nodes (their scaffolds are stored in cached_scaffolds instead), all other molecules
+    are processed as usual and the key of their top-level scaffold is recorded in
+    top_level_scaffolds so that the caller can fill the cache.
+
+    If given, fragment_cache is shared with other graphs (see MemoizedFragmenter), e.g. for the
+    molecules of a batch, each of which needs its own graph for its scaffolds to be traversed
+    in the same order as when it is processed on its own.
+    """
+
+    def __init__(
+        self,
+        *args,
+        hierarchy_cache: LRUCache = None,
+        fragment_cache: dict = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        if hierarchy_cache is None:
+            hierarchy_cache = LRUCache(0)
+        self.hierarchy_cache = hierarchy_cache
+        self.cached_scaffolds = {}  # molecule name -> scaffolds from hierarchy_cache
+        # molecule name -> atom_order_key of top-level scaffold
+        self.top_level_scaffolds = {}
+        if fragment_cache is not None:
+            self.fragmenter = MemoizedFragmenter(self.fragmenter, fragment_cache)
+        if self.identifier_type == "canon_smiles":
+            self.hash_func = memoized_canon_smiles
+        elif self.identifier_type == "kekule_smiles":
+            self.hash_func = lambda mol: memoized_canon_smiles(mol, kekule=True)
+
+    def _initialize_scaffold(self, molecule: Chem.Mol, init_args: dict):
+        scaffold_rdmol = get_murcko_scaffold(molecule)
+        if scaffold_rdmol.GetNumAtoms() > 0:
+            scaffold_rdmol = self._preprocess_scaffold(scaffold_rdmol, init_args)
+            scaffold_key = atom_order_key(scaffold_rdmol)
+            name = molecule.GetProp("_Name")
+            scaffolds = self.hierarchy_cache.get(scaffold_key)
+            if scaffolds is not None:
+                # hierarchy already known: skip fragmentation entirely
+                # (no scaffold nodes are added, so other molecules in the graph are unaffected)
+                self.add_molecule_node(molecule)
+                self.cached_scaffolds[name] = scaffolds
+                return None
+            self.top_level_scaffolds[name] = scaffold_key
+        return super()._initialize_scaffold(molecule, init_args)
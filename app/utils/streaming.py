@@ -0,0 +1,50 @@
+"""
+Description:
+Helpers for streaming responses, so that large results are sent to the client as they are
+produced instead of being built in memory and serialized at the end.
+"""
+
+from typing import Callable, Iterable, Iterator
+
+import psycopg2
+from database.badapple import BadAppleSession
+from flask import Response, current_app, stream_with_context
+from loguru import logger
+from utils.request_processing import NDJSON_MIMETYPE
+from werkzeug.exceptions import HTTPException
+
+
+def ndjson_response(items: Iterable) -> Response:
+    """
+    Stream items as newline-delimited JSON (one JSON value per line).
+    The status code is sent before the first item is produced, so errors raised while
+    streaming (e.g., server busy, or a failed query) are reported as a final
+    {"error_msg": ...} line.
+    """
+
+    def generate():
+        try:
+            for item in items:
+                yield current_app.json.dumps(item) + "\n"
+        except HTTPException as e:
+            yield current_app.json.dumps({"error_msg": e.description}) + "\n"
+        except psycopg2.Error as e:
+            logger.error(f"Query failed while streaming: {e}")
+            error_msg = "Database error, please try again later"
+            yield current_app.json.dumps({"error_msg": error_msg}) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    # ask reverse proxies (e.g., nginx) not to buffer the whole response
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def iter_session_rows(
+    db_name: str, query: Callable[[BadAppleSession], Iterator[dict]]
+) -> Iterator[dict]:
+    """
+    Yield the rows of query(db_session) (e.g., BadAppleSession.iter_associated_compounds),
+    keeping the session open until all rows were sent (or the client disconnected).
+    """
+    with BadAppleSession(db_name) as db_session:
+        yield from query(db_session)
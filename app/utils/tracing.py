@@ -0,0 +1,242 @@
+"""
+Description:
+Lightweight request tracing. Each request is a trace whose spans time the stages of handling it
+(e.g., "parse" of the request params, "hiers" scaffold generation, "db" queries and "serialize"
+of the response), see span(). The total time per stage is sent to the client in the
+Server-Timing response header, so latency can be attributed without access to the server.
+
+Finished traces are exported in the OpenTelemetry (OTLP) JSON format, one
+ExportTraceServiceRequest per line, to stdout or a file (TRACING_EXPORTER), which the
+OpenTelemetry collector can read (otlpjsonfile receiver). An incoming W3C traceparent header is
+continued, so the spans can be joined with those of the client.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from config import TRACING_EXPORT_PATH, TRACING_EXPORTER
+from database.statements import BoundStatement, add_query_hook
+from flask import Flask, g, request
+
+SERVICE_NAME = "badapple2-api"
+# OTLP span kinds
+_SPAN_KIND_INTERNAL = 1
+_SPAN_KIND_SERVER = 2
+
+_TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "kind", "start", "end", "attributes")
+
+    def __init__(
+        self,
+        name: str,
+        parent_id: Optional[str],
+        attributes: dict,
+        kind: int = _SPAN_KIND_INTERNAL,
+    ):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.time_ns()
+        return (end - self.start) / 1e6
+
+    def as_otlp(self, trace_id: str) -> dict:
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """Spans of one request, the root span is the request itself."""
+
+    def __init__(self, root_name: str, traceparent: Optional[str] = None):
+        match = _TRACEPARENT_PATTERN.match(traceparent or "")
+        if match is not None:
+            self.trace_id, parent_id = match.groups()
+        else:
+            self.trace_id, parent_id = os.urandom(16).hex(), None
+        self.root = Span(root_name, parent_id, {}, kind=_SPAN_KIND_SERVER)
+        self.spans = []  # finished spans (except the root)
+
+    def stage_durations(self) -> dict[str, float]:
+        """Total duration (ms) of the finished spans per name, in order of first occurrence."""
+        durations = {}
+        for span in self.spans:
+            durations[span.name] = durations.get(span.name, 0) + span.duration_ms
+        return durations
+
+    def as_otlp(self) -> dict:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": _otlp_value(SERVICE_NAME),
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [
+                                span.as_otlp(self.trace_id)
+                                for span in [self.root, *self.spans]
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# (context variables rather than flask.g, so spans also work in streamed responses)
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the enclosed block as a span of the current request (no-op outside of a trace)."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get() or trace.root
+    current = Span(name, parent.span_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.time_ns()
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+
+def record_span(name: str, duration: float, **attributes):
+    """Add a span which ended now and took duration seconds to the current trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get() or trace.root
+    finished = Span(name, parent.span_id, attributes)
+    finished.end = time.time_ns()
+    finished.start = finished.end - int(duration * 1e9)
+    trace.spans.append(finished)
+
+
+def _trace_query(connection, query: BoundStatement, elapsed: float, n_rows: int):
+    # query hook (see database/statements.py)
+    record_span(
+        "db",
+        elapsed,
+        **{
+            "db.name": connection.info.dbname,
+            "db.statement.name": query.statement.name,
+            "db.rows": n_rows,
+        },
+    )
+
+
+_export_lock = threading.Lock()
+
+
+def export_trace(trace: Trace):
+    if TRACING_EXPORTER == "none":
+        return
+    line = json.dumps(trace.as_otlp(), separators=(",", ":")) + "\n"
+    with _export_lock:
+        if TRACING_EXPORTER == "stdout":
+            sys.stdout.write(line)
+            sys.stdout.flush()
+        else:
+            with open(TRACING_EXPORT_PATH, "a") as file:
+                file.write(line)
+
+
+def _server_timing(trace: Trace) -> str:
+    metrics = [
+        f"{name};dur={duration:.1f}"
+        for name, duration in trace.stage_durations().items()
+    ]
+    # (time until the headers were sent, streamed responses take longer)
+    metrics.append(f"total;dur={trace.root.duration_ms:.1f}")
+    return ", ".join(metrics)
+
+
+def _before_request():
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    trace = Trace(f"{request.method} {route}", request.headers.get("traceparent"))
+    trace.root.attributes.update({"http.method": request.method, "http.route": route})
+    _current_trace.set(trace)
+    _current_span.set(None)
+    g.trace = trace
+
+
+def _after_request(response):
+    trace = g.pop("trace", None)
+    if trace is None:
+        return response
+    response.headers["Server-Timing"] = _server_timing(trace)
+    # (lets browsers expose the timings to scripts of other origins)
+    response.headers["Timing-Allow-Origin"] = "*"
+    trace.root.attributes["http.status_code"] = response.status_code
+
+    def finish():
+        trace.root.end = time.time_ns()
+        _current_trace.set(None)
+        _current_span.set(None)
+        export_trace(trace)
+
+    # (once the response was sent, i.e. including the spans of streamed responses)
+    response.call_on_close(finish)
+    return response
+
+
+def init_tracing(app: Flask):
+    if TRACING_EXPORTER == "file":
+        os.makedirs(
+            os.path.dirname(os.path.abspath(TRACING_EXPORT_PATH)), exist_ok=True
+        )
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    add_query_hook(_trace_query)
@@ -0,0 +1,115 @@
+"""
+Description:
+Microbenchmark for the memoized SMILES canonicalization used by the API (CachedHierS)
+versus canon_smiles in hiers.py (MolToSmiles -> MolFromSmiles -> MolToSmiles on every call).
+Scaffold networks are built without the hierarchy cache so that only the effect of
+memoization is measured. In batch mode, fragmentation is shared between the networks of the
+molecules for both variants (as in get_scaffolds_batch).
+
+Usage (from the benchmark directory, with the variables of app/.env loaded, e.g. `set -a; source ../app/.env`):
+    python bench_canon_smiles.py --input_tsv ../example_scripts/data/example_input.tsv
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from utils.cache import LRUCache  # noqa: E402
+from utils.scaffolds import cached_hiers  # noqa: E402
+from utils.scaffolds.hiers import CustomHierS  # noqa: E402
+
+
+class FragmentCachedHierS(CustomHierS):
+    """CustomHierS (canon_smiles) with the fragment_cache of CachedHierS."""
+
+    def __init__(self, *args, fragment_cache: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fragment_cache is not None:
+            self.fragmenter = cached_hiers.MemoizedFragmenter(
+                self.fragmenter, fragment_cache
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--input_tsv",
+        type=str,
+        default=str(
+            Path(__file__).resolve().parents[1]
+            / "example_scripts"
+            / "data"
+            / "example_input.tsv"
+        ),
+    )
+    parser.add_argument("--smiles_column", type=str, default="canonical_smiles")
+    parser.add_argument("--max_rings", type=int, default=5)
+    parser.add_argument("--n_repeats", type=int, default=3)
+    return parser.parse_args()
+
+
+def build_network(network_class, df: pd.DataFrame, max_rings: int, **kwargs):
+    return network_class.from_dataframe(df, ring_cutoff=max_rings, **kwargs)
+
+
+def main():
+    args = parse_args()
+    df = pd.read_csv(args.input_tsv, sep="\t")
+    df = pd.DataFrame(
+        {"Smiles": df[args.smiles_column], "Name": [str(i) for i in range(len(df))]}
+    )
+    n_mols = len(df)
+
+    # one network per molecule, as in get_scaffolds_single_mol and get_scaffolds_batch (which
+    # also shares fragmentation between the molecules of the batch through a fragment_cache),
+    # memoization persists across networks within a process
+    sub_dfs = [df.iloc[[i]] for i in range(n_mols)]
+    for mode, share_fragments in [("per molecule", False), ("batch", True)]:
+        results = {}
+        for label, network_class, kwargs in [
+            ("canon_smiles", FragmentCachedHierS, {}),
+            (
+                "memoized_canon_smiles",
+                cached_hiers.CachedHierS,
+                {"hierarchy_cache": LRUCache(0)},
+            ),
+        ]:
+            total = 0.0
+            nodes = []
+            for _ in range(args.n_repeats):
+                cached_hiers._recanonicalize_smiles.cache_clear()
+                fragment_cache = {} if share_fragments else None
+                start = time.perf_counter()
+                networks = [
+                    build_network(
+                        network_class,
+                        sub_df,
+                        args.max_rings,
+                        fragment_cache=fragment_cache,
+                        **kwargs,
+                    )
+                    for sub_df in sub_dfs
+                ]
+                elapsed = time.perf_counter() - start
+                total = elapsed if total == 0.0 else min(total, elapsed)
+                nodes = [sorted(network.nodes) for network in networks]
+            results[label] = (total, nodes)
+            print(
+                f"[{mode}] {label}: {total:.2f}s total, {1000 * total / n_mols:.2f} ms/molecule"
+            )
+        assert results["canon_smiles"][1] == results["memoized_canon_smiles"][1]
+        saving = results["canon_smiles"][0] - results["memoized_canon_smiles"][0]
+        print(
+            f"[{mode}] saving: {1000 * saving / n_mols:.2f} ms/molecule "
+            f"({100 * saving / results['canon_smiles'][0]:.1f}%), identical output"
+        )
+    print(f"canonicalization cache: {cached_hiers.get_canon_smiles_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
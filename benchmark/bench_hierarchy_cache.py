@@ -0,0 +1,87 @@
+"""
+Description:
+Hit rate of the scaffold hierarchy cache (CachedHierS) when keyed by the atom ordering of
+the top-level scaffold (atom_order_key, as in the API) versus by its canonical SMILES.
+A canonical SMILES hit only returns the right answer if the cached scaffolds are in the same
+order as computing them for the molecule would give, the script counts the hits for which
+that is not the case.
+
+Usage (from the benchmark directory, with the variables of app/.env loaded, e.g. `set -a; source ../app/.env`):
+    python bench_hierarchy_cache.py --input_tsv ../example_scripts/data/example_input.tsv
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from utils.cache import LRUCache  # noqa: E402
+from utils.process_scaffolds import get_mol2scaf_dict  # noqa: E402
+from utils.scaffolds.cached_hiers import CachedHierS  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--input_tsv",
+        type=str,
+        default=str(
+            Path(__file__).resolve().parents[1]
+            / "example_scripts"
+            / "data"
+            / "example_input.tsv"
+        ),
+    )
+    parser.add_argument("--smiles_column", type=str, default="canonical_smiles")
+    parser.add_argument("--max_rings", type=int, default=5)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.remove()  # molecules without a top-level scaffold are logged at INFO level
+    df = pd.read_csv(args.input_tsv, sep="\t")
+    n_scaffolds = 0
+    atom_order_cache, atom_order_hits = {}, 0
+    canon_cache, canon_hits, canon_misordered = {}, 0, 0
+    for i, smiles in enumerate(df[args.smiles_column]):
+        name = str(i)
+        # hierarchy cache disabled: every molecule's scaffolds are computed
+        network = CachedHierS.from_dataframe(
+            pd.DataFrame({"Smiles": [smiles], "Name": [name]}),
+            ring_cutoff=args.max_rings,
+            hierarchy_cache=LRUCache(0),
+        )
+        if name not in network.top_level_scaffolds:
+            continue
+        n_scaffolds += 1
+        scaffolds = tuple(list(get_mol2scaf_dict(network).values())[0])
+        atom_order_key = network.top_level_scaffolds[name]
+        if atom_order_key in atom_order_cache:
+            atom_order_hits += 1
+        else:
+            atom_order_cache[atom_order_key] = scaffolds
+        canon_key = next(iter(network.predecessors(name)))
+        if canon_key in canon_cache:
+            canon_hits += 1
+            canon_misordered += canon_cache[canon_key] != scaffolds
+        else:
+            canon_cache[canon_key] = scaffolds
+    print(f"{len(df)} molecules, {n_scaffolds} with a top-level scaffold")
+    print(
+        f"atom_order_key: {len(atom_order_cache)} entries, {atom_order_hits} hits "
+        f"({100 * atom_order_hits / n_scaffolds:.1f}%)"
+    )
+    print(
+        f"canonical SMILES: {len(canon_cache)} entries, {canon_hits} hits "
+        f"({100 * canon_hits / n_scaffolds:.1f}%), {canon_misordered} of which "
+        f"with the scaffolds in a different order"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Description:
+Microbenchmark for the serialization of JSON responses: Flask's default JSON provider versus
+FastJSONProvider (orjson, see app/utils/json_provider.py). Payloads mimic the largest responses:
+1000 compounds (scaffold_search/get_associated_compounds, RealDictRow results) and the scaffolds
+of 1000 molecules (compound_search/get_associated_scaffolds). No database is needed.
+
+Usage (from the benchmark directory, with orjson installed):
+    python bench_json.py
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.extras import RealDictRow
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from utils.json_provider import FastJSONProvider, orjson  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n_items", type=int, default=1000)
+    parser.add_argument("--n_repeats", type=int, default=200)
+    return parser.parse_args()
+
+
+def _row(**values) -> RealDictRow:
+    row = RealDictRow()
+    row.update(values)
+    return row
+
+
+def compounds_payload(n: int) -> list:
+    return [
+        _row(
+            cid=3216680 + i,
+            cansmi="Cc1ccccc1N(C(=O)Cc1cccs1)C(C(=O)NCC1CCCO1)c1cccnc1",
+            isosmi="CC1=CC=CC=C1N(C(C2=CN=CC=C2)C(=O)NCC3CCCO3)C(=O)CC4=CC=CS4",
+            nass_active=i % 7,
+            nass_tested=649,
+            nsam_active=i % 7,
+            nsam_tested=651,
+            nsub_active=i % 3,
+            nsub_tested=1,
+            nsub_total=2,
+        )
+        for i in range(n)
+    ]
+
+
+def scaffolds_payload(n: int) -> dict:
+    # 3 scaffolds per molecule, as returned by _get_associated_scaffolds_from_list
+    scaffold = dict(
+        id=3,
+        scafsmi="c1ccc2ncccc2c1",
+        kekule_scafsmi="C1=CC=C2N=CC=CC2=C1",
+        ncpd_total=5000,
+        ncpd_tested=4500,
+        ncpd_active=700,
+        nsub_total=6000,
+        nsub_tested=5500,
+        nsub_active=800,
+        nass_tested=900,
+        nass_active=600,
+        nsam_tested=1200000,
+        nsam_active=1300,
+        in_drug=True,
+        pscore=428,
+        prank=215,
+        in_db=True,
+    )
+    return {f"CC(=O)Nc1ccc(O)cc1.{i}": [scaffold] * 3 for i in range(n)}
+
+
+def time_response(provider, payload, n_repeats: int) -> float:
+    """Best time (s) of n_repeats serializations."""
+    best = float("inf")
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        provider.response(payload)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    args = parse_args()
+    if orjson is None:
+        raise SystemExit("Error: orjson is not installed")
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+    print(
+        f"orjson {orjson.__version__}, {args.n_items} items, best of {args.n_repeats}"
+    )
+    print(f"{'payload':<12}{'size':>10}{'json':>12}{'orjson':>12}{'speedup':>10}")
+    for name, payload in [
+        ("compounds", compounds_payload(args.n_items)),
+        ("scaffolds", scaffolds_payload(args.n_items)),
+    ]:
+        body = default_provider.response(payload).get_data()
+        assert fast_provider.response(payload).get_data() == body
+        default_time = time_response(default_provider, payload, args.n_repeats)
+        fast_time = time_response(fast_provider, payload, args.n_repeats)
+        print(
+            f"{name:<12}{len(body) / 1024:>8.0f}KB{default_time * 1000:>10.2f}ms"
+            f"{fast_time * 1000:>10.2f}ms{default_time / fast_time:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()